@@ -0,0 +1,78 @@
+#!/usr/bin/python3 -tt
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Compare summarizing a high rate gauge event with a subscriber that keeps running totals against
+PubPen.aggregate().
+
+The time includes publishing and delivering every value.  The aggregation's windows are long
+enough that none of them close during the run.
+"""
+import argparse
+import asyncio
+import time
+
+from pubmarine import PubPen
+from pubmarine.metrics import DEFAULT_BOUNDS, Histogram
+
+
+class Totals:
+    """The hand written subscriber"""
+    def __init__(self, bounds):
+        self.count = 0
+        self.total = 0.0
+        self.histogram = None if bounds is None else Histogram(bounds)
+
+    def __call__(self, value):
+        self.count += 1
+        self.total += value
+        if self.histogram is not None:
+            self.histogram.observe(value)
+
+
+def summary(summary):
+    pass
+
+
+def subscriber(pubpen, bounds):
+    totals = Totals(bounds)
+    pubpen.subscribe('gauge', totals)
+    return totals
+
+
+def aggregate(pubpen, bounds):
+    return pubpen.aggregate('gauge', summary, window=60, bounds=bounds)
+
+
+def run(build, publishes, bounds):
+    loop = asyncio.new_event_loop()
+    pubpen = PubPen(loop)
+    keep = build(pubpen, bounds)
+
+    start = time.perf_counter()
+    for num in range(publishes):
+        pubpen.publish('gauge', num % 100 / 100)
+    loop.run_until_complete(pubpen.drain())
+    elapsed = time.perf_counter() - start
+    loop.close()
+    del keep
+    return publishes / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--publishes', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for bounds in (None, DEFAULT_BOUNDS):
+        for name, build in (('subscriber', subscriber), ('aggregate', aggregate)):
+            if bounds is not None:
+                name += ' + histogram'
+            rate = max(run(build, args.publishes, bounds) for dummy in range(args.repeat))
+            print('{:25} {:12.0f} publications/s'.format(name, rate))
+
+
+if __name__ == '__main__':
+    main()
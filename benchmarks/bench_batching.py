@@ -0,0 +1,61 @@
+#!/usr/bin/python3 -tt
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Compare a subscriber that is called once per publication with batching subscribers that are
+called with lists of payloads.
+
+The time includes publishing and delivering every value.
+"""
+import argparse
+import asyncio
+import time
+
+from pubmarine import PubPen
+
+
+class Sink:
+    def __init__(self):
+        self.count = 0
+
+    def single(self, value):
+        self.count += 1
+
+    def batch(self, values):
+        self.count += len(values)
+
+
+def run(publishes, batch_size):
+    loop = asyncio.new_event_loop()
+    pubpen = PubPen(loop)
+    sink = Sink()
+    if batch_size is None:
+        pubpen.subscribe('sample', sink.single)
+    else:
+        pubpen.subscribe('sample', sink.batch, batch_size=batch_size, max_delay=0.1)
+
+    start = time.perf_counter()
+    for num in range(publishes):
+        pubpen.publish('sample', num)
+    loop.run_until_complete(pubpen.drain())
+    elapsed = time.perf_counter() - start
+    loop.close()
+    assert sink.count == publishes - (publishes % batch_size if batch_size else 0)
+    return publishes / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--publishes', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for batch_size in (None, 10, 100, 1000):
+        name = 'per publication' if batch_size is None else 'batch_size={}'.format(batch_size)
+        rate = max(run(args.publishes, batch_size) for dummy in range(args.repeat))
+        print('{:20} {:12.0f} publications/s'.format(name, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/python3 -tt
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Compare publishing numeric samples one PubPen.publish() call each with PubPen.publish_array().
+
+Each consumer is run alone: an aggregation with a histogram, a batching subscriber, a batching
+subscriber with a filter that keeps half of the samples, and, for publish_array() only, a
+columnar subscriber with and without the same filter.  NumPy arrays are included if NumPy is
+installed.  The time includes publishing and delivering every sample.
+"""
+import argparse
+import array
+import asyncio
+import time
+
+from pubmarine import PubPen
+from pubmarine.metrics import DEFAULT_BOUNDS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Sink:
+    def __init__(self):
+        self.total = 0
+
+    def batch(self, values):
+        self.total += len(values)
+
+    def columns(self, values):
+        self.total += len(values)
+
+    def summary(self, summary):
+        pass
+
+
+def over_half(value):
+    # Works on a single sample and, as a mask, on a whole NumPy array
+    return value >= 0.05
+
+
+def aggregation(pubpen, sink):
+    return pubpen.aggregate('sample', sink.summary, window=60, bounds=DEFAULT_BOUNDS)
+
+
+def batching(pubpen, sink):
+    return pubpen.subscribe('sample', sink.batch, batch_size=1000)
+
+
+def filtered_batching(pubpen, sink):
+    return pubpen.subscribe('sample', sink.batch, batch_size=1000, where=over_half)
+
+
+def columnar(pubpen, sink):
+    return pubpen.subscribe('sample', sink.columns, columnar=True)
+
+
+def filtered_columnar(pubpen, sink):
+    return pubpen.subscribe('sample', sink.columns, columnar=True, where=over_half)
+
+
+def run(consume, values, chunk, per_sample):
+    loop = asyncio.new_event_loop()
+    pubpen = PubPen(loop)
+    sink = Sink()
+    keep = consume(pubpen, sink)
+
+    start = time.perf_counter()
+    if per_sample:
+        for value in values:
+            pubpen.publish('sample', value)
+    else:
+        for offset in range(0, len(values), chunk):
+            pubpen.publish_array('sample', values[offset:offset + chunk])
+    loop.run_until_complete(pubpen.drain())
+    elapsed = time.perf_counter() - start
+    loop.close()
+    del keep
+    return len(values) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--samples', type=int, default=200000)
+    parser.add_argument('--chunk', type=int, default=10000, help='samples per publish_array()')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    samples = array.array('d', (num % 1000 / 1e4 for num in range(args.samples)))
+    kinds = [('array.array', samples)]
+    if numpy is not None:
+        kinds.append(('numpy', numpy.array(samples)))
+
+    for consumer in (aggregation, batching, filtered_batching, columnar, filtered_columnar):
+        cases = [] if consumer in (columnar, filtered_columnar) else [('publish', samples, True)]
+        cases.extend(('publish_array ' + name, values, False) for name, values in kinds)
+        for name, values, per_sample in cases:
+            rate = max(run(consumer, values, args.chunk, per_sample)
+                       for dummy in range(args.repeat))
+            print('{:17} {:26} {:14.0f} samples/s'.format(consumer.__name__, name, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/python3 -tt
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Measure how long unrelated I/O waits while an event with many subscribers is being delivered.
+
+A byte is written to a socket right after each publication.  The time until the event loop runs
+the socket's reader callback is the I/O latency.  Without chunking it has to wait for every
+delivery of the publication.
+"""
+import argparse
+import asyncio
+import socket
+import statistics
+import time
+
+from pubmarine import PubPen
+
+
+def callback(*args):
+    pass
+
+
+def run(subscribers, publishes, chunk_size=None, time_budget=None):
+    loop = asyncio.new_event_loop()
+    pubpen = PubPen(loop)
+    if chunk_size is not None or time_budget is not None:
+        pubpen.enable_chunked_fanout(chunk_size, time_budget)
+    for dummy in range(subscribers):
+        pubpen.subscribe('tick', callback)
+
+    reader, writer = socket.socketpair()
+    reader.setblocking(False)
+    latencies = []
+    state = {}
+
+    def on_readable():
+        reader.recv(1)
+        latencies.append(time.perf_counter() - state['written'])
+
+    loop.add_reader(reader.fileno(), on_readable)
+
+    async def drive():
+        for num in range(publishes):
+            pubpen.publish('tick', num)
+            state['written'] = time.perf_counter()
+            writer.send(b'x')
+            while len(latencies) <= num or pubpen._fanout_queue:
+                await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    loop.run_until_complete(drive())
+    elapsed = time.perf_counter() - start
+
+    loop.remove_reader(reader.fileno())
+    reader.close()
+    writer.close()
+    loop.close()
+    return statistics.median(latencies), max(latencies), elapsed / (publishes * subscribers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--subscribers', type=int, default=50000)
+    parser.add_argument('--publishes', type=int, default=20)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--time-budget', type=float, default=0.002)
+    args = parser.parse_args()
+
+    print('{:28} {:>14} {:>14} {:>16}'.format('', 'median I/O ms', 'max I/O ms',
+                                             'us/delivery'))
+    cases = (('no chunking', None, None),
+             ('chunk_size={}'.format(args.chunk_size), args.chunk_size, None),
+             ('time_budget={}'.format(args.time_budget), None, args.time_budget))
+    for name, chunk_size, time_budget in cases:
+        median, worst, per_delivery = run(args.subscribers, args.publishes, chunk_size,
+                                          time_budget)
+        print('{:28} {:14.3f} {:14.3f} {:16.3f}'.format(name, median * 1e3, worst * 1e3,
+                                                      per_delivery * 1e6))
+
+
+if __name__ == '__main__':
+    main()
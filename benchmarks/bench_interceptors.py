@@ -0,0 +1,90 @@
+#!/usr/bin/python3 -tt
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Measure what publish and delivery interceptors cost.
+
+Each interceptor passes everything through unchanged so the numbers are the overhead of the
+interceptor machinery and the extra function calls.  The "other event" row adds interceptors for a
+different event.  Events that no interceptor applies to take the same fast path as when there are
+no interceptors at all, so it should cost the same as the "no interceptors" row.
+
+Only the time spent in PubPen.publish() is measured.  The deliveries are queued on a
+QueuedScheduler and run afterwards so event loop noise does not drown out the difference.
+"""
+import argparse
+import gc
+import time
+
+from pubmarine import PubPen
+from pubmarine.schedulers import QueuedScheduler
+
+
+def callback(*args):
+    pass
+
+
+def publish_passthrough():
+    # A new function each time so that a chain of them is really that long
+    def interceptor(event, args, kwargs):
+        return args, kwargs
+    return interceptor
+
+
+def delivery_passthrough():
+    def interceptor(event, sub_id, deliver):
+        return deliver
+    return interceptor
+
+
+def run(publishes, subscribers, publish_count=0, delivery_count=0, events=None):
+    scheduler = QueuedScheduler()
+    pubpen = PubPen(scheduler)
+    for dummy in range(subscribers):
+        pubpen.subscribe('tick', callback)
+    for dummy in range(publish_count):
+        pubpen.add_publish_interceptor(publish_passthrough(), events)
+    for dummy in range(delivery_count):
+        pubpen.add_delivery_interceptor(delivery_passthrough(), events)
+
+    # Otherwise the garbage collector keeps walking the queued deliveries, like timeit avoids
+    gc.disable()
+    start = time.perf_counter()
+    for num in range(publishes):
+        pubpen.publish('tick', num)
+    elapsed = time.perf_counter() - start
+    gc.enable()
+    scheduler.run()
+    return elapsed / publishes * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--publishes', type=int, default=20000)
+    parser.add_argument('--subscribers', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    def best(**kwargs):
+        return min(run(args.publishes, args.subscribers, **kwargs) for dummy in range(args.repeat))
+
+    baseline = best()
+    print('{:20} {:8.0f} ns/publish'.format('no interceptors', baseline))
+    cases = [('other event', {'publish_count': 4, 'delivery_count': 4, 'events': ['other']})]
+    for count in (1, 2, 4, 8):
+        cases.append(('{} publish'.format(count), {'publish_count': count}))
+    for count in (1, 2, 4, 8):
+        cases.append(('{} delivery'.format(count), {'delivery_count': count}))
+
+    for name, kwargs in cases:
+        cost = best(**kwargs)
+        line = '{:20} {:8.0f} ns/publish'.format(name, cost)
+        if 'events' not in kwargs:
+            count = kwargs.get('publish_count', 0) + kwargs.get('delivery_count', 0)
+            line += ' {:8.0f} ns per interceptor'.format((cost - baseline) / count)
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/python3 -tt
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Run a pubmarine.joins.Join at a steady rate of new keys and show that the memory it uses levels
+off.
+
+Each simulated second, --rate requests are sent in ten slices.  --answered of them get a response
+in the next slice and the rest time out.  The clock is virtual so the run takes as long as the
+publishing and delivering does, not --seconds.
+"""
+import argparse
+import time
+import tracemalloc
+
+from pubmarine import PubPen
+from pubmarine.joins import Join
+from pubmarine.testing import VirtualTimeLoop
+
+
+SLICES = 10
+
+
+class Counter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def run(rate, seconds, timeout, answered, trace):
+    loop = VirtualTimeLoop()
+    pubpen = PubPen(loop)
+    done = Counter()
+    lost = Counter()
+    pubpen.subscribe('done', done)
+    pubpen.subscribe('lost', lost)
+    join = Join(pubpen, 'sent', 'received', 'done', timeout=timeout, timeout_event='lost')
+
+    per_slice = rate // SLICES
+    answer_every = round(1 / answered) if answered else 0
+    request_id = 0
+    unanswered = []
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    for second in range(seconds):
+        for dummy in range(SLICES):
+            for answer in unanswered:
+                pubpen.publish('received', answer)
+            unanswered = []
+            for dummy in range(per_slice):
+                request_id += 1
+                pubpen.publish('sent', request_id, 'request')
+                if answer_every and request_id % answer_every == 0:
+                    unanswered.append(request_id)
+            loop.advance(1 / SLICES)
+            loop.run_until_complete(pubpen.drain())
+        if trace:
+            current = tracemalloc.get_traced_memory()[0]
+            print('{:4}s {:10} waiting {:10.1f} MiB {:10} done {:10} lost'.format(
+                second + 1, len(join), current / 2 ** 20, done.count, lost.count))
+    elapsed = time.perf_counter() - start
+    if trace:
+        tracemalloc.stop()
+    join.close()
+    loop.close()
+    return request_id / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rate', type=int, default=100000, help='new keys per second')
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--timeout', type=float, default=1.0)
+    parser.add_argument('--answered', type=float, default=0.5,
+                        help='fraction of the requests that get a response')
+    args = parser.parse_args()
+
+    run(args.rate, args.seconds, args.timeout, args.answered, trace=True)
+    rate = run(args.rate, args.seconds, args.timeout, args.answered, trace=False)
+    print('{:.0f} keys/s'.format(rate))
+
+
+if __name__ == '__main__':
+    main()
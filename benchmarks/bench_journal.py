@@ -0,0 +1,68 @@
+#!/usr/bin/python3 -tt
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Measure :class:`pubmarine.journal.EventJournal` append latency and replay throughput.
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+
+from pubmarine import PubPen
+from pubmarine.journal import EventJournal
+
+
+def percentile(samples, fraction):
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+def bench_append(directory, count, sync_every):
+    latencies = []
+    with EventJournal(directory, sync_every=sync_every) as journal:
+        clock = time.perf_counter
+        for num in range(count):
+            start = clock()
+            journal.append('tick', num, 'payload')
+            latencies.append(clock() - start)
+    latencies.sort()
+    print('append ({} records, sync every {}):'.format(count, sync_every))
+    for label, fraction in (('p50', 0.5), ('p99', 0.99), ('p99.9', 0.999)):
+        print('  {:6} {:8.2f} us'.format(label, percentile(latencies, fraction) * 1e6))
+    print('  {:6} {:8.2f} us'.format('max', latencies[-1] * 1e6))
+
+
+def bench_replay(directory):
+    loop = asyncio.new_event_loop()
+    pubpen = PubPen(loop)
+    received = [0]
+
+    def sink(*args):
+        received[0] += 1
+    pubpen.subscribe('tick', sink)
+
+    with EventJournal(directory) as journal:
+        start = time.perf_counter()
+        last = loop.run_until_complete(journal.replay(pubpen, consumer='bench'))
+        elapsed = time.perf_counter() - start
+    loop.close()
+
+    assert received[0] == last
+    print('replay ({} records):'.format(last))
+    print('  {:10.0f} events/s'.format(last / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=200000)
+    parser.add_argument('--sync-every', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        bench_append(directory, args.count, args.sync_every)
+        bench_replay(directory)
+
+
+if __name__ == '__main__':
+    main()
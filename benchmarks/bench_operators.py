@@ -0,0 +1,94 @@
+#!/usr/bin/python3 -tt
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Compare a five stage pipeline built from pubmarine.operators with the same five stages written as
+subscribers that transform a value and republish it.
+"""
+import argparse
+import asyncio
+import time
+
+from pubmarine import PubPen
+from pubmarine.operators import Flow
+
+
+STAGES = 5
+
+
+def add_one(value):
+    return value + 1
+
+
+def is_even(value):
+    return value % 2 == 0
+
+
+class Republisher:
+    """One stage of the hand written pipeline"""
+    def __init__(self, pubpen, source, destination, func, is_filter):
+        self.pubpen = pubpen
+        self.destination = destination
+        self.func = func
+        self.is_filter = is_filter
+        pubpen.subscribe(source, self.receive)
+
+    def receive(self, value):
+        if self.is_filter:
+            if self.func(value):
+                self.pubpen.publish(self.destination, value)
+        else:
+            self.pubpen.publish(self.destination, self.func(value))
+
+
+def republishing(pubpen, sink):
+    stages = []
+    for num in range(STAGES):
+        is_filter = num == STAGES // 2
+        stages.append(Republisher(pubpen, 'stage{}'.format(num), 'stage{}'.format(num + 1),
+                                  is_even if is_filter else add_one, is_filter))
+    pubpen.subscribe('stage{}'.format(STAGES), sink)
+    return stages
+
+
+def operators(pubpen, sink):
+    flow = Flow(pubpen, 'stage0')
+    for num in range(STAGES):
+        flow = flow.filter(is_even) if num == STAGES // 2 else flow.map(add_one)
+    return flow.subscribe(sink)
+
+
+def run(build, publishes):
+    loop = asyncio.new_event_loop()
+    pubpen = PubPen(loop)
+    received = []
+
+    def sink(value):
+        received.append(value)
+    keep = build(pubpen, sink)
+
+    start = time.perf_counter()
+    for num in range(publishes):
+        pubpen.publish('stage0', num)
+    loop.run_until_complete(pubpen.drain())
+    elapsed = time.perf_counter() - start
+    loop.close()
+    del keep
+    assert len(received) == publishes // 2
+    return publishes / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--publishes', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for name, build in (('republishing', republishing), ('operators', operators)):
+        rate = max(run(build, args.publishes) for dummy in range(args.repeat))
+        print('{:15} {:12.0f} publications/s'.format(name, rate))
+
+
+if __name__ == '__main__':
+    main()
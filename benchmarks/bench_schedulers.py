@@ -0,0 +1,84 @@
+#!/usr/bin/python3 -tt
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Compare the delivery throughput of the asyncio event loop and the schedulers in
+pubmarine.schedulers.
+"""
+import argparse
+import asyncio
+import time
+
+from pubmarine import PubPen
+from pubmarine.schedulers import ImmediateScheduler, QueuedScheduler, ThreadPoolScheduler
+
+
+def callback(*args):
+    pass
+
+
+def asyncio_engine():
+    loop = asyncio.new_event_loop()
+
+    def finish():
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
+    return loop, finish
+
+
+def immediate_engine():
+    return ImmediateScheduler(), lambda: None
+
+
+def queued_engine():
+    scheduler = QueuedScheduler()
+    return scheduler, scheduler.run
+
+
+def thread_pool_engine():
+    scheduler = ThreadPoolScheduler(max_workers=4)
+
+    def finish():
+        scheduler.join()
+        scheduler.shutdown()
+    return scheduler, finish
+
+
+ENGINES = (('asyncio', asyncio_engine),
+           ('immediate', immediate_engine),
+           ('queued', queued_engine),
+           ('thread pool', thread_pool_engine))
+
+
+def run(engine, publishes, subscribers):
+    scheduler, finish = engine()
+    pubpen = PubPen(scheduler)
+    for dummy in range(subscribers):
+        pubpen.subscribe('tick', callback)
+
+    start = time.perf_counter()
+    for num in range(publishes):
+        pubpen.publish('tick', num)
+    finish()
+    elapsed = time.perf_counter() - start
+    return publishes * subscribers / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--publishes', type=int, default=100000)
+    parser.add_argument('--subscribers', type=int, default=1)
+    args = parser.parse_args()
+
+    for name, engine in ENGINES:
+        publishes = args.publishes
+        if name == 'thread pool':
+            # Submitting to a thread pool is much slower.  Don't take forever.
+            publishes = max(publishes // 10, 1)
+        rate = run(engine, publishes, args.subscribers)
+        print('{:15} {:14.0f} deliveries/s'.format(name, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python3 -tt
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Compare delayed publishing with PubPen.publish_later against scheduling PubPen.publish with the
+event loop's call_later.
+
+Models session expiry: many timers with delays spread over an hour are scheduled and most of them
+are cancelled before they are due.  Then the clock is run forward so the rest fire.  The event
+loop is a VirtualTimeLoop so the run does not take an hour.
+"""
+import argparse
+import asyncio
+import gc
+import random
+import time
+import tracemalloc
+
+from pubmarine import PubPen
+from pubmarine.testing import VirtualTimeLoop
+
+
+def callback(*args):
+    pass
+
+
+def call_later_engine(pubpen):
+    loop = pubpen.loop
+
+    def schedule(delay, session):
+        return loop.call_later(delay, pubpen.publish, 'session_expired', session)
+    return schedule
+
+
+def timer_wheel_engine(pubpen):
+    def schedule(delay, session):
+        return pubpen.publish_later(delay, 'session_expired', session)
+    return schedule
+
+
+def run(engine, delays, cancel_fraction):
+    loop = VirtualTimeLoop()
+    pubpen = PubPen(loop)
+    pubpen.subscribe('session_expired', callback)
+    schedule = engine(pubpen)
+    cancel_count = int(len(delays) * cancel_fraction)
+    gc.collect()
+
+    start = time.perf_counter()
+    timers = [schedule(delay, num) for num, delay in enumerate(delays)]
+    scheduled = time.perf_counter()
+
+    for timer in timers[:cancel_count]:
+        timer.cancel()
+    cancelled = time.perf_counter()
+
+    loop.run_until_complete(asyncio.sleep(max(delays) + 1))
+    fired = time.perf_counter()
+    loop.close()
+
+    count = len(delays)
+    return ((scheduled - start) / count, (cancelled - scheduled) / max(cancel_count, 1),
+            (fired - cancelled) / max(count - cancel_count, 1))
+
+
+def measure_memory(engine, delays):
+    """Return the number of bytes allocated per scheduled timer"""
+    loop = VirtualTimeLoop()
+    pubpen = PubPen(loop)
+    schedule = engine(pubpen)
+    gc.collect()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    timers = [schedule(delay, num) for num, delay in enumerate(delays)]
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    loop.close()
+    return memory / len(timers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--timers', type=int, default=200000)
+    parser.add_argument('--cancel', type=float, default=0.9,
+                        help='Fraction of the timers to cancel')
+    parser.add_argument('--max-delay', type=float, default=3600)
+    args = parser.parse_args()
+
+    rand = random.Random(0)
+    delays = [rand.uniform(1, args.max_delay) for dummy in range(args.timers)]
+    print('{:12} {:>14} {:>14} {:>14} {:>14}'.format('', 'schedule us', 'cancel us',
+                                                      'fire+publish us', 'bytes/timer'))
+    for name, engine in (('call_later', call_later_engine), ('timer wheel', timer_wheel_engine)):
+        schedule, cancel, fire = run(engine, delays, args.cancel)
+        memory = measure_memory(engine, delays)
+        print('{:12} {:14.3f} {:14.3f} {:14.3f} {:14.0f}'.format(name, schedule * 1e6,
+                                                                  cancel * 1e6, fire * 1e6,
+                                                                  memory))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/python3 -tt
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Measure the overhead that tracing adds to publishing and delivering events.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from pubmarine import PubPen
+from pubmarine.tracing import JsonLinesSink, RingBufferSink, Tracer
+
+
+def run(count, subscribers, tracer=None):
+    loop = asyncio.new_event_loop()
+    pubpen = PubPen(loop)
+    if tracer is not None:
+        pubpen.enable_tracing(tracer)
+
+    def callback(*args):
+        pass
+    for dummy in range(subscribers):
+        pubpen.subscribe('tick', callback)
+
+    start = time.perf_counter()
+    for num in range(count):
+        pubpen.publish('tick', num)
+    loop.run_until_complete(asyncio.sleep(0))
+    elapsed = time.perf_counter() - start
+    loop.close()
+    return elapsed / (count * subscribers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--subscribers', type=int, default=1)
+    args = parser.parse_args()
+
+    baseline = run(args.count, args.subscribers)
+    print('{:20} {:8.3f} us/delivery'.format('no tracer', baseline * 1e6))
+
+    ring = run(args.count, args.subscribers, Tracer(RingBufferSink()))
+    print('{:20} {:8.3f} us/delivery  (+{:.3f} us)'.format('ring buffer sink', ring * 1e6,
+                                                           (ring - baseline) * 1e6))
+
+    with tempfile.TemporaryDirectory() as directory:
+        sink = JsonLinesSink(os.path.join(directory, 'trace.jsonl'))
+        jsonl = run(args.count, args.subscribers, Tracer(sink))
+        sink.close()
+    print('{:20} {:8.3f} us/delivery  (+{:.3f} us)'.format('json lines sink', jsonl * 1e6,
+                                                           (jsonl - baseline) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
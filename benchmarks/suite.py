@@ -0,0 +1,317 @@
+#!/usr/bin/python3 -tt
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Benchmarks for the publish/subscribe hot paths of pubmarine.
+
+Run all of the benchmarks and print the results::
+
+    python3 benchmarks/suite.py
+
+Save the results as a baseline and compare a later run against it::
+
+    python3 benchmarks/suite.py --save baseline.json
+    python3 benchmarks/suite.py --compare baseline.json
+
+Results that are worse than the baseline by more than ``--threshold`` percent are reported as
+regressions.  ``--fail-on-regression`` makes the run exit non-zero when that happens.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import pubmarine
+from pubmarine import PubPen
+
+
+SUBSCRIBER_COUNTS = (1, 10, 100, 1000, 10000, 100000)
+QUICK_SUBSCRIBER_COUNTS = (1, 100, 10000)
+
+# Roughly how many deliveries each timed run should make.  Keeps runs with many subscribers from
+# taking forever and runs with few subscribers from being lost in the noise.
+DELIVERIES_PER_RUN = 200000
+
+_BENCHMARKS = OrderedDict()
+
+
+def benchmark(unit, higher_is_better=False):
+    """Register a benchmark function.  It is called once for each subscriber count."""
+    def register(func):
+        _BENCHMARKS[func.__name__] = (func, unit, higher_is_better)
+        return func
+    return register
+
+
+class Callback:
+    """A subscriber that counts how often it is called"""
+    def __init__(self):
+        self.called = 0
+
+    def method(self, *args, **kwargs):
+        self.called += 1
+
+
+def callback(*args, **kwargs):
+    pass
+
+
+def new_pubpen(subscribers, func=callback):
+    loop = asyncio.new_event_loop()
+    pubpen = PubPen(loop)
+    for dummy in range(subscribers):
+        pubpen.subscribe('tick', func)
+    return pubpen
+
+
+def drain(pubpen):
+    pubpen.loop.run_until_complete(asyncio.sleep(0))
+
+
+def publishes_for(subscribers):
+    return max(DELIVERIES_PER_RUN // subscribers, 1)
+
+
+@benchmark('deliveries/s', higher_is_better=True)
+def publish_throughput(subscribers):
+    """Publish an event with one positional argument and run the deliveries"""
+    pubpen = new_pubpen(subscribers)
+    publishes = publishes_for(subscribers)
+    start = time.perf_counter()
+    for num in range(publishes):
+        pubpen.publish('tick', num)
+    drain(pubpen)
+    elapsed = time.perf_counter() - start
+    pubpen.loop.close()
+    return publishes * subscribers / elapsed
+
+
+@benchmark('deliveries/s', higher_is_better=True)
+def publish_kwargs_throughput(subscribers):
+    """Publish an event with keyword arguments and run the deliveries"""
+    pubpen = new_pubpen(subscribers)
+    publishes = publishes_for(subscribers)
+    start = time.perf_counter()
+    for num in range(publishes):
+        pubpen.publish('tick', num=num, name='tick')
+    drain(pubpen)
+    elapsed = time.perf_counter() - start
+    pubpen.loop.close()
+    return publishes * subscribers / elapsed
+
+
+@benchmark('deliveries/s', higher_is_better=True)
+def publish_positional_throughput(subscribers):
+    """Publish an event with the same arguments as positional arguments, for comparison"""
+    pubpen = new_pubpen(subscribers)
+    publishes = publishes_for(subscribers)
+    start = time.perf_counter()
+    for num in range(publishes):
+        pubpen.publish('tick', num, 'tick')
+    drain(pubpen)
+    elapsed = time.perf_counter() - start
+    pubpen.loop.close()
+    return publishes * subscribers / elapsed
+
+
+class Tick:
+    __slots__ = ('num',)
+
+    def __init__(self, num):
+        self.num = num
+
+
+class SubTick(Tick):
+    __slots__ = ()
+
+
+@benchmark('deliveries/s', higher_is_better=True)
+def publish_typed_throughput(subscribers):
+    """Publish an event object to subscribers of its base class and run the deliveries"""
+    loop = asyncio.new_event_loop()
+    pubpen = PubPen(loop)
+    for dummy in range(subscribers):
+        pubpen.subscribe(Tick, callback)
+    publishes = publishes_for(subscribers)
+    start = time.perf_counter()
+    for num in range(publishes):
+        pubpen.publish(SubTick(num))
+    drain(pubpen)
+    elapsed = time.perf_counter() - start
+    loop.close()
+    return publishes * subscribers / elapsed
+
+
+@benchmark('ops/s', higher_is_better=True)
+def subscribe_unsubscribe_churn(subscribers):
+    """Subscribe and immediately unsubscribe while ``subscribers`` other subscriptions exist"""
+    pubpen = new_pubpen(subscribers)
+    operations = 20000
+    start = time.perf_counter()
+    for dummy in range(operations):
+        pubpen.unsubscribe(pubpen.subscribe('tick', callback))
+    elapsed = time.perf_counter() - start
+    pubpen.loop.close()
+    return operations / elapsed
+
+
+@benchmark('us/subscriber')
+def dead_weakref_cleanup(subscribers):
+    """Publish once after all ``subscribers`` have been garbage collected"""
+    loop = asyncio.new_event_loop()
+    pubpen = PubPen(loop)
+    owners = [Callback() for dummy in range(subscribers)]
+    for owner in owners:
+        pubpen.subscribe('tick', owner.method)
+    del owners, owner
+    gc.collect()
+
+    start = time.perf_counter()
+    pubpen.publish('tick')
+    elapsed = time.perf_counter() - start
+    loop.close()
+    assert not pubpen._subscriptions
+    return elapsed / subscribers * 1e6
+
+
+@benchmark('us')
+def end_to_end_latency(subscribers):
+    """Median time from publish to the last subscriber's callback starting"""
+    loop = asyncio.new_event_loop()
+    pubpen = PubPen(loop)
+    received = [0.0]
+
+    def stamp(*args):
+        received[0] = time.perf_counter()
+    for dummy in range(subscribers):
+        pubpen.subscribe('tick', stamp)
+
+    samples = []
+    for dummy in range(max(min(publishes_for(subscribers), 2000), 5)):
+        start = time.perf_counter()
+        pubpen.publish('tick')
+        drain(pubpen)
+        samples.append(received[0] - start)
+    loop.close()
+    return statistics.median(samples) * 1e6
+
+
+@benchmark('bytes/subscription')
+def memory_per_subscription(subscribers):
+    """Memory allocated by PubPen for each subscription"""
+    loop = asyncio.new_event_loop()
+    pubpen = PubPen(loop)
+    owners = [Callback() for dummy in range(subscribers)]
+    gc.collect()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for owner in owners:
+        pubpen.subscribe('tick', owner.method)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    loop.close()
+    return (after - before) / subscribers
+
+
+def run_benchmarks(names, subscriber_counts, repeat):
+    results = OrderedDict()
+    for name in names:
+        func, unit, higher_is_better = _BENCHMARKS[name]
+        for subscribers in subscriber_counts:
+            key = '{}[{}]'.format(name, subscribers)
+            values = []
+            for dummy in range(repeat):
+                gc.collect()
+                values.append(func(subscribers))
+            # Noise only ever makes a run slower so report the best run
+            value = max(values) if higher_is_better else min(values)
+            results[key] = {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+            print('{:45} {:>14.2f} {}'.format(key, value, unit))
+            sys.stdout.flush()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print a comparison against a baseline and return the names of regressed benchmarks"""
+    regressions = []
+    print()
+    print('{:45} {:>14} {:>14} {:>9}'.format('benchmark', 'baseline', 'current', 'change'))
+    for key, result in results.items():
+        if key not in baseline:
+            print('{:45} {:>14} {:>14.2f} {:>9}'.format(key, '-', result['value'], 'new'))
+            continue
+        old = baseline[key]['value']
+        new = result['value']
+        change = (new - old) / old * 100 if old else 0.0
+        worse = -change if result['higher_is_better'] else change
+        marker = ''
+        if worse > threshold:
+            marker = '  REGRESSION'
+            regressions.append(key)
+        elif worse < -threshold:
+            marker = '  improved'
+        print('{:45} {:>14.2f} {:>14.2f} {:>+8.1f}%{}'.format(key, old, new, change, marker))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmarks', nargs='*', help='Names of benchmarks to run.  Default: all')
+    parser.add_argument('--quick', action='store_true',
+                        help='Run fewer subscriber counts and repetitions')
+    parser.add_argument('--repeat', type=int, default=None,
+                        help='Number of times to run each benchmark')
+    parser.add_argument('--save', metavar='FILE', help='Save the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='Compare the results to a baseline')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Percent change that counts as a regression.  Default: 10')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='Exit with a non-zero status if a regression is found')
+    parser.add_argument('--list', action='store_true', help='List the benchmarks and exit')
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (func, dummy, dummy) in _BENCHMARKS.items():
+            print('{:35} {}'.format(name, func.__doc__))
+        return 0
+
+    names = args.benchmarks or list(_BENCHMARKS)
+    unknown = [name for name in names if name not in _BENCHMARKS]
+    if unknown:
+        parser.error('Unknown benchmarks: {}'.format(', '.join(unknown)))
+
+    subscriber_counts = QUICK_SUBSCRIBER_COUNTS if args.quick else SUBSCRIBER_COUNTS
+    repeat = args.repeat or (1 if args.quick else 3)
+
+    results = run_benchmarks(names, subscriber_counts, repeat)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'meta': {'pubmarine': pubmarine.__version__,
+                                'python': platform.python_version(),
+                                'implementation': platform.python_implementation(),
+                                'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+                       'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print('Baseline: pubmarine {pubmarine} on {implementation} {python} at {time}'
+              .format(**baseline['meta']))
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
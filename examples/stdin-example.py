@@ -20,26 +20,23 @@ class Server:
         self.pubpen = pubpen
         self.beats = 0
         self.pubpen.subscribe('from_client', self.broadcast)
+        self.pubpen.subscribe('heartbeat', self.heartbeat)
+        # Note: Unlike the simple example, we do not sleep and call ourselves again.
+        # publish_every() keeps one timer for the periodic event so there is no task to
+        # create each time and the beats do not drift.
+        self.pubpen.publish_every(1, 'heartbeat')
 
     def broadcast(self, message):
         self.pubpen.publish('from_server', 'Server echoes: {}'.format(message))
 
-    async def heartbeat(self):
+    def heartbeat(self):
         self.pubpen.publish('from_server', self.beats)
         self.beats += 1
-        await asyncio.sleep(1)
-        # Note: Unlike the simple example, we do not recursively call ourselves.
-        # This is because we don't know how many times we might call ourselves here;
-        # that's under user control.  So we have to guard against recursing beyond the
-        # recursion limit by exiting this function and having the new function invocation
-        # happen in the loop, outside of this function
-        self.pubpen.loop.create_task(self.heartbeat())
 
 
 class Client:
-    def __init__(self, pubpen, input_queue):
+    def __init__(self, pubpen):
         self.pubpen = pubpen
-        self.input = input_queue
         self.pubpen.subscribe('from_server', self.display)
 
     @staticmethod
@@ -47,16 +44,16 @@ class Client:
         print('Client echoes: {}'.format(message))
 
     async def await_input(self):
-        while True:
-            message = await self.input.get()
-            if message.strip() == '.':
-                self.pubpen.loop.stop()
-                break
-            self.pubpen.publish('from_client', message)
+        async with self.pubpen.stream('stdin') as lines:
+            async for message in lines:
+                if message.strip() == '.':
+                    self.pubpen.loop.stop()
+                    break
+                self.pubpen.publish('from_client', message)
 
 
-def get_stdin_data(loop, queue):
-    loop.create_task(queue.put(sys.stdin.readline()))
+def get_stdin_data(pubpen):
+    pubpen.publish('stdin', sys.stdin.readline())
 
 
 async def start():
@@ -65,14 +62,13 @@ async def start():
     else:
         loop = asyncio.get_event_loop()
 
-    queue = asyncio.Queue()
-    loop.add_reader(sys.stdin, get_stdin_data, loop, queue)
-
     pubpen = PubPen(loop)
+    loop.add_reader(sys.stdin, get_stdin_data, pubpen)
+
     server = Server(pubpen)
-    client = Client(pubpen, queue)
+    client = Client(pubpen)
 
-    await asyncio.wait((client.await_input(), server.heartbeat()))
+    await client.await_input()
 
 
 def main():
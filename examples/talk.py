@@ -27,9 +27,7 @@ class Display:
 
         self.pubpen.subscribe('incoming', self.show_message)
         self.pubpen.subscribe('typed', self.show_typing)
-        self.pubpen.subscribe('error', self.show_error)
-        self.pubpen.subscribe('info', self.show_error)
-        self.pubpen.subscribe('conn_lost', self.show_error)
+        self.pubpen.subscribe_many(('error', 'info', 'conn_lost'), self.show_error)
 
     def __enter__(self):
         self.stdscr = curses.initscr()
@@ -22,12 +22,38 @@ Authors: Toshio Kuratomi <toshio@fedoraproject.org
 """
 
 import asyncio
+import heapq
+import inspect
+import sys
 import warnings
-from collections import defaultdict
+from array import array
+from collections import defaultdict, deque
 from functools import partial
 import types
-from typing import Any, Callable, DefaultDict as DefaultDict_t, Dict, Generator, List, Union
-from weakref import WeakMethod, ref
+from typing import (Any, Callable, DefaultDict as DefaultDict_t, Deque, Dict, Generator,
+                    Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union)
+from weakref import WeakMethod, WeakValueDictionary, ref
+
+from .aggregation import Aggregation
+from .breaker import EXECUTOR, SlowSubscriberBreaker
+from .interceptors import DeliveryInterceptor, Interceptors, PublishInterceptor
+from .metrics import DispatchMetrics, EventMetrics
+from .schedulers import Scheduler
+from .shedding import LoadShedder
+from .timers import Timer, TimerWheel
+from .tracing import Tracer
+
+try:
+    from contextvars import copy_context
+except ImportError:  # pragma: no cover
+    # Python < 3.7
+    copy_context = None  # type: ignore
+
+try:
+    import numpy  # type: ignore
+except ImportError:  # pragma: no cover
+    # Optional.  Filters of columnar subscriptions are run on each row without it.
+    numpy = None  # type: ignore
 
 
 __version__ = '0.4.3'
@@ -46,6 +72,378 @@ class EventNotFoundError(PubMarineError):
     pass
 
 
+class NoResponderError(PubMarineError):
+    """ Raised when a request is made for an event that has no responder
+    """
+    pass
+
+
+def _weak_callback(callback: Union[Callable[..., Any], types.MethodType]) -> Callable[[], Any]:
+    """Return a weak reference to a function or method"""
+    if isinstance(callback, types.MethodType):
+        return WeakMethod(callback)
+    return ref(callback)
+
+
+def _as_events(subscribed: Any) -> tuple:
+    """Return the events a subscription is subscribed to as a tuple"""
+    return subscribed if type(subscribed) is tuple else (subscribed,)
+
+
+def _deliver(handlers: Dict[int, Callable[[], Any]], sub_id: int, handler: Callable[[], Any],
+             args: tuple, kwargs: dict) -> Any:
+    """
+    Call a subscriber's callback if it is still subscribed
+
+    Deliveries are queued holding the weak reference rather than the callback so they do not keep
+    the callback alive.  Unsubscribing, or the callback being garbage collected, turns every
+    delivery to the subscription that is still queued into a no-op.
+    """
+    if handlers.get(sub_id) is not handler:
+        return None
+    func = handler()
+    if func is None:
+        return None
+    return func(*args, **kwargs)
+
+
+def _subscribed(handlers: Dict[int, Callable[[], Any]], sub_id: int,
+                handler: Callable[[], Any]) -> bool:
+    """Whether a queued delivery will still call the subscriber's callback"""
+    return handlers.get(sub_id) is handler and handler() is not None
+
+
+def _deliver_measured(metrics: DispatchMetrics, stats: EventMetrics, queued: float,
+                      handlers: Dict[int, Callable[[], Any]], sub_id: int,
+                      handler: Callable[[], Any], args: tuple, kwargs: dict) -> Any:
+    """
+    Like :func:`_deliver` but count and time the delivery in the dispatch metrics
+
+    Deliveries that were cancelled while they were queued are not counted.
+    """
+    if handlers.get(sub_id) is not handler:
+        return None
+    func = handler()
+    if func is None:
+        return None
+    return metrics.run(stats, queued, func, args, kwargs)
+
+
+# Key that waiters are stored under when they did not ask for a specific key
+_ANY_KEY = object()
+
+
+def _payload(args: tuple, kwargs: dict) -> Any:
+    """
+    Collapse the arguments of a publication into a single value
+
+    A single positional argument is returned as is.  Several positional arguments are returned as
+    a tuple.  If keyword arguments were published, an ``(args, kwargs)`` tuple is returned.
+    """
+    if kwargs:
+        return (args, kwargs)
+    if len(args) == 1:
+        return args[0]
+    return args
+
+
+def _payload_size(args: tuple, kwargs: dict) -> int:
+    """Estimate the memory used by a publication's arguments"""
+    size = sys.getsizeof(args) + sum(sys.getsizeof(arg) for arg in args)
+    if kwargs:
+        size += sys.getsizeof(kwargs) + sum(sys.getsizeof(value) for value in kwargs.values())
+    return size
+
+
+class _LimitHandlers(dict):
+    """
+    The handler of a subscription with max_calls, checked by its deliveries
+
+    A dict that can be weakly referenced so a retired subscription can be found again while its
+    last deliveries are still queued.
+    """
+    __slots__ = ('__weakref__',)
+
+
+class _Retention:
+    """The most recent publications of an event, kept for subscribers that arrive later"""
+    __slots__ = ('history', 'max_bytes', 'items', 'size')
+
+    def __init__(self, history: int, max_bytes: Optional[int]) -> None:
+        self.history = history
+        self.max_bytes = max_bytes
+        self.items = deque()  # type: Deque[Tuple[tuple, dict, int]]
+        self.size = 0
+
+    def add(self, args: tuple, kwargs: dict) -> None:
+        items = self.items
+        if len(items) >= self.history:
+            self.size -= items.popleft()[2]
+
+        if self.max_bytes is None:
+            items.append((args, kwargs, 0))
+            return
+
+        item_size = _payload_size(args, kwargs)
+        items.append((args, kwargs, item_size))
+        self.size += item_size
+        # The newest publication is always kept, even if it is larger than the cap by itself
+        while self.size > self.max_bytes and len(items) > 1:
+            self.size -= items.popleft()[2]
+
+
+def _select_rows(where: Callable[..., Any], columns: tuple) -> Optional[tuple]:
+    """Cut the rows that a filter rejects out of some columns
+
+    :returns: The columns with only the selected rows or None if no row was selected
+    """
+    if numpy is not None and all(isinstance(column, numpy.ndarray) for column in columns):
+        # The filter is called once with the whole columns and returns a mask
+        mask = numpy.asarray(where(*columns), dtype=bool)
+        if mask.ndim == 0:
+            return columns if mask else None
+        if not mask.any():
+            return None
+        if mask.all():
+            return columns
+        return tuple(column[mask] for column in columns)
+
+    selected = [index for index, row in enumerate(zip(*columns)) if where(*row)]
+    if not selected:
+        return None
+    if len(selected) == len(columns[0]):
+        return columns
+    rows = []  # type: List[Sequence[Any]]
+    for column in columns:
+        values = [column[index] for index in selected]
+        rows.append(array(column.typecode, values) if isinstance(column, array) else values)
+    return tuple(rows)
+
+
+class _Batch:
+    """The payloads waiting to be delivered to a batching subscription"""
+    __slots__ = ('pubpen', 'sub_id', 'handler', 'size', 'delay', 'where', 'items', 'timer',
+                 'held')
+
+    def __init__(self, pubpen: 'PubPen', sub_id: int, handler: Callable[[], Any],
+                 size: Optional[int], delay: Optional[float],
+                 where: Optional[Callable[..., Any]] = None) -> None:
+        self.pubpen = pubpen
+        self.sub_id = sub_id
+        self.handler = handler
+        self.size = size
+        self.delay = delay
+        self.where = where
+        self.items = []  # type: List[Any]
+        self.timer = None  # type: Any
+        # Batches that came due while the subscription was paused
+        self.held = []  # type: List[List[Any]]
+
+    def add(self, args: tuple, kwargs: dict) -> None:
+        if self.where is not None and not self.where(*args, **kwargs):
+            return
+        items = self.items
+        items.append(_payload(args, kwargs))
+        if self.size is not None and len(items) >= self.size:
+            # Queue the full batch and start a new one for the publications made before it runs
+            self.pubpen._schedule(partial(self.deliver, self.take()))
+        elif self.timer is None and self.delay is not None:
+            self.timer = self.pubpen._timer_wheel().call_later(self.delay, self.flush)
+
+    def extend(self, payloads: Iterable[Any]) -> None:
+        items = self.items
+        items.extend(payloads)
+        size = self.size
+        if size is not None and len(items) >= size:
+            items = self.take()
+            full = len(items) - len(items) % size
+            for start in range(0, full, size):
+                self.pubpen._schedule(partial(self.deliver, items[start:start + size]))
+            self.items = items[full:]
+        if self.items and self.timer is None and self.delay is not None:
+            self.timer = self.pubpen._timer_wheel().call_later(self.delay, self.flush)
+
+    def take(self) -> List[Any]:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        items = self.items
+        self.items = []
+        return items
+
+    def flush(self) -> None:
+        self.timer = None
+        if self.items:
+            self.pubpen._schedule(partial(self.deliver, self.take()))
+
+    def deliver(self, items: List[Any]) -> None:
+        pubpen = self.pubpen
+        # Skip batches for subscriptions that were cancelled after they were queued
+        if pubpen._batches.get(self.sub_id) is not self:
+            return
+        if self.sub_id in pubpen._paused:
+            # Keep the batch until the subscription is resumed
+            self.held.append(items)
+            return
+        callback = self.handler()
+        if callback is not None:
+            callback(items)
+
+    def release(self) -> None:
+        """Queue the batches that came due while the subscription was paused"""
+        held = self.held
+        self.held = []
+        for items in held:
+            self.pubpen._schedule(partial(self.deliver, items))
+
+    def close(self) -> None:
+        self.take()
+        self.held = []
+
+
+def _cancel_unless_done(task: asyncio.Future, dummy_future: asyncio.Future) -> None:
+    if not task.done():
+        task.cancel()
+
+
+def _set_result_unless_done(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def _expire_waiter(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_exception(asyncio.TimeoutError())
+
+
+class EventStream:
+    """
+    An asynchronous iterator over the publications of an event.
+
+    Create one with :meth:`PubPen.stream`.  Each publication is turned into a single item: the
+    published value if the event was published with one positional argument, a tuple of the
+    positional arguments if it was published with several, and an ``(args, kwargs)`` tuple if it
+    was published with keyword arguments.
+
+    The stream is subscribed to the event until :meth:`close` is called.  Using the stream as an
+    asynchronous context manager closes it automatically::
+
+        async with pubpen.stream('from_server', maxsize=100) as messages:
+            async for message in messages:
+                print(message)
+    """
+    def __init__(self, pubpen: 'PubPen', event: str, maxsize: int = 0,
+                 batch: Optional[int] = None) -> None:
+        """
+        :arg pubpen: The :class:`PubPen` to subscribe to
+        :arg event: String name of the event to stream
+        :kwarg maxsize: Maximum number of items to buffer.  When the buffer
+            is full, the oldest item is dropped to make room and
+            :attr:`dropped` is incremented.  0 means the buffer is unbounded.
+        :kwarg batch: If given, iterating yields lists of up to this many
+            items instead of single items.  All of the items that arrived
+            since the consumer last ran are handed over in one wakeup.
+        """
+        self.pubpen = pubpen
+        self.event = event
+        self.maxsize = maxsize
+        self.batch = batch
+        #: Number of items discarded because the buffer was full
+        self.dropped = 0
+
+        self._buffer = deque(maxlen=maxsize or None)  # type: Deque[Any]
+        self._waiter = None  # type: Optional[asyncio.Future]
+        self._closed = False
+        self._sub_id = pubpen.subscribe(event, self._push)
+
+    def _push(self, *args: Any, **kwargs: Any) -> None:
+        if self.maxsize and len(self._buffer) >= self.maxsize:
+            self.dropped += 1
+        self._buffer.append(_payload(args, kwargs))
+
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def close(self) -> None:
+        """ Unsubscribe from the event
+
+        Items that were already buffered are still returned by the iterator.
+        Iteration stops once they have been consumed.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self.pubpen.unsubscribe(self._sub_id)
+
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def __aiter__(self) -> 'EventStream':
+        return self
+
+    async def __anext__(self) -> Any:
+        buffer = self._buffer
+        while not buffer:
+            if self._closed:
+                raise StopAsyncIteration
+            self._waiter = self.pubpen.loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+
+        if self.batch is None:
+            return buffer.popleft()
+        return [buffer.popleft() for dummy in range(min(self.batch, len(buffer)))]
+
+    async def __aenter__(self) -> 'EventStream':
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        self.close()
+
+
+class Subscription(int):
+    """
+    A subscription id that can pause, resume, and cancel its subscription.
+
+    :meth:`PubPen.subscribe` returns one when it is called with ``handle=True``.  It is equal to
+    the plain subscription id so it can be passed to anything that takes one::
+
+        updates = pubpen.subscribe('status', pane.show_status, handle=True)
+        # The pane was hidden
+        updates.pause(keep_last=True)
+        # The pane is shown again and catches up on the latest status
+        updates.resume()
+    """
+    def __new__(cls, pubpen: 'PubPen', sub_id: int) -> 'Subscription':
+        return super().__new__(cls, sub_id)
+
+    def __init__(self, pubpen: 'PubPen', sub_id: int) -> None:  # pylint: disable=unused-argument
+        super().__init__()
+        #: The :class:`PubPen` the subscription belongs to
+        self.pubpen = pubpen
+
+    @property
+    def paused(self) -> bool:
+        """True while the subscription is paused"""
+        return self in self.pubpen._paused
+
+    def pause(self, keep_last: bool = False) -> None:
+        """Stop delivering publications until :meth:`resume`.  See :meth:`PubPen.pause`."""
+        self.pubpen.pause(self, keep_last=keep_last)
+
+    def resume(self) -> None:
+        """Deliver publications again.  See :meth:`PubPen.resume`."""
+        self.pubpen.resume(self)
+
+    def unsubscribe(self) -> None:
+        """Cancel the subscription.  See :meth:`PubPen.unsubscribe`."""
+        self.pubpen.unsubscribe(self)
+
+
 class PubPen:
     """
     A PubPen object coordinates subscription and publication.
@@ -55,30 +453,107 @@ class PubPen:
     Use :meth:`PubPen.publish` to publish an event, invoking the callbacks.
 
     Callbacks will be queued to be executed by the :mod:`asyncio` event loop that is passed into the
-    :class:`PubPen` when it is instantiated.
+    :class:`PubPen` when it is instantiated.  One of the schedulers from :mod:`pubmarine.schedulers`
+    can be passed instead to run the callbacks without an event loop.
 
     .. note:: Most programs should create one PubPen instance and then share it between
         all of the objects that wish to communicate with each other.
 
     """
-    def __init__(self, loop: asyncio.AbstractEventLoop, event_list: List[str] = None) -> None:
+    def __init__(self, loop: Union[asyncio.AbstractEventLoop, Scheduler],
+                 event_list: Optional[List[str]] = None) -> None:
         """
-        :arg loop: Event loop (asyncio compatible) to use.
+        :arg loop: Event loop (asyncio compatible) to use.  Alternatively, a
+            :class:`~pubmarine.schedulers.Scheduler`.  Any object with a
+            ``call_soon(callback, *args)`` method can be used to deliver
+            events but :meth:`request`, :meth:`stream`, :meth:`wait_for`,
+            :meth:`drain`, and everything that runs on a timer need an
+            asyncio event loop.  Those are :meth:`publish_later`,
+            :meth:`publish_at`, :meth:`publish_every`, :meth:`aggregate`,
+            ``max_delay`` for :meth:`subscribe`, :meth:`enable_shedding`,
+            ``time_budget`` for :meth:`enable_chunked_fanout`,
+            the :data:`~pubmarine.breaker.EXECUTOR` action of the breaker,
+            :class:`~pubmarine.joins.Join`, and
+            :meth:`~pubmarine.operators.Flow.batch` with an interval.  They
+            raise :exc:`TypeError` when given a scheduler.
         :kwarg event_list: If given, event_list is a list of allowed
             event_names.  If not given, any name can be subscribed to on the
             fly.  Dynamic event_lists are convenient.  Statically defined
             lists provide protection against typos.
         """
-        self.loop = loop
+        self.loop = loop  # type: Any
+        # A scheduler may run callbacks straight away, letting them subscribe and unsubscribe
+        # while publish() is still looping over the subscribers.  An event loop never does.
+        self._reentrant = isinstance(loop, Scheduler)
         self._next_id = self._id_generator()
-        self._subscriptions = {}  # type: Dict
+        self._subscriptions = {}  # type: Dict[int, Any]
 
         if event_list is not None:
             self._event_list = frozenset(event_list)
         else:
             self._event_list = frozenset()
 
-        self._event_handlers = defaultdict(dict)  # type: DefaultDict_t[str, Dict]
+        self._event_handlers = defaultdict(dict)  # type: DefaultDict_t[Any, Dict]
+        # Class of event object => (name, handler dicts of the classes in its MRO that have
+        # subscribers).  Cleared whenever a class gets its first subscriber.
+        self._type_dispatch = {}  # type: Dict[type, Tuple[str, Tuple[Dict, ...]]]
+        # sub_id => [calls left, {sub_id: handler}] for subscriptions with max_calls
+        self._call_limits = {}  # type: Dict[int, List[Any]]
+        # sub_id => handler record of a limited subscription that has used up its calls.  Kept
+        # until its queued deliveries have run so that unsubscribe() can still cancel them.
+        self._retired = WeakValueDictionary()  # type: WeakValueDictionary[int, _LimitHandlers]
+        # sub_id => payloads waiting for subscriptions with batch_size or max_delay
+        self._batches = {}  # type: Dict[int, _Batch]
+        # Subscriptions that are only called with the columns given to publish_array()
+        # sub_id => filter of the columnar subscriptions
+        self._columnar = {}  # type: Dict[int, Optional[Callable[..., Any]]]
+        # sub_id => (handler, publication count when paused if keeping the last value, else None)
+        self._paused = {}  # type: Dict[int, Tuple[Callable[[], Any], Optional[int]]]
+        # event => [number of paused subscriptions keeping the last value,
+        #           (publication count, args, kwargs) of the last publication or None]
+        self._held = {}  # type: Dict[Any, List[Any]]
+        # event name or class of event objects => True if publishing it needs none of the
+        # features below, so it can take the fast path.  Forgotten whenever one of them is turned
+        # on or off for the event.
+        self._plain = {}  # type: Dict[Any, bool]
+        # event => number of its subscriptions with max_calls, batching, or columnar.  Only
+        # events without any of them can take the fast path.
+        self._special = {}  # type: Dict[Any, int]
+        # Number of publications made.  Lets drain() notice deliveries queued while it waited.
+        self._publications = 0
+        # Number of deliveries queued by anything other than publish(), for drain() as well
+        self._scheduled = 0
+        #: :class:`~pubmarine.metrics.DispatchMetrics` when metrics are enabled, otherwise None
+        self.metrics = None  # type: Optional[DispatchMetrics]
+        #: :class:`~pubmarine.breaker.SlowSubscriberBreaker` when enabled, otherwise None
+        self.breaker = None  # type: Optional[SlowSubscriberBreaker]
+        #: :class:`~pubmarine.tracing.Tracer` when tracing is enabled, otherwise None
+        self.tracer = None  # type: Optional[Tracer]
+        #: :class:`~pubmarine.shedding.LoadShedder` when load shedding is enabled, otherwise None
+        self.shedder = None  # type: Optional[LoadShedder]
+        # event => aggregations of its publications
+        self._aggregations = {}  # type: Dict[Any, List[Aggregation]]
+        # Created when the first interceptor is added and dropped when the last is removed
+        self._interceptors = None  # type: Optional[Interceptors]
+        self._retention = {}  # type: Dict[Any, _Retention]
+        # Created the first time an event is published on a timer
+        self._timers = None  # type: Optional[TimerWheel]
+
+        # (chunk_size, time_budget) when large fan-outs are delivered in slices, otherwise None
+        self._fanout_limits = None  # type: Optional[Tuple[Optional[int], Optional[float]]]
+        # Deliveries of chunked publications that have not run yet, in publication order
+        self._fanout_queue = deque()  # type: Deque[Tuple[Any, Iterator[Callable[[], Any]]]]
+
+        self._responders = {}  # type: Dict[str, Callable[[], Any]]
+        self._next_request_id = self._id_generator()
+        self._pending_requests = {}  # type: Dict[int, asyncio.Future]
+        # Heap of (deadline, request_id).  One loop timer is armed for the earliest deadline.
+        self._request_deadlines = []  # type: List[Tuple[float, int]]
+        self._request_timer = None  # type: Optional[asyncio.TimerHandle]
+
+        # event => key => waiter id => (future, predicate)
+        self._waiters = {}  # type: Dict[Any, Dict[Any, Dict[int, Tuple[asyncio.Future, Any]]]]
+        self._next_waiter_id = self._id_generator()
 
     # This has to be a method because the ids increment per-instance.  We don't have to use self
     # because the generator itself maintains state.
@@ -89,16 +564,64 @@ class PubPen:
             yield i
             i += 1
 
-    def subscribe(self, event: str, callback: Union[Callable[..., Any], types.MethodType]) -> int:
+    def subscribe(self, event: Union[str, type],
+                  callback: Union[Callable[..., Any], types.MethodType],
+                  retained: bool = False, once: bool = False,
+                  max_calls: Optional[int] = None, handle: bool = False,
+                  batch_size: Optional[int] = None, max_delay: Optional[float] = None,
+                  columnar: bool = False, where: Optional[Callable[..., Any]] = None) -> int:
         """ Subscribe a callback to an event
 
-        :arg event: String name of an event to subscribe to
+        :arg event: String name of an event to subscribe to or a class of
+            event objects.  Subscribing to a class receives the publications
+            of instances of that class and of its subclasses.
         :callback: The function to call when the event is published.  This can
             be any python callable.
+        :kwarg retained: If True and the event is being retained (see
+            :meth:`PubPen.retain`), the callback is also queued to be called
+            with each retained publication, oldest first.  For a class, the
+            publications retained for that class are replayed, which include
+            the event objects of its subclasses.
+        :kwarg once: If True, only deliver the next publication of the event
+            and then unsubscribe.  The same as ``max_calls=1``.
+        :kwarg max_calls: If given, only deliver this many publications of
+            the event and then unsubscribe.  The subscription is removed when
+            the last publication is dispatched so no further deliveries are
+            queued for it.  Retained publications count towards the limit.
+            Unsubscribing the id still cancels the deliveries that are queued.
+        :kwarg handle: If True, return a :class:`Subscription` that can pause
+            and resume the subscription instead of a plain id.
+        :kwarg batch_size: If given, call the callback with a list of the
+            payloads of this many publications instead of once per
+            publication.
+        :kwarg max_delay: If given, call the callback with the payloads
+            collected so far this many seconds after the first of them was
+            published, even if there are fewer than ``batch_size`` of them.
+        :kwarg columnar: If True, call the callback with the columns given to
+            :meth:`publish_array` instead of once per value.  A columnar
+            subscription is not called by :meth:`publish`.
+        :kwarg where: A filter for a columnar or batching subscription.  It
+            is called with the arguments of each publication and only the
+            publications that it returns a true value for are delivered.  For
+            the NumPy arrays given to :meth:`publish_array` it is called once
+            with the whole columns and has to return a boolean mask, such as
+            ``lambda price: price > 100``.
+        :returns: The subscription id
 
         Use :func:`functools.partial` to call the callback with any other
         arguments.
 
+        A subscription with ``batch_size`` or ``max_delay`` is a batching
+        subscription.  Each publication is collapsed into one payload the
+        same way as for :class:`EventStream` and the callback is called with
+        a list of them.  Only one event loop callback is queued per batch.
+        Batches that are still being collected when the subscription is
+        unsubscribed are thrown away.  Batches are delivered directly, without
+        the delivery interceptors, metrics, tracing, or the slow subscriber
+        breaker, and batching cannot be combined with ``once`` or
+        ``max_calls``.  Neither can ``columnar``, which cannot be combined
+        with ``retained`` or batching either.
+
         .. note:: The callback is registered with the event each time this
             method is called.  The callback is called each time it has been
             registered when the event is published.  For example::
@@ -117,71 +640,1109 @@ class PubPen:
             If the caller wants the callback to only be called once, it is the
             caller's responsibility to only subscribe the callback once.
         """
-        if self._event_list and event not in self._event_list:
-            raise EventNotFoundError('{} is not a registered event'
-                                     .format(event))
+        return self._subscribe((event,), callback, retained, once, max_calls, handle,
+                               batch_size, max_delay, columnar, where)
+
+    def subscribe_many(self, events: Iterable[Union[str, type]],
+                       callback: Union[Callable[..., Any], types.MethodType],
+                       retained: bool = False, once: bool = False,
+                       max_calls: Optional[int] = None, handle: bool = False) -> int:
+        """ Subscribe a callback to several events with one subscription
+
+        :arg events: The events to subscribe to.  Each one is a string name
+            or a class of event objects, the same as for :meth:`subscribe`.
+        :callback: The function to call when any of the events is published.
+            The callback is not told which event it was so it should be able
+            to tell from the arguments if it needs to.
+        :kwarg retained: If True, the retained publications of each event are
+            queued for the callback, one event after the other.
+        :kwarg once: If True, only deliver the next publication of any of the
+            events and then unsubscribe.
+        :kwarg max_calls: If given, only deliver this many publications in
+            total and then unsubscribe.
+        :kwarg handle: If True, return a :class:`Subscription` instead of a
+            plain id.
+        :returns: The subscription id
+
+        This is cheaper than calling :meth:`subscribe` for each event.  The
+        events share one weak reference to the callback and one subscription
+        id.  Passing the id to :meth:`unsubscribe`, :meth:`pause`, or
+        :meth:`resume` applies to all of the events at once.
+        """
+        unique_events = []  # type: List[Union[str, type]]
+        for event in events:
+            if event not in unique_events:
+                unique_events.append(event)
+        if not unique_events:
+            raise ValueError('subscribe_many() needs at least one event')
+        return self._subscribe(tuple(unique_events), callback, retained, once, max_calls, handle)
+
+    def _subscribe(self, events: tuple, callback: Union[Callable[..., Any], types.MethodType],
+                   retained: bool, once: bool, max_calls: Optional[int], handle: bool,
+                   batch_size: Optional[int] = None, max_delay: Optional[float] = None,
+                   columnar: bool = False, where: Optional[Callable[..., Any]] = None) -> int:
+        if self._event_list:
+            for event in events:
+                if event not in self._event_list:
+                    raise EventNotFoundError('{} is not a registered event'
+                                             .format(event))
+
+        if once:
+            if max_calls not in (None, 1):
+                raise ValueError('once=True cannot be combined with max_calls={}'
+                                 .format(max_calls))
+            max_calls = 1
+        if max_calls is not None and max_calls < 1:
+            raise ValueError('max_calls must be at least 1')
+        batching = batch_size is not None or max_delay is not None
+        if batching:
+            if max_calls is not None:
+                raise ValueError('A batching subscription cannot be limited with once or'
+                                 ' max_calls')
+            if batch_size is not None and batch_size < 1:
+                raise ValueError('batch_size must be at least 1')
+            if max_delay is not None:
+                if max_delay <= 0:
+                    raise ValueError('max_delay must be greater than 0')
+                self._require_event_loop('max_delay')
+        if columnar and (max_calls is not None or batching or retained):
+            raise ValueError('A columnar subscription cannot be combined with once, max_calls,'
+                             ' retained, or batching')
+        if where is not None and not (columnar or batching):
+            raise ValueError('where can only filter a columnar or batching subscription')
 
         # Get an id for the subscription
         sub_id = next(self._next_id)
 
-        self._subscriptions[sub_id] = event
-        if isinstance(callback, types.MethodType):
-            # Add a method
-            self._event_handlers[event][sub_id] = WeakMethod(callback)
-        else:
-            # Add a function
-            self._event_handlers[event][sub_id] = ref(callback)
+        # A subscription to several events is recorded with the tuple of events
+        self._subscriptions[sub_id] = events[0] if len(events) == 1 else events
+        handler = _weak_callback(callback)
+        for event in events:
+            if isinstance(event, type) and event not in self._event_handlers:
+                # The classes that event objects are dispatched to have changed
+                self._type_dispatch.clear()
+            self._event_handlers[event][sub_id] = handler
 
+        limit = None
+        if max_calls is not None:
+            # Deliveries to a limited subscription check this record instead of the event's
+            # handlers so they still run after the subscription retires
+            limit = self._call_limits[sub_id] = [max_calls, _LimitHandlers({sub_id: handler})]
+        batch = None
+        if batching:
+            batch = self._batches[sub_id] = _Batch(self, sub_id, handler, batch_size, max_delay,
+                                                   where)
+        if columnar:
+            self._columnar[sub_id] = where
+        if limit is not None or batch is not None or columnar:
+            self._count_special(events, 1)
+
+        if retained and self._retention:
+            replays = [(event, args, kwargs) for event in events if event in self._retention
+                       for args, kwargs, dummy_size in self._retention[event].items]
+            for event, args, kwargs in replays:
+                if sub_id not in self._subscriptions:
+                    # Used up or unsubscribed, possibly by a callback that a scheduler ran
+                    # straight away
+                    break
+                if batch is not None:
+                    batch.add(args, kwargs)
+                    continue
+                target = self._event_handlers[event] if limit is None else limit[1]
+                if limit is not None:
+                    # Count the call before it can run, the same as publish()
+                    limit[0] -= 1
+                    if not limit[0]:
+                        self._retire(sub_id)
+                self._schedule(partial(_deliver, target, sub_id, handler, args, kwargs))
+
+        if handle:
+            return Subscription(self, sub_id)
         return sub_id
 
+    def stream(self, event: str, maxsize: int = 0, batch: Optional[int] = None) -> EventStream:
+        """ Iterate over the publications of an event asynchronously
+
+        :arg event: String name of the event to stream
+        :kwarg maxsize: Maximum number of items to buffer.  0, the default,
+            means unbounded.
+        :kwarg batch: If given, yield lists of up to this many items per
+            wakeup instead of single items
+        :returns: An :class:`EventStream` that is subscribed to the event
+        """
+        return EventStream(self, event, maxsize=maxsize, batch=batch)
+
+    def retain(self, event: Union[str, type], history: int = 1,
+               max_bytes: Optional[int] = None) -> None:
+        """ Keep recent publications of an event for late subscribers
+
+        :arg event: String name of the event to retain or a class of event
+            objects.  Retaining a class keeps the event objects of its
+            subclasses too.
+        :kwarg history: Number of publications to keep.  The default of 1
+            keeps only the last value.  0 stops retaining the event and
+            discards anything that was kept.
+        :kwarg max_bytes: If given, discard the oldest publications once
+            the estimated size of the retained arguments exceeds this many
+            bytes.  The most recent publication is always kept.
+
+        Subscribers that pass ``retained=True`` to :meth:`PubPen.subscribe`
+        receive the retained publications as soon as they subscribe instead
+        of waiting for the next time the event is published.
+        """
+        if self._event_list and event not in self._event_list:
+            raise EventNotFoundError('{} is not a registered event'
+                                     .format(event))
+
+        self._forget_plain(event)
+        if history <= 0:
+            self._retention.pop(event, None)
+            return
+
+        retention = _Retention(history, max_bytes)
+        old_retention = self._retention.get(event)
+        if old_retention is not None:
+            for args, kwargs, dummy_size in old_retention.items:
+                retention.add(args, kwargs)
+        self._retention[event] = retention
+
     def unsubscribe(self, sub_id: int) -> None:
         """Unsubscribe from an event.
 
         :arg sub_id: The subscription id returned from subscribe.
+
+        Deliveries to the subscription that were queued by earlier
+        publications but have not run yet are cancelled.
         """
         if sub_id in self._subscriptions:
-            event = self._subscriptions[sub_id]
+            events = _as_events(self._subscriptions[sub_id])
         else:
+            retired = self._retired.pop(sub_id, None)
+            if retired is not None:
+                # Used up its calls but the last deliveries are still queued
+                retired.clear()
             # It's okay, we just want the subscription to be gone
             return
 
-        for cur_sub_id in self._event_handlers[event]:
-            if cur_sub_id == sub_id:
-                del self._event_handlers[event][sub_id]
-                break
+        for event in events:
+            self._event_handlers[event].pop(sub_id, None)
+        special = False
+        limit = self._call_limits.pop(sub_id, None)
+        if limit is not None:
+            # Cancel the deliveries that are still queued
+            limit[1].clear()
+            special = True
+        if self._batches:
+            batch = self._batches.pop(sub_id, None)
+            if batch is not None:
+                batch.close()
+                special = True
+        if sub_id in self._columnar:
+            del self._columnar[sub_id]
+            special = True
+        if special:
+            self._count_special(events, -1)
+        if self._paused:
+            paused = self._paused.pop(sub_id, None)
+            if paused is not None and paused[1] is not None:
+                for event in events:
+                    self._release_held(event)
 
         del self._subscriptions[sub_id]
+        if self.breaker is not None:
+            self.breaker.forget(sub_id)
+
+    def pause(self, sub_id: int, keep_last: bool = False) -> None:
+        """ Stop delivering an event to a subscription until it is resumed
+
+        :arg sub_id: The subscription id returned from subscribe.
+        :kwarg keep_last: If True, the last publication of the event made
+            while the subscription is paused is delivered when it is resumed.
+            For a subscription to several events, the last publication of
+            each event is kept.
+
+        The subscription is taken out of the event's subscribers so
+        publishing does not look at it at all.  It keeps its id and does not
+        count towards ``max_calls`` while paused.  Deliveries to it that were
+        queued before it was paused are skipped if they come up while it is
+        still paused, except that the batches of a batching subscription are
+        kept and delivered when it is resumed.  ``keep_last`` does nothing for columnar
+        subscriptions.  Pausing a subscription that is already paused or
+        that does not exist does nothing.
+        """
+        if sub_id not in self._subscriptions or sub_id in self._paused:
+            return
+
+        events = _as_events(self._subscriptions[sub_id])
+        handler = self._event_handlers[events[0]][sub_id]
+        for event in events:
+            del self._event_handlers[event][sub_id]
+        limit = self._call_limits.get(sub_id)
+        if limit is not None:
+            del limit[1][sub_id]
+
+        serial = None
+        if keep_last:
+            for event in events:
+                self._forget_plain(event)
+                held = self._held.get(event)
+                if held is None:
+                    held = self._held[event] = [0, None]
+                held[0] += 1
+            serial = self._publications
+        self._paused[sub_id] = (handler, serial)
+
+    def resume(self, sub_id: int) -> None:
+        """ Deliver an event to a paused subscription again
+
+        :arg sub_id: The subscription id returned from subscribe.
+
+        The subscription is called after the event's other subscribers from
+        now on.  If it was paused with ``keep_last=True`` and the event was
+        published while it was paused, the last of those publications is
+        queued for it straight away.  A subscription to several events gets
+        the last publication of each of them, in the order they were
+        published.  The batches a batching subscription missed while it was
+        paused are queued before those.  Resuming a subscription that is not
+        paused does nothing.
+        """
+        paused = self._paused.pop(sub_id, None)
+        if paused is None:
+            return
+
+        handler, serial = paused
+        events = _as_events(self._subscriptions[sub_id])
+        for event in events:
+            self._event_handlers[event][sub_id] = handler
+        limit = self._call_limits.get(sub_id)
+        if limit is not None:
+            limit[1][sub_id] = handler
+        batch = self._batches.get(sub_id)
+        if batch is not None:
+            batch.release()
+        if serial is None or sub_id in self._columnar:
+            if serial is not None:
+                for event in events:
+                    self._release_held(event)
+            return
+
+        missed = []  # type: List[Tuple[Tuple[int, tuple, dict], Any]]
+        for event in events:
+            last = self._release_held(event)
+            # A subscription to a class and one of its bases holds an event object for both
+            if last is not None and last[0] > serial \
+                    and not any(last[0] == other[0][0] for other in missed):
+                missed.append((last, event))
+        for (dummy_serial, args, kwargs), event in sorted(missed, key=lambda item: item[0][0]):
+            if sub_id not in self._subscriptions:
+                # Used up or unsubscribed, possibly by a callback that a scheduler ran straight
+                # away
+                break
+            if batch is not None:
+                batch.add(args, kwargs)
+                continue
+            target = self._event_handlers[event] if limit is None else limit[1]
+            if limit is not None:
+                # Count the call before it can run, the same as publish()
+                limit[0] -= 1
+                if not limit[0]:
+                    self._retire(sub_id)
+            self._schedule(partial(_deliver, target, sub_id, handler, args, kwargs))
+
+    def _check_plain(self, event: Any) -> bool:
+        """Work out and remember whether publishing an event only has to deliver it
+
+        :arg event: The name of the event or the class of an event object
+        """
+        interceptors = self._interceptors
+        keys = event.__mro__ if isinstance(event, type) else (event,)
+        plain = ((interceptors is None or interceptors.for_event(event) == (None, None))
+                 and self.metrics is None and self.breaker is None
+                 and self.tracer is None and self.shedder is None
+                 and self._fanout_limits is None and not self._fanout_queue
+                 and not any(key in self._special or key in self._retention
+                             or key in self._held or key in self._aggregations
+                             or key in self._waiters for key in keys))
+        self._plain[event] = plain
+        return plain
+
+    def _forget_plain(self, event: Any) -> None:
+        """Make the next publication of an event work out again whether it can take the fast path"""
+        if isinstance(event, type):
+            # Event objects of its subclasses are published to the class's subscribers as well
+            for key in [key for key in self._plain
+                        if isinstance(key, type) and event in key.__mro__]:
+                del self._plain[key]
+        else:
+            self._plain.pop(event, None)
 
-    def publish(self, event: str, *args: Any, **kwargs: Any) -> None:
+    def _count_special(self, events: tuple, change: int) -> None:
+        """Count subscriptions that keep their events off the fast path in or out"""
+        special = self._special
+        for event in events:
+            count = special.get(event, 0) + change
+            if count:
+                special[event] = count
+            else:
+                del special[event]
+            self._forget_plain(event)
+
+    def _release_held(self, event: Any) -> Optional[Tuple[int, tuple, dict]]:
+        """Stop holding the last publication of an event for one paused subscription"""
+        held = self._held[event]
+        held[0] -= 1
+        if not held[0]:
+            del self._held[event]
+            self._forget_plain(event)
+        return held[1]
+
+    def _retire(self, sub_id: int) -> None:
+        """Remove a subscription that has used up its calls without cancelling its deliveries"""
+        subscribed = self._subscriptions.pop(sub_id, None)
+        if subscribed is None:
+            # Unsubscribed by a callback that a scheduler ran straight away
+            return
+        events = _as_events(subscribed)
+        for event in events:
+            self._event_handlers[event].pop(sub_id, None)
+        limit = self._call_limits.pop(sub_id, None)
+        if limit is not None:
+            self._retired[sub_id] = limit[1]
+            self._count_special(events, -1)
+        if self.breaker is not None:
+            self.breaker.forget(sub_id)
+
+    def publish(self, event: Any, *args: Any, **kwargs: Any) -> None:
         """ Publish an event
 
-        :arg event: String name of an event to publish
+        :arg event: String name of an event to publish or an event object.
+            An event object is delivered to the subscribers of its class and
+            of each of its base classes and is passed to the callback as the
+            first argument.
 
         Other args and keyword args are passed to the callback function.
+
+        Metrics, tracing, the slow subscriber breaker, and load shedding see
+        event objects under the name ``module.QualifiedClassName`` of their
+        class.  :meth:`retain`, :meth:`wait_for`, :meth:`aggregate`, and
+        :meth:`pause` with ``keep_last`` take the class itself and see the
+        event objects of its subclasses as well.
+        """
+        event_class = event.__class__
+        if event_class is str:
+            plain = self._plain.get(event)
+            if plain is None:
+                if self._event_list and event not in self._event_list:
+                    raise EventNotFoundError('{} is not a registered event'
+                                             .format(event))
+                plain = self._check_plain(event)
+            if plain:
+                # Nothing but delivery to do
+                self._publications += 1
+                handlers = self._event_handlers[event]
+                call_soon = self.loop.call_soon
+                dead = None  # type: Optional[List[Tuple[Dict, int]]]
+                for sub_id, handler in (tuple(handlers.items()) if self._reentrant
+                                        else handlers.items()):
+                    if handler() is None:
+                        if dead is None:
+                            dead = []
+                        dead.append((handlers, sub_id))
+                        continue
+                    call_soon(partial(_deliver, handlers, sub_id, handler, args, kwargs))
+                if dead is not None:
+                    self._remove_dead(dead)
+                return
+        elif not isinstance(event, str):
+            # The same for event objects, remembered per class
+            plain = self._plain.get(event_class)
+            if plain is None:
+                if event_class not in self._type_dispatch:
+                    # Checks that the class is allowed by the event list
+                    self._resolve_type(event_class)
+                plain = self._check_plain(event_class)
+            if plain:
+                resolved = self._type_dispatch.get(event_class)
+                if resolved is None:
+                    resolved = self._resolve_type(event_class)
+                self._publications += 1
+                args = (event,) + args
+                call_soon = self.loop.call_soon
+                dead = None
+                buckets = resolved[1]  # type: Tuple[Dict, ...]
+                # subscribe_many() to a class and one of its bases puts a subscription in two
+                # buckets
+                seen = set() if len(buckets) > 1 else None  # type: Optional[Set[int]]
+                for handlers in buckets:
+                    for sub_id, handler in (tuple(handlers.items()) if self._reentrant
+                                            else handlers.items()):
+                        if seen is not None:
+                            if sub_id in seen:
+                                continue
+                            seen.add(sub_id)
+                        if handler() is None:
+                            if dead is None:
+                                dead = []
+                            dead.append((handlers, sub_id))
+                            continue
+                        call_soon(partial(_deliver, handlers, sub_id, handler, args, kwargs))
+                if dead is not None:
+                    self._remove_dead(dead)
+                return
+
+        if isinstance(event, str):
+            if self._event_list and event not in self._event_list:
+                raise EventNotFoundError('{} is not a registered event'
+                                         .format(event))
+            name = event
+            buckets = (self._event_handlers[event],)
+            keys = (event,)  # type: tuple
+        else:
+            args = (event,) + args
+            event = event_class
+            resolved = self._type_dispatch.get(event)
+            if resolved is None:
+                resolved = self._resolve_type(event)
+            name, buckets = resolved
+            # Retention, held values, aggregations, and waiters for a class see its subclasses
+            keys = event.__mro__
+
+        interceptors = self._interceptors
+        intercept_delivery = None
+        if interceptors is not None:
+            intercept_publish, intercept_delivery = interceptors.for_event(event)
+            if intercept_publish is not None:
+                intercepted = intercept_publish(event, args, kwargs)
+                if intercepted is None:
+                    # Dropped by the interceptor
+                    return
+                args, kwargs = intercepted
+
+        self._publications += 1
+        if self._retention:
+            for key in keys:
+                if key in self._retention:
+                    self._retention[key].add(args, kwargs)
+        if self._held:
+            for key in keys:
+                if key in self._held:
+                    self._held[key][1] = (self._publications, args, kwargs)
+        if self._aggregations:
+            for key in keys:
+                for aggregation in self._aggregations.get(key, ()):
+                    aggregation.add(args, kwargs)
+
+        shedder = self.shedder
+        if shedder is not None and not shedder.admit(name):
+            if self.metrics is not None:
+                self.metrics.for_event(name).shed += 1
+            return
+
+        if self._waiters:
+            for key in keys:
+                if key in self._waiters:
+                    self._resolve_waiters(self._waiters[key], args, kwargs)
+
+        metrics = self.metrics
+        if metrics is not None:
+            stats = metrics.for_event(name)
+            stats.published += 1
+            queued = metrics.clock()
+
+        breaker = self.breaker
+        tracer = self.tracer
+        if tracer is not None:
+            span = tracer.publish_span(name)
+
+        # Once one publication has been chunked, later ones have to queue behind it so that each
+        # subscriber still sees the publications in order
+        limits = self._fanout_limits
+        chunked = bool(self._fanout_queue) or (
+            limits is not None and (limits[0] is None
+                                    or sum(len(handlers) for handlers in buckets) > limits[0]))
+        deliveries = []  # type: List[Callable[[], Any]]
+        schedule = deliveries.append if chunked else self.loop.call_soon  # type: Callable[..., Any]
+
+        call_limits = self._call_limits
+        batches = self._batches
+        columnar = self._columnar
+        removed = []  # type: List[Tuple[Dict, int]]
+        # subscribe_many() to a class and one of its bases puts a subscription in two buckets
+        seen = set() if len(buckets) > 1 else None
+        for handlers in buckets:
+            # A scheduler that runs callbacks straight away lets them subscribe and unsubscribe
+            # while we are still looping
+            for sub_id, handler in tuple(handlers.items()):
+                if seen is not None:
+                    if sub_id in seen:
+                        continue
+                    seen.add(sub_id)
+                # Check that the callback is still alive
+                if handler() is None:
+                    # Callback was deleted.  Cleanup the weakref as well
+                    removed.append((handlers, sub_id))
+                    continue
+                if batches and sub_id in batches:
+                    batches[sub_id].add(args, kwargs)
+                    continue
+                if columnar and sub_id in columnar:
+                    continue
+                limit = call_limits.get(sub_id) if call_limits else None
+                # The weakref is resolved again when the delivery runs so that unsubscribing cancels
+                # deliveries that are already queued
+                target = handlers if limit is None else limit[1]
+                if metrics is not None:
+                    func = partial(_deliver_measured, metrics, stats, queued, target, sub_id,
+                                   handler, args, kwargs)  # type: Callable[[], Any]
+                else:
+                    func = partial(_deliver, target, sub_id, handler, args, kwargs)
+                if intercept_delivery is not None:
+                    intercepted_func = intercept_delivery(event, sub_id, func)
+                    if intercepted_func is None:
+                        continue
+                    func = intercepted_func
+                if breaker is not None:
+                    guarded_func = breaker.wrap(name, sub_id, func)
+                    if guarded_func is None:
+                        # The subscriber has been suspended for being too slow
+                        continue
+                    func = guarded_func
+                if tracer is not None:
+                    func = tracer.wrap(span, name, sub_id, func,
+                                       partial(_subscribed, target, sub_id, handler))
+                if limit is not None:
+                    # Count the call before it can run so that publications made from the callback
+                    # see the subscription as used up
+                    limit[0] -= 1
+                    if not limit[0]:
+                        self._retire(sub_id)
+                schedule(func)
+
+        if deliveries:
+            self._queue_fanout(deliveries)
+
+        # Cleanup any handlers that are no longer around
+        if removed:
+            if metrics is not None:
+                stats.dead_handlers += len(removed)
+            self._remove_dead(removed)
+
+    def _remove_dead(self, removed: List[Tuple[Dict, int]]) -> None:
+        """Forget the subscriptions whose callbacks have been garbage collected"""
+        for handlers, sub_id in removed:
+            # Already gone if it was found in the handlers of two of the event's classes
+            handlers.pop(sub_id, None)
+            subscribed = self._subscriptions.pop(sub_id, None)
+            if type(subscribed) is tuple:
+                # Subscribed to other events as well
+                for other_event in subscribed:
+                    self._event_handlers[other_event].pop(sub_id, None)
+            if subscribed is not None and (sub_id in self._call_limits or sub_id in self._batches
+                                           or sub_id in self._columnar):
+                self._call_limits.pop(sub_id, None)
+                if sub_id in self._batches:
+                    self._batches.pop(sub_id).close()
+                self._columnar.pop(sub_id, None)
+                self._count_special(_as_events(subscribed), -1)
+            if self.breaker is not None:
+                self.breaker.forget(sub_id)
+
+    def publish_array(self, event: str, *columns: Sequence[Any]) -> None:
+        """ Publish an event once for each row of some columns of values
+
+        :arg event: String name of an event to publish
+        :arg columns: Sequences of the same length, such as
+            :class:`array.array` or NumPy arrays.  The event is published
+            once for each index with the values of the columns at that index
+            as its positional arguments.
+
+        This is the same as calling :meth:`publish` for each row, except that
+        some subscribers can take all of the rows at once:
+
+        * Subscriptions made with ``columnar=True`` are called once with the
+          columns themselves.
+        * :meth:`aggregate` adds up a column in one go.  With NumPy arrays
+          the sum, minimum, maximum, and histogram are computed by NumPy.
+        * Batching subscriptions get all of the rows added to their batch at
+          once.
+        * The ``where`` filters of those subscriptions pick out their rows
+          once for all of the columns.  With NumPy arrays the filter is
+          called with the columns and its mask selects the rows.
+
+        If anything else needs to see the rows one by one, such as an
+        ordinary subscriber, a retained or awaited event, interceptors,
+        metrics, tracing, or load shedding, :meth:`publish` is called for
+        each row and only the columnar subscriptions are called with the
+        columns.
         """
         if self._event_list and event not in self._event_list:
             raise EventNotFoundError('{} is not a registered event'
                                      .format(event))
+        if not columns:
+            raise ValueError('publish_array() needs at least one column')
+        length = len(columns[0])
+        if any(len(column) != length for column in columns):
+            raise ValueError('The columns must all be the same length')
+        if not length:
+            return
+
+        handlers = self._event_handlers.get(event, {})  # type: Dict[int, Callable[[], Any]]
+        columnar = self._columnar
+        batches = self._batches
+        row_by_row = (self._interceptors is not None or self.shedder is not None
+                      or self.metrics is not None or self.tracer is not None
+                      or event in self._retention or event in self._held
+                      or event in self._waiters
+                      or any(sub_id not in columnar and sub_id not in batches
+                             for sub_id in handlers))
+        if row_by_row:
+            for row in zip(*columns):
+                self.publish(event, *row)
+        else:
+            self._publications += 1
+            for aggregation in self._aggregations.get(event, ()):
+                aggregation.add_columns(columns)
 
-        removed_sub_ids = []
-        for sub_id, handler in self._event_handlers[event].items():
-            # Get the callback from the weakref
-            func = handler()
-            if func is None:
-                # Callback was deleted.  Cleanup the weakref as well
-                removed_sub_ids.append(sub_id)
+        dead = []
+        for sub_id, handler in tuple(handlers.items()):
+            if handlers.get(sub_id) is not handler:
+                # Unsubscribed by a callback that a scheduler ran straight away
                 continue
-            func = partial(func, *args, **kwargs)
+            if handler() is None:
+                dead.append(sub_id)
+            elif sub_id in columnar:
+                where = columnar[sub_id]
+                selected = columns if where is None else _select_rows(where, columns)
+                if selected is not None:
+                    self._schedule(partial(_deliver, handlers, sub_id, handler, selected, {}))
+            elif not row_by_row:
+                batch = batches[sub_id]
+                selected = columns if batch.where is None else _select_rows(batch.where, columns)
+                if selected is not None:
+                    # Each row becomes the payload publish() would have made of it
+                    batch.extend(selected[0] if len(selected) == 1 else zip(*selected))
+        for sub_id in dead:
+            self.unsubscribe(sub_id)
+
+    def _resolve_type(self, event_type: type) -> Tuple[str, Tuple[Dict, ...]]:
+        """Find the subscribers for a class of event objects from its MRO and cache them"""
+        mro = event_type.__mro__
+        if self._event_list and not any(cls in self._event_list for cls in mro):
+            raise EventNotFoundError('{} is not a registered event'.format(event_type))
+
+        event_handlers = self._event_handlers
+        name = '{}.{}'.format(event_type.__module__, event_type.__qualname__)
+        resolved = (name, tuple(event_handlers[cls] for cls in mro if cls in event_handlers))
+        self._type_dispatch[event_type] = resolved
+        return resolved
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """ Wait until the deliveries that are already queued have run
+
+        :kwarg timeout: If given, raise :exc:`asyncio.TimeoutError` if
+            deliveries are still queued after this many seconds.
+
+        This covers publications, retained and ``keep_last`` replays, full
+        batches, and columnar deliveries, including those queued by
+        callbacks while draining, for instance, because a callback published
+        another event or subscribed with ``retained=True``.
+
+        Anything that is still waiting on a timer is not waited for:
+        :meth:`publish_later`, :meth:`publish_at`, and :meth:`publish_every`
+        that are not due yet, aggregation windows, batches waiting for
+        ``max_delay``, and operator and join timeouts.  Neither are tasks
+        that callbacks start, such as coroutine responders.
+
+        This is mainly useful in tests::
+
+            pubpen.publish('test_event')
+            loop.run_until_complete(pubpen.drain())
+            assert callback.called
+        """
+        if timeout is not None:
+            await asyncio.wait_for(self._drain(), timeout)
+        else:
+            await self._drain()
+
+    async def _drain(self) -> None:
+        while True:
+            publications = self._publications
+            scheduled = self._scheduled
+            # Deliveries run in the order they were queued so once a callback queued after all of
+            # them has run, so have they
+            marker = self.loop.create_future()
+            self.loop.call_soon(_set_result_unless_done, marker)
+            await marker
+            if (publications == self._publications and scheduled == self._scheduled
+                    and not self._fanout_queue):
+                return
+
+    def enable_chunked_fanout(self, chunk_size: Optional[int] = 1000,
+                              time_budget: Optional[float] = None) -> None:
+        """ Deliver publications with many subscribers in slices
+
+        :kwarg chunk_size: Publications with more subscribers than this are
+            delivered at most this many callbacks per iteration of the event
+            loop.  If None, every publication is delivered in slices limited
+            only by ``time_budget``.
+        :kwarg time_budget: If given, a slice also ends once its callbacks
+            have run for this many seconds.  This needs an asyncio event
+            loop to tell the time.
+
+        Without chunking, publishing an event with 50,000 subscribers queues
+        50,000 callbacks at once and everything else the event loop has to
+        do, like reading from sockets, waits until they have all run.  With
+        chunking, the event loop gets to handle I/O between slices.  Each
+        subscriber still receives publications in the order they were made.
+        While slices are queued, retained and ``keep_last`` replays, batches,
+        and columnar deliveries queue behind them too.  Callbacks run with
+        the :mod:`contextvars` context of the code that published the event,
+        as they do when they are not chunked.
+        """
+        if chunk_size is None and time_budget is None:
+            raise ValueError('At least one of chunk_size and time_budget must be given')
+        if time_budget is not None:
+            self._require_event_loop('The time_budget of chunked fan-out')
+        self._fanout_limits = (chunk_size, time_budget)
+        self._plain.clear()
+
+    def disable_chunked_fanout(self) -> None:
+        """ Queue every delivery on the event loop at once again
+
+        Publications that are still being delivered in slices finish in the
+        next iteration of the event loop.
+        """
+        self._fanout_limits = None
+        self._plain.clear()
+
+    def _schedule(self, func: Callable[[], Any]) -> None:
+        """Queue a delivery made outside of publish() behind the deliveries already queued"""
+        self._scheduled += 1
+        if self._fanout_queue:
+            # Publications are being delivered in slices.  Don't overtake them.
+            self._queue_fanout((func,))
+        else:
             self.loop.call_soon(func)
 
-        # Cleanup any handlers that are no longer around
-        for sub_id in removed_sub_ids:
-            del self._event_handlers[event][sub_id]
-            try:
-                del self._subscriptions[sub_id]
-            except KeyError:
-                # It's okay.  We just want this gone.
-                pass
+    def _queue_fanout(self, deliveries: Iterable[Callable[[], Any]]) -> None:
+        """Queue deliveries to run in slices, in the context they were queued from"""
+        queue = self._fanout_queue
+        idle = not queue
+        # Like call_soon(), run the callbacks with the context variables of the publisher
+        context = copy_context() if copy_context is not None else None
+        queue.append((context, iter(deliveries)))
+        if idle:
+            # Queued after appending as a scheduler may run the slice straight away
+            self.loop.call_soon(self._run_fanout)
+
+    def _run_fanout(self) -> None:
+        """Run one slice of the queued deliveries"""
+        queue = self._fanout_queue
+        chunk_size, time_budget = self._fanout_limits or (None, None)
+        deadline = self.loop.time() + time_budget if time_budget is not None else None
+
+        run = 0
+        while queue:
+            context, funcs = queue[0]
+            for func in funcs:
+                try:
+                    if context is not None:
+                        context.run(func)
+                    else:
+                        func()
+                except Exception as e:  # pylint: disable=broad-except
+                    self.loop.call_exception_handler({
+                        'message': 'Exception in callback {!r}'.format(func),
+                        'exception': e,
+                    })
+                run += 1
+                if ((chunk_size is not None and run >= chunk_size)
+                        or (deadline is not None and self.loop.time() >= deadline)):
+                    break
+            else:
+                queue.popleft()
+                continue
+            break
+
+        if queue:
+            # Let the event loop handle I/O before the next slice
+            self.loop.call_soon(self._run_fanout)
+        elif self._fanout_limits is None:
+            # Chunking was disabled while publications were still queued
+            self._plain.clear()
+
+    def _require_event_loop(self, feature: str) -> None:
+        """Raise TypeError if the PubPen was given a scheduler instead of an event loop"""
+        if not hasattr(self.loop, 'call_at'):
+            raise TypeError('{} needs an asyncio event loop, not {!r}'.format(feature, self.loop))
+
+    def _timer_wheel(self) -> TimerWheel:
+        if self._timers is None:
+            self._require_event_loop('The timer wheel')
+            self._timers = TimerWheel(self.loop)
+        return self._timers
+
+    def publish_later(self, delay: float, event: str, *args: Any, **kwargs: Any) -> Timer:
+        """ Publish an event after a delay
+
+        :arg delay: Number of seconds to wait before publishing
+        :arg event: String name of an event to publish
+        :returns: A :class:`~pubmarine.timers.Timer`.  Call its
+            :meth:`~pubmarine.timers.Timer.cancel` method to keep the event
+            from being published.
+
+        Other args and keyword args are passed to the callback functions.
+
+        The delayed publications are kept in a
+        :class:`~pubmarine.timers.TimerWheel` so millions of them, for
+        instance, one per session to expire it, are cheap to schedule and
+        cancel.  They are published within 10ms after they are due.
+        """
+        self._require_event_loop('publish_later()')
+        return self.publish_at(self.loop.time() + delay, event, *args, **kwargs)
+
+    def publish_at(self, when: float, event: str, *args: Any, **kwargs: Any) -> Timer:
+        """ Publish an event at a point in time
+
+        :arg when: Time, according to the event loop's clock
+            (:meth:`asyncio.AbstractEventLoop.time`), to publish the event at
+        :arg event: String name of an event to publish
+        :returns: A :class:`~pubmarine.timers.Timer` that can be cancelled
+
+        Other args and keyword args are passed to the callback functions.
+        """
+        if self._event_list and event not in self._event_list:
+            raise EventNotFoundError('{} is not a registered event'
+                                     .format(event))
+        self._require_event_loop('publish_at()')
+
+        if kwargs:
+            return self._timer_wheel().call_at(when, partial(self.publish, event, *args, **kwargs))
+        return self._timer_wheel().call_at(when, self.publish, event, *args)
+
+    def publish_every(self, period: float, event: str, *args: Any, **kwargs: Any) -> Timer:
+        """ Publish an event periodically
+
+        :arg period: Number of seconds between publications.  The first
+            publication is one period from now.
+        :arg event: String name of an event to publish
+        :returns: A :class:`~pubmarine.timers.Timer`.  Cancel it to stop
+            publishing.
+
+        Other args and keyword args are passed to the callback functions.
+
+        Publications are scheduled relative to the time this method was
+        called so they do not drift even if the event loop is busy.  This
+        replaces sleeping and publishing in a loop::
+
+            pubpen.publish_every(1, 'heartbeat')
+        """
+        if self._event_list and event not in self._event_list:
+            raise EventNotFoundError('{} is not a registered event'
+                                     .format(event))
+        self._require_event_loop('publish_every()')
+
+        if kwargs:
+            return self._timer_wheel().call_every(period,
+                                                  partial(self.publish, event, *args, **kwargs))
+        return self._timer_wheel().call_every(period, self.publish, event, *args)
+
+    def enable_metrics(self, metrics: Optional[DispatchMetrics] = None) -> DispatchMetrics:
+        """ Start collecting dispatch metrics
+
+        :kwarg metrics: A :class:`~pubmarine.metrics.DispatchMetrics` to
+            record into.  If not given, a new one is created.
+        :returns: The :class:`~pubmarine.metrics.DispatchMetrics` that is
+            recording.  It is also available as :attr:`PubPen.metrics`.
+
+        While metrics are disabled, :meth:`PubPen.publish` only pays for
+        checking that they are disabled.
+        """
+        if metrics is None:
+            metrics = DispatchMetrics()
+        self.metrics = metrics
+        self._plain.clear()
+        return metrics
+
+    def disable_metrics(self) -> None:
+        """Stop collecting dispatch metrics"""
+        self.metrics = None
+        self._plain.clear()
+
+    def enable_breaker(self,
+                       breaker: Optional[SlowSubscriberBreaker] = None) -> SlowSubscriberBreaker:
+        """ Start timing callbacks and acting on slow subscribers
+
+        :kwarg breaker: A :class:`~pubmarine.breaker.SlowSubscriberBreaker`
+            configured with the latency budget and the action to take.  If
+            not given, one that only reports callbacks slower than 10ms is
+            created.
+        :returns: The :class:`~pubmarine.breaker.SlowSubscriberBreaker`.  It
+            is also available as :attr:`PubPen.breaker`.
+
+        With the :data:`~pubmarine.breaker.EXECUTOR` action, the callbacks
+        of tripped subscriptions run in a worker thread and must not call
+        the PubPen's methods directly.
+        """
+        if breaker is None:
+            breaker = SlowSubscriberBreaker()
+        if breaker.action == EXECUTOR:
+            self._require_event_loop('The EXECUTOR breaker action')
+        breaker.attach(self.loop)
+        self.breaker = breaker
+        self._plain.clear()
+        return breaker
+
+    def disable_breaker(self) -> None:
+        """Stop timing callbacks and deliver to every subscriber on the event loop again"""
+        self.breaker = None
+        self._plain.clear()
+
+    def enable_tracing(self, tracer: Optional[Tracer] = None) -> Tracer:
+        """ Start tracing publications and deliveries
+
+        :kwarg tracer: The :class:`~pubmarine.tracing.Tracer` to use.  If
+            not given, one that records into a
+            :class:`~pubmarine.tracing.RingBufferSink` is created.
+        :returns: The :class:`~pubmarine.tracing.Tracer`.  It is also
+            available as :attr:`PubPen.tracer`.
+        """
+        if tracer is None:
+            tracer = Tracer()
+        self.tracer = tracer
+        self._plain.clear()
+        return tracer
+
+    def disable_tracing(self) -> None:
+        """Stop tracing"""
+        self.tracer = None
+        self._plain.clear()
+
+    def enable_shedding(self, shedder: Optional[LoadShedder] = None) -> LoadShedder:
+        """ Start measuring the event loop's lag and shedding load when it is too high
+
+        :kwarg shedder: A :class:`~pubmarine.shedding.LoadShedder` configured
+            with the lag thresholds.  If not given, one with the default
+            thresholds is created.
+        :returns: The :class:`~pubmarine.shedding.LoadShedder`.  It is also
+            available as :attr:`PubPen.shedder`.
+
+        Only events marked as sheddable with
+        :meth:`~pubmarine.shedding.LoadShedder.mark` are shed.
+        """
+        self._require_event_loop('Load shedding')
+        if shedder is None:
+            shedder = LoadShedder()
+        if self.shedder is not None and self.shedder is not shedder:
+            self.shedder.detach()
+        shedder.attach(self.loop)
+        self.shedder = shedder
+        self._plain.clear()
+        return shedder
+
+    def disable_shedding(self) -> None:
+        """Stop measuring the lag and deliver every publication again"""
+        if self.shedder is not None:
+            self.shedder.detach()
+        self.shedder = None
+        self._plain.clear()
+
+    def aggregate(self, event: Union[str, type], callback: Callable[[Dict[str, Any]], Any],
+                  window: float, step: Optional[float] = None,
+                  value: Optional[Callable[..., float]] = None,
+                  bounds: Optional[Sequence[float]] = None,
+                  emit_empty: bool = False) -> Aggregation:
+        """ Summarize the publications of an event over time windows
+
+        :arg event: The event to aggregate.  For event objects, their class.
+            The event objects of its subclasses are aggregated as well.
+        :arg callback: Called with a summary dict at the end of each window
+        :arg window: Length of a window in seconds
+        :kwarg step: If given, summarize the last ``window`` seconds every
+            ``step`` seconds instead of once per window.  ``window`` must be a
+            whole number of steps.
+        :kwarg value: Called with the arguments of each publication to get
+            the number to aggregate.  Defaults to the first positional
+            argument.
+        :kwarg bounds: Histogram bucket upper bounds.  If given, the summary
+            has percentile estimates.
+        :kwarg emit_empty: If True, the callback is also called for windows
+            in which the event was not published
+        :returns: The :class:`~pubmarine.aggregation.Aggregation`.  Call its
+            ``close()`` method to stop aggregating.
+
+        The values are accumulated while the event is published, without
+        queueing a callback for each publication.  See
+        :mod:`pubmarine.aggregation` for what is in the summary.  Like
+        subscriptions, the aggregation only keeps a weak reference to the
+        callback.  It stops when the callback is garbage collected.
+        """
+        if self._event_list and event not in self._event_list:
+            raise EventNotFoundError('{} is not a registered event'
+                                     .format(event))
+        self._require_event_loop('aggregate()')
+
+        aggregation = Aggregation(self._timer_wheel(), event, _weak_callback(callback), window,
+                                  step=step, value=value, bounds=bounds, emit_empty=emit_empty,
+                                  on_close=self._remove_aggregation)
+        self._aggregations.setdefault(event, []).append(aggregation)
+        self._forget_plain(event)
+        return aggregation
+
+    def _remove_aggregation(self, aggregation: Aggregation) -> None:
+        aggregations = self._aggregations.get(aggregation.event, [])
+        if aggregation in aggregations:
+            aggregations.remove(aggregation)
+            if not aggregations:
+                del self._aggregations[aggregation.event]
+                self._forget_plain(aggregation.event)
+
+    def add_publish_interceptor(self, interceptor: PublishInterceptor,
+                                events: Optional[Iterable[Union[str, type]]] = None) -> None:
+        """ Run a function on each publication before it is delivered
+
+        :arg interceptor: Called with the event, the positional args, and the
+            keyword args of the publication.  It returns the ``(args, kwargs)``
+            to publish or None to drop the publication.
+        :kwarg events: If given, only intercept publications of these events.
+            Interceptors for a class of event objects also intercept its
+            subclasses.
+
+        See :mod:`pubmarine.interceptors` for details.
+        """
+        if self._interceptors is None:
+            self._interceptors = Interceptors()
+        self._interceptors.add_publish(interceptor, events)
+        self._plain.clear()
+
+    def add_delivery_interceptor(self, interceptor: DeliveryInterceptor,
+                                 events: Optional[Iterable[Union[str, type]]] = None) -> None:
+        """ Wrap each delivery of a publication to a subscriber
+
+        :arg interceptor: Called with the event, the subscription id, and a
+            function that runs the delivery.  It returns the function to queue
+            instead or None to skip the delivery.
+        :kwarg events: If given, only intercept deliveries of these events.
+
+        See :mod:`pubmarine.interceptors` for details.
+        """
+        if self._interceptors is None:
+            self._interceptors = Interceptors()
+        self._interceptors.add_delivery(interceptor, events)
+        self._plain.clear()
+
+    def remove_interceptor(self, interceptor: Callable[..., Any]) -> None:
+        """ Remove a publish or delivery interceptor
+
+        :arg interceptor: The interceptor to remove.  Removing one that was
+            never added does nothing.
+        """
+        if self._interceptors is None:
+            return
+        self._interceptors.remove(interceptor)
+        if not self._interceptors:
+            self._interceptors = None
+            self._plain.clear()
 
     def emit(self, event: str, *args: Any, **kwargs: Any) -> None:
         """ Publish an event
@@ -195,3 +1756,207 @@ class PubPen:
         warnings.warn('PubPen.emit() is deprecated.  Use PubPen.publish()'
                       ' instead', DeprecationWarning, stacklevel=2)
         self.publish(event, *args, **kwargs)
+
+    def respond(self, event: str, handler: Union[Callable[..., Any], types.MethodType]) -> None:
+        """ Register the handler that answers requests for an event
+
+        :arg event: String name of the event to answer requests for
+        :arg handler: The function to call when a request is made with
+            :meth:`PubPen.request`.  It is called with the request's
+            arguments and its return value is the reply.  If it returns an
+            awaitable, the reply is the awaitable's result.  Exceptions are
+            raised in the requester.
+
+        Each event has at most one responder.  Registering a new handler
+        replaces the old one.  Like subscriptions, only a weak reference to
+        the handler is kept.
+        """
+        if self._event_list and event not in self._event_list:
+            raise EventNotFoundError('{} is not a registered event'
+                                     .format(event))
+
+        self._responders[event] = _weak_callback(handler)
+
+    def stop_responding(self, event: str) -> None:
+        """ Remove the responder for an event
+
+        :arg event: String name of the event
+        """
+        self._responders.pop(event, None)
+
+    async def request(self, event: str, *args: Any, timeout: Optional[float] = None,
+                      **kwargs: Any) -> Any:
+        """ Make a request and wait for the reply
+
+        :arg event: String name of the event to make a request for
+        :kwarg timeout: If given, raise :exc:`asyncio.TimeoutError` if the
+            reply does not arrive within this many seconds.
+        :returns: The reply from the responder registered with
+            :meth:`PubPen.respond`
+        :raises NoResponderError: if no responder is registered for the event
+
+        Other args and keyword args are passed to the responder.
+        """
+        if self._event_list and event not in self._event_list:
+            raise EventNotFoundError('{} is not a registered event'
+                                     .format(event))
+
+        responder = self._responders.get(event)
+        handler = responder() if responder is not None else None
+        if handler is None:
+            self._responders.pop(event, None)
+            raise NoResponderError('{} has no responder'.format(event))
+
+        request_id = next(self._next_request_id)
+        future = self.loop.create_future()
+        self._pending_requests[request_id] = future
+        self.loop.call_soon(self._run_responder, request_id, handler, args, kwargs)
+
+        if timeout is not None:
+            self._add_request_deadline(self.loop.time() + timeout, request_id)
+
+        try:
+            return await future
+        finally:
+            self._pending_requests.pop(request_id, None)
+
+    def _run_responder(self, request_id: int, handler: Callable[..., Any], args: tuple,
+                       kwargs: dict) -> None:
+        future = self._pending_requests.get(request_id)
+        if future is None or future.done():
+            # The request timed out or was cancelled before we got to it
+            return
+
+        try:
+            result = handler(*args, **kwargs)
+        except Exception as e:  # pylint: disable=broad-except
+            future.set_exception(e)
+            return
+
+        if inspect.isawaitable(result):
+            task = asyncio.ensure_future(result, loop=self.loop)
+            task.add_done_callback(partial(self._finish_request, request_id))
+            # Don't leave the responder running if the request times out or is cancelled
+            future.add_done_callback(partial(_cancel_unless_done, task))
+        else:
+            future.set_result(result)
+
+    def _finish_request(self, request_id: int, task: asyncio.Future) -> None:
+        future = self._pending_requests.get(request_id)
+        if future is None or future.done():
+            return
+        if task.cancelled():
+            future.cancel()
+            return
+        exc = task.exception()
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(task.result())
+
+    def _add_request_deadline(self, deadline: float, request_id: int) -> None:
+        deadlines = self._request_deadlines
+        # Entries for requests that have already finished are left in the heap until they expire.
+        # Rebuild it if they start to dominate.
+        if len(deadlines) > 2 * len(self._pending_requests) + 1024:
+            deadlines[:] = [d for d in deadlines if d[1] in self._pending_requests]
+            heapq.heapify(deadlines)
+
+        heapq.heappush(deadlines, (deadline, request_id))
+        if deadlines[0][1] == request_id:
+            # This is now the earliest deadline
+            if self._request_timer is not None:
+                self._request_timer.cancel()
+            self._request_timer = self.loop.call_at(deadline, self._expire_requests)
+
+    def _expire_requests(self) -> None:
+        self._request_timer = None
+        deadlines = self._request_deadlines
+        now = self.loop.time()
+        while deadlines and deadlines[0][0] <= now:
+            dummy_deadline, request_id = heapq.heappop(deadlines)
+            future = self._pending_requests.pop(request_id, None)
+            if future is not None and not future.done():
+                future.set_exception(asyncio.TimeoutError())
+
+        if deadlines:
+            self._request_timer = self.loop.call_at(deadlines[0][0], self._expire_requests)
+
+    async def wait_for(self, event: Union[str, type],
+                       predicate: Optional[Callable[..., bool]] = None,
+                       timeout: Optional[float] = None, key: Any = _ANY_KEY) -> Any:
+        """ Wait for the next publication of an event
+
+        :arg event: String name of the event to wait for or a class of event
+            objects.  Event objects of its subclasses are accepted too.
+        :kwarg predicate: If given, only publications for which
+            ``predicate(*args, **kwargs)`` returns True are accepted.
+        :kwarg timeout: If given, raise :exc:`asyncio.TimeoutError` if no
+            matching publication arrives within this many seconds.
+        :kwarg key: If given, only publications whose first positional
+            argument equals ``key`` are accepted.  Waiters with a key are
+            indexed by it so publications only have to look at the waiters
+            for their own key.
+        :returns: The publication, collapsed into a single value the same
+            way as the items of an :class:`EventStream`
+
+        Waiting does not create a subscription.  Waiters are resolved
+        directly by :meth:`PubPen.publish`.
+        """
+        if self._event_list and event not in self._event_list:
+            raise EventNotFoundError('{} is not a registered event'
+                                     .format(event))
+
+        future = self.loop.create_future()
+        waiter_id = next(self._next_waiter_id)
+        event_waiters = self._waiters.setdefault(event, {})
+        self._forget_plain(event)
+        event_waiters.setdefault(key, {})[waiter_id] = (future, predicate)
+
+        timer = None
+        if timeout is not None:
+            timer = self.loop.call_later(timeout, _expire_waiter, future)
+
+        try:
+            return await future
+        finally:
+            if timer is not None:
+                timer.cancel()
+            # If we weren't resolved by publish(), we have to remove ourselves
+            key_waiters = event_waiters.get(key)
+            if key_waiters is not None:
+                key_waiters.pop(waiter_id, None)
+                if not key_waiters:
+                    del event_waiters[key]
+            if not event_waiters and self._waiters.get(event) is event_waiters:
+                del self._waiters[event]
+                self._forget_plain(event)
+
+    def _resolve_waiters(self, event_waiters: Dict[Any, Dict[int, Tuple[asyncio.Future, Any]]],
+                         args: tuple, kwargs: dict) -> None:
+        buckets = []
+        if _ANY_KEY in event_waiters:
+            buckets.append(event_waiters[_ANY_KEY])
+        if args:
+            try:
+                if args[0] in event_waiters:
+                    buckets.append(event_waiters[args[0]])
+            except TypeError:
+                # Unhashable values can't be keys
+                pass
+
+        payload = _payload(args, kwargs)
+        for waiters in buckets:
+            for waiter_id, (future, predicate) in list(waiters.items()):
+                if future.done():
+                    continue
+                if predicate is not None:
+                    try:
+                        if not predicate(*args, **kwargs):
+                            continue
+                    except Exception as e:  # pylint: disable=broad-except
+                        future.set_exception(e)
+                        del waiters[waiter_id]
+                        continue
+                future.set_result(payload)
+                del waiters[waiter_id]
@@ -0,0 +1,216 @@
+# This file is part of PubMarine.
+#
+# PubMarine is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Foobar is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PubMarine.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Summarize high rate events over time windows.
+
+A subscriber that only keeps a running total of a counter or gauge event still costs one queued
+callback per publication.  An :class:`Aggregation` does the accumulation inside
+:meth:`~pubmarine.PubPen.publish` instead and calls its callback once per window with a summary::
+
+    def report(summary):
+        print('{count} requests, p99 {p99}s'.format(**summary))
+
+    pubpen.aggregate('request_time', report, window=10, bounds=DEFAULT_BOUNDS)
+
+The summary is a dict with the ``event``, the loop times at the ``start`` and ``end`` of the
+window, and the ``count``, ``sum``, ``min``, ``max``, and ``mean`` of the values published in the
+window.  If histogram ``bounds`` were given, it also has ``p50``, ``p90``, and ``p99`` estimates
+from a :class:`~pubmarine.metrics.Histogram`.
+
+Windows are tumbling by default: each publication is counted in exactly one window.  With a
+``step`` shorter than the ``window``, the window slides: a summary of the last ``window`` seconds is
+made every ``step`` seconds.  The values are kept in one set of counters per step so a sliding
+window costs the same per publication as a tumbling one.
+"""
+
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Sequence
+
+from .metrics import Histogram
+
+try:
+    import numpy  # type: ignore
+except ImportError:  # pragma: no cover
+    # Optional.  Columns from publish_array() are added up in Python without it.
+    numpy = None  # type: ignore
+
+
+class _Pane:
+    """The values published during one step"""
+    __slots__ = ('count', 'total', 'minimum', 'maximum', 'histogram')
+
+    def __init__(self, bounds: Optional[Sequence[float]]) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float('inf')
+        self.maximum = float('-inf')
+        self.histogram = None if bounds is None else Histogram(bounds)
+
+
+class Aggregation:
+    """
+    An aggregation subscription to an event.
+
+    Create one with :meth:`pubmarine.PubPen.aggregate`.
+    """
+    def __init__(self, wheel: Any, event: Any, handler: Callable[[], Any], window: float,
+                 step: Optional[float] = None,
+                 value: Optional[Callable[..., float]] = None,
+                 bounds: Optional[Sequence[float]] = None,
+                 emit_empty: bool = False,
+                 on_close: Optional[Callable[['Aggregation'], None]] = None) -> None:
+        """
+        :arg wheel: The :class:`~pubmarine.timers.TimerWheel` to close the
+            windows on
+        :arg event: The event being aggregated
+        :arg handler: Weak reference to the callback
+        :arg window: Length of a window in seconds
+        :kwarg step: Seconds between summaries.  Must divide ``window``
+            evenly.  Defaults to ``window``.
+        :kwarg value: Called with the arguments of each publication to get
+            the number to aggregate.  Defaults to the first positional
+            argument.
+        :kwarg bounds: Histogram bucket bounds for percentile estimates
+        :kwarg emit_empty: If True, also call the callback for windows
+            without any publications
+        :kwarg on_close: Called with the aggregation when it is closed
+        """
+        if window <= 0:
+            raise ValueError('window must be greater than 0')
+        if step is None:
+            step = window
+        if step <= 0 or step > window:
+            raise ValueError('step must be greater than 0 and no longer than the window')
+        panes = int(round(window / step))
+        if abs(panes * step - window) > 1e-9 * window:
+            raise ValueError('window must be a whole number of steps')
+
+        self.event = event
+        self.window = window
+        self.step = step
+        self.value = value
+        self.bounds = None if bounds is None else tuple(bounds)
+        self.emit_empty = emit_empty
+        self._handler = handler
+        self._on_close = on_close
+        self._loop = wheel.loop
+
+        #: The values published in the current step
+        self._current = _Pane(self.bounds)
+        # The steps before the current one that are still in the window
+        self._previous = deque(maxlen=panes - 1)  # type: Deque[_Pane]
+        self._timer = wheel.call_every(step, self._tick)  # type: Any
+
+    def add(self, args: tuple, kwargs: dict) -> None:
+        """Count a publication.  Called by :meth:`~pubmarine.PubPen.publish`."""
+        value = args[0] if self.value is None else self.value(*args, **kwargs)
+        pane = self._current
+        pane.count += 1
+        pane.total += value
+        if value < pane.minimum:
+            pane.minimum = value
+        if value > pane.maximum:
+            pane.maximum = value
+        if pane.histogram is not None:
+            pane.histogram.observe(value)
+
+    def add_columns(self, columns: Sequence[Sequence[Any]]) -> None:
+        """Count the rows of :meth:`~pubmarine.PubPen.publish_array`"""
+        if self.value is not None:
+            for row in zip(*columns):
+                self.add(row, {})
+            return
+
+        values = columns[0]
+        pane = self._current
+        histogram = pane.histogram
+        if numpy is not None and isinstance(values, numpy.ndarray):
+            total = float(values.sum())
+            minimum = values.min().item()
+            maximum = values.max().item()
+            if histogram is not None:
+                counts = numpy.bincount(numpy.searchsorted(histogram.bounds, values),
+                                        minlength=len(histogram.counts))
+                histogram.counts = [mine + int(theirs) for mine, theirs
+                                    in zip(histogram.counts, counts)]
+                histogram.count += len(values)
+                histogram.total += total
+        else:
+            total = sum(values)
+            minimum = min(values)
+            maximum = max(values)
+            if histogram is not None:
+                for value in values:
+                    histogram.observe(value)
+
+        pane.count += len(values)
+        pane.total += total
+        if minimum < pane.minimum:
+            pane.minimum = minimum
+        if maximum > pane.maximum:
+            pane.maximum = maximum
+
+    def summary(self) -> Dict[str, Any]:
+        """Summarize the values in the window so far"""
+        panes = list(self._previous)
+        panes.append(self._current)
+        count = sum(pane.count for pane in panes)
+        total = sum(pane.total for pane in panes)
+        end = self._loop.time()
+        summary = {'event': self.event,
+                   'start': end - self.window,
+                   'end': end,
+                   'count': count,
+                   'sum': total,
+                   'min': min(pane.minimum for pane in panes) if count else None,
+                   'max': max(pane.maximum for pane in panes) if count else None,
+                   'mean': total / count if count else None}  # type: Dict[str, Any]
+        if self.bounds is not None:
+            histogram = Histogram(self.bounds)
+            for pane in panes:
+                if pane.histogram is not None:
+                    histogram.counts = [mine + theirs for mine, theirs
+                                        in zip(histogram.counts, pane.histogram.counts)]
+            histogram.count = count
+            histogram.total = total
+            summary['p50'] = histogram.percentile(0.5)
+            summary['p90'] = histogram.percentile(0.9)
+            summary['p99'] = histogram.percentile(0.99)
+        return summary
+
+    def _tick(self) -> None:
+        callback = self._handler()
+        if callback is None:
+            self.close()
+            return
+
+        summary = self.summary()
+        if self._previous.maxlen:
+            self._previous.append(self._current)
+        self._current = _Pane(self.bounds)
+        if summary['count'] or self.emit_empty:
+            callback(summary)
+
+    def close(self) -> None:
+        """Stop aggregating"""
+        if self._timer is None:
+            return
+        self._timer.cancel()
+        self._timer = None
+        if self._on_close is not None:
+            self._on_close(self)
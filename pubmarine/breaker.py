@@ -0,0 +1,197 @@
+# This file is part of PubMarine.
+#
+# PubMarine is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Foobar is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PubMarine.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Detect slow subscribers and keep them from slowing down everyone else.
+
+Every delivery of every event runs on the same event loop so a single callback that takes too long
+delays every delivery queued behind it.  A :class:`SlowSubscriberBreaker` times callbacks,
+reports the subscriptions whose callbacks go over a latency budget and, optionally, takes repeat
+offenders out of the event loop until they recover::
+
+    breaker = pubpen.enable_breaker(SlowSubscriberBreaker(budget=0.005, action=SUSPEND))
+"""
+
+import time
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+#: Only report slow subscribers
+REPORT = 'report'
+#: Stop delivering events to a slow subscriber until its cooldown has passed
+SUSPEND = 'suspend'
+#: Run a slow subscriber's callbacks in an executor until its cooldown has passed.  They then run
+#: in another thread and must not call into the PubPen directly.
+EXECUTOR = 'executor'
+
+
+class _Offender:
+    """What we know about a subscription that has been slow"""
+    __slots__ = ('event', 'strikes', 'slow_calls', 'worst', 'trips', 'skipped', 'until', 'action')
+
+    def __init__(self, event: str) -> None:
+        self.event = event
+        # Consecutive slow calls
+        self.strikes = 0
+        self.slow_calls = 0
+        self.worst = 0.0
+        self.trips = 0
+        self.skipped = 0
+        # While tripped, the time at which the subscription gets another chance
+        self.until = None  # type: Optional[float]
+        self.action = REPORT
+
+    def report(self) -> Dict[str, Any]:
+        return {'event': self.event,
+                'slow_calls': self.slow_calls,
+                'worst': self.worst,
+                'trips': self.trips,
+                'skipped': self.skipped,
+                'status': self.action if self.until is not None else 'active'}
+
+
+class SlowSubscriberBreaker:
+    """
+    Time deliveries and act on subscriptions whose callbacks are too slow.
+
+    A callback that runs longer than ``budget`` seconds is recorded as slow.  After ``trip_after``
+    slow calls in a row, the breaker trips for that subscription and applies ``action``:
+
+    * :data:`REPORT`: Only record it.  This is the default.
+    * :data:`SUSPEND`: Skip the subscription when publishing until ``cooldown`` seconds have passed.
+    * :data:`EXECUTOR`: Run the subscription's callbacks with
+      :meth:`asyncio.AbstractEventLoop.run_in_executor` until ``cooldown`` seconds have passed.
+
+    When the cooldown is over the subscription goes back to being delivered on the event loop.  If
+    it is still slow, it will trip again.
+
+    .. warning:: With :data:`EXECUTOR`, the callbacks of a tripped subscription run in a worker
+        thread.  :class:`~pubmarine.PubPen` is not thread-safe, so those callbacks must not call
+        its methods directly.  Hand them to the event loop instead, for instance with
+        ``pubpen.loop.call_soon_threadsafe(pubpen.publish, 'event', value)``.  Only use
+        :data:`EXECUTOR` for subscriptions whose callbacks are safe to run in another thread.
+    """
+    def __init__(self, budget: float = 0.01, trip_after: int = 3, action: str = REPORT,
+                 cooldown: float = 5.0, sample_every: int = 1,
+                 on_slow: Optional[Callable[[str, int, float], Any]] = None, executor: Any = None,
+                 clock: Callable[[], float] = time.perf_counter) -> None:
+        """
+        :kwarg budget: Number of seconds a callback may take before it is considered slow
+        :kwarg trip_after: Number of consecutive slow calls that trip the breaker
+        :kwarg action: What to do when the breaker trips.  One of :data:`REPORT`,
+            :data:`SUSPEND`, or :data:`EXECUTOR`.
+        :kwarg cooldown: Number of seconds a tripped subscription is kept out of the event loop
+        :kwarg sample_every: Only time one out of this many deliveries.  Subscriptions that have
+            been slow are always timed.
+        :kwarg on_slow: If given, called with the event name, the subscription id, and the
+            duration each time a callback is slow.
+        :kwarg executor: Executor to use for the :data:`EXECUTOR` action.  The loop's default
+            executor is used if not given.
+        :kwarg clock: Function returning the current time in seconds
+        """
+        if action not in (REPORT, SUSPEND, EXECUTOR):
+            raise ValueError('{} is not a valid action'.format(action))
+        self.budget = budget
+        self.trip_after = trip_after
+        self.action = action
+        self.cooldown = cooldown
+        self.sample_every = sample_every
+        self.on_slow = on_slow
+        self.executor = executor
+        self.clock = clock
+        self.loop = None  # type: Any
+
+        self._offenders = {}  # type: Dict[int, _Offender]
+        self._deliveries = 0
+
+    def attach(self, loop: Any) -> None:
+        """Set the event loop that the :data:`EXECUTOR` action hands callbacks to"""
+        self.loop = loop
+
+    def wrap(self, event: str, sub_id: int,
+             func: Callable[[], Any]) -> Optional[Callable[[], Any]]:
+        """ Prepare a delivery
+
+        :arg event: The event being published
+        :arg sub_id: The subscription being delivered to
+        :arg func: The delivery
+        :returns: The delivery to queue, possibly timed or redirected to an executor.  None if
+            the subscription is suspended and should be skipped.
+        """
+        offender = self._offenders.get(sub_id)
+        if offender is not None:
+            if offender.until is not None:
+                if self.clock() < offender.until:
+                    if offender.action == SUSPEND:
+                        offender.skipped += 1
+                        return None
+                    return partial(self._run_in_executor, func)
+                # Cooled down.  Give it another chance on the event loop.
+                offender.until = None
+                offender.strikes = 0
+            return partial(self._timed, event, sub_id, func)
+
+        self._deliveries += 1
+        if self._deliveries >= self.sample_every:
+            self._deliveries = 0
+            return partial(self._timed, event, sub_id, func)
+        return func
+
+    def _run_in_executor(self, func: Callable[[], Any]) -> Any:
+        return self.loop.run_in_executor(self.executor, func)
+
+    def _timed(self, event: str, sub_id: int, func: Callable[[], Any]) -> Any:
+        clock = self.clock
+        start = clock()
+        try:
+            return func()
+        finally:
+            duration = clock() - start
+            if duration > self.budget:
+                self._record_slow(event, sub_id, duration)
+            elif sub_id in self._offenders:
+                self._offenders[sub_id].strikes = 0
+
+    def _record_slow(self, event: str, sub_id: int, duration: float) -> None:
+        offender = self._offenders.get(sub_id)
+        if offender is None:
+            offender = self._offenders[sub_id] = _Offender(event)
+        offender.strikes += 1
+        offender.slow_calls += 1
+        if duration > offender.worst:
+            offender.worst = duration
+
+        if self.on_slow is not None:
+            self.on_slow(event, sub_id, duration)
+
+        if self.action != REPORT and offender.strikes >= self.trip_after:
+            offender.trips += 1
+            offender.action = self.action
+            offender.until = self.clock() + self.cooldown
+
+    def forget(self, sub_id: int) -> None:
+        """Drop what is known about a subscription, for instance, when it is unsubscribed"""
+        self._offenders.pop(sub_id, None)
+
+    def offenders(self) -> Dict[int, Dict[str, Any]]:
+        """ Report the subscriptions that have been slow
+
+        :returns: A dict mapping subscription ids to a dict with the event, the number of slow
+            calls, the worst duration, the number of times the breaker tripped, the number of
+            deliveries skipped while suspended, and the current status.
+        """
+        return {sub_id: offender.report() for sub_id, offender in self._offenders.items()}
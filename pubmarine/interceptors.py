@@ -0,0 +1,150 @@
+# This file is part of PubMarine.
+#
+# PubMarine is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Foobar is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PubMarine.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Run code around every publication and delivery.
+
+A publish interceptor is called with the event, the positional arguments, and the keyword
+arguments of each publication before anything else is done with it.  It returns the
+``(args, kwargs)`` to publish, which may be changed, or None to drop the publication.  Exceptions
+it raises propagate to the caller of :meth:`~pubmarine.PubPen.publish`::
+
+    def redact(event, args, kwargs):
+        kwargs.pop('password', None)
+        return args, kwargs
+
+    pubpen.add_publish_interceptor(redact, events=['login'])
+
+A delivery interceptor is called once for each subscriber with the event, the subscription id,
+and a function that takes no arguments and runs the delivery.  It returns the function to queue in
+its place, usually one that calls the function it was given, or None to skip the delivery::
+
+    def only_every_tenth(event, sub_id, deliver):
+        return deliver if next(counter) % 10 == 0 else None
+
+    pubpen.add_delivery_interceptor(only_every_tenth, events=['mouse_moved'])
+
+The event is the name the event was published with or, for event objects, their class.
+Interceptors run in the order they were added.  For delivery interceptors that means the first
+one added wraps the functions returned by the ones added after it.
+
+Delivery interceptors only see deliveries queued by :meth:`~pubmarine.PubPen.publish`, not the
+replays of retained publications when subscribing or resuming.  Those were already seen by the
+publish interceptors when they were first published.
+
+The interceptors that apply to an event are combined into one function per event the first time
+the event is published after the interceptors change.  Events that no interceptor applies to are
+published exactly as if there were no interceptors.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+#: Called with ``(event, args, kwargs)`` and returns ``(args, kwargs)`` or None
+PublishInterceptor = Callable[[Any, tuple, dict], Optional[Tuple[tuple, dict]]]
+#: Called with ``(event, sub_id, deliver)`` and returns a function to queue or None
+DeliveryInterceptor = Callable[[Any, int, Callable[[], Any]], Optional[Callable[[], Any]]]
+
+_Compiled = Tuple[Optional[PublishInterceptor], Optional[DeliveryInterceptor]]
+
+
+def _chain_publish(interceptors: List[PublishInterceptor]) -> PublishInterceptor:
+    if len(interceptors) == 1:
+        return interceptors[0]
+
+    def intercept(event: Any, args: tuple, kwargs: dict) -> Optional[Tuple[tuple, dict]]:
+        for interceptor in interceptors:
+            result = interceptor(event, args, kwargs)
+            if result is None:
+                return None
+            args, kwargs = result
+        return args, kwargs
+    return intercept
+
+
+def _chain_delivery(interceptors: List[DeliveryInterceptor]) -> DeliveryInterceptor:
+    if len(interceptors) == 1:
+        return interceptors[0]
+    # The innermost interceptor is applied first
+    interceptors = interceptors[::-1]
+
+    def intercept(event: Any, sub_id: int,
+                  deliver: Callable[[], Any]) -> Optional[Callable[[], Any]]:
+        for interceptor in interceptors:
+            wrapped = interceptor(event, sub_id, deliver)
+            if wrapped is None:
+                return None
+            deliver = wrapped
+        return deliver
+    return intercept
+
+
+class Interceptors:
+    """
+    The interceptors added to a :class:`~pubmarine.PubPen`.
+
+    Use :meth:`~pubmarine.PubPen.add_publish_interceptor`,
+    :meth:`~pubmarine.PubPen.add_delivery_interceptor`, and
+    :meth:`~pubmarine.PubPen.remove_interceptor` rather than creating one directly.
+    """
+    def __init__(self) -> None:
+        # (interceptor, events it applies to or None for all of them)
+        self._publish = []  # type: List[Tuple[PublishInterceptor, Optional[frozenset]]]
+        self._delivery = []  # type: List[Tuple[DeliveryInterceptor, Optional[frozenset]]]
+        # event => (publish interceptor, delivery interceptor) combined for that event
+        self._compiled = {}  # type: Dict[Any, _Compiled]
+
+    def __len__(self) -> int:
+        """Return the number of interceptors"""
+        return len(self._publish) + len(self._delivery)
+
+    def add_publish(self, interceptor: PublishInterceptor,
+                    events: Optional[Iterable[Any]] = None) -> None:
+        """Add an interceptor for publications of ``events`` or of every event if None"""
+        self._publish.append((interceptor, None if events is None else frozenset(events)))
+        self._compiled.clear()
+
+    def add_delivery(self, interceptor: DeliveryInterceptor,
+                     events: Optional[Iterable[Any]] = None) -> None:
+        """Add an interceptor for deliveries of ``events`` or of every event if None"""
+        self._delivery.append((interceptor, None if events is None else frozenset(events)))
+        self._compiled.clear()
+
+    def remove(self, interceptor: Callable[..., Any]) -> None:
+        """Remove every registration of an interceptor"""
+        self._publish = [entry for entry in self._publish if entry[0] != interceptor]
+        self._delivery = [entry for entry in self._delivery if entry[0] != interceptor]
+        self._compiled.clear()
+
+    def for_event(self, event: Any) -> _Compiled:
+        """ Return the interceptors for an event combined into one of each kind
+
+        :arg event: The name of the event or the class of an event object.
+            Interceptors added for a class also apply to its subclasses.
+        :returns: A tuple of the publish interceptor and the delivery
+            interceptor.  Either is None if no interceptors of that kind
+            apply to the event.
+        """
+        compiled = self._compiled.get(event)
+        if compiled is None:
+            keys = event.__mro__ if isinstance(event, type) else (event,)
+            publish = [interceptor for interceptor, events in self._publish
+                       if events is None or any(key in events for key in keys)]
+            delivery = [interceptor for interceptor, events in self._delivery
+                        if events is None or any(key in events for key in keys)]
+            compiled = self._compiled[event] = (_chain_publish(publish) if publish else None,
+                                                _chain_delivery(delivery) if delivery else None)
+        return compiled
@@ -0,0 +1,194 @@
+# This file is part of PubMarine.
+#
+# PubMarine is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Foobar is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PubMarine.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Pair up the publications of two events by a key.
+
+A :class:`Join` waits for a publication of each event with the same key and publishes the pair as
+a new event.  If the other half does not arrive within the timeout, the half that did arrive is
+published as a timed out event instead::
+
+    join = Join(pubpen, 'request_sent', 'response_received', 'request_done', timeout=30,
+                timeout_event='request_lost')
+
+    def done(request_id, request, response):
+        ...
+
+    def lost(request_id, request, response):
+        # response is None.  request would be None if a response came without a request.
+        ...
+
+The key of a publication is its first positional argument unless a function to compute it is
+given.  The halves are the single values that :class:`~pubmarine.EventStream` would produce for
+the publications.
+
+Every join has the same timeout so the halves waiting for their other half are kept in the order
+they expire in.  Expiring them takes a single timer on the :class:`~pubmarine.PubPen`'s
+:class:`~pubmarine.timers.TimerWheel` for the oldest one rather than one timer per key, and the
+memory used levels off at the number of keys that arrive within one timeout.  ``max_pending``
+caps it lower than that.
+
+:class:`~pubmarine.PubPen` only keeps weak references to callbacks.  Keep the :class:`Join` for as
+long as it should run and call :meth:`Join.close` to stop it.
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+from . import EventNotFoundError, PubPen, _payload
+
+
+_LEFT = 0
+_RIGHT = 1
+
+#: (side, value, deadline) of a half that is waiting for its other half
+_Pending = Tuple[int, Any, float]
+
+
+class Join:
+    """
+    Publish pairs of publications of two events that have the same key.
+    """
+    def __init__(self, pubpen: PubPen, left: Any, right: Any, result_event: str,
+                 timeout: float, left_key: Optional[Callable[..., Any]] = None,
+                 right_key: Optional[Callable[..., Any]] = None,
+                 timeout_event: Optional[str] = None, max_pending: Optional[int] = None,
+                 overflow: str = 'evict') -> None:
+        """
+        :arg pubpen: The :class:`~pubmarine.PubPen` to subscribe to
+        :arg left: The event for the first half of each pair
+        :arg right: The event for the second half of each pair
+        :arg result_event: Published with the key, the left half, and the
+            right half of each pair
+        :arg timeout: Seconds to wait for the other half after one half
+            arrives
+        :kwarg left_key: Called with the arguments of each publication of
+            ``left`` to get its key.  Defaults to the first positional
+            argument.
+        :kwarg right_key: The same for ``right``
+        :kwarg timeout_event: If given, published with the key, the left
+            half, and the right half of each half that did not find its other
+            half.  The missing half is None.
+        :kwarg max_pending: Most halves to keep waiting at once.  None for no
+            limit.
+        :kwarg overflow: What to do with a new half when ``max_pending``
+            halves are already waiting.  ``'evict'`` gives up on the oldest
+            waiting half to make room.  ``'drop'`` gives up on the new half.
+            Either way the half that is given up on is published as
+            ``timeout_event``.
+        :raises EventNotFoundError: if the :class:`~pubmarine.PubPen` has an
+            event list and one of the events is not in it
+        """
+        if left == right:
+            raise ValueError('left and right must be different events')
+        if timeout <= 0:
+            raise ValueError('timeout must be greater than 0')
+        if max_pending is not None and max_pending < 1:
+            raise ValueError('max_pending must be at least 1')
+        if overflow not in ('evict', 'drop'):
+            raise ValueError("overflow must be 'evict' or 'drop'")
+        event_list = pubpen._event_list
+        for event in (result_event, timeout_event):
+            if event_list and event is not None and event not in event_list:
+                raise EventNotFoundError('{} is not a registered event'.format(event))
+
+        self.pubpen = pubpen
+        self.result_event = result_event
+        self.timeout_event = timeout_event
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.left_key = left_key
+        self.right_key = right_key
+        self._loop = pubpen.loop
+        self._wheel = pubpen._timer_wheel()
+        # key => half waiting for its other half, oldest first
+        self._pending = OrderedDict()  # type: OrderedDict[Any, _Pending]
+        # Fires when the oldest waiting half expires
+        self._timer = None  # type: Any
+        self._closed = False
+        self._sub_ids = [pubpen.subscribe(left, self._receive_left),
+                         pubpen.subscribe(right, self._receive_right)]
+
+    def __len__(self) -> int:
+        """Return the number of halves waiting for their other half"""
+        return len(self._pending)
+
+    def _receive_left(self, *args: Any, **kwargs: Any) -> None:
+        key = args[0] if self.left_key is None else self.left_key(*args, **kwargs)
+        self._arrive(_LEFT, key, _payload(args, kwargs))
+
+    def _receive_right(self, *args: Any, **kwargs: Any) -> None:
+        key = args[0] if self.right_key is None else self.right_key(*args, **kwargs)
+        self._arrive(_RIGHT, key, _payload(args, kwargs))
+
+    def _arrive(self, side: int, key: Any, value: Any) -> None:
+        pending = self._pending
+        waiting = pending.pop(key, None)
+        if waiting is not None:
+            if waiting[0] != side:
+                if side == _RIGHT:
+                    self.pubpen.publish(self.result_event, key, waiting[1], value)
+                else:
+                    self.pubpen.publish(self.result_event, key, value, waiting[1])
+                return
+            # A second half for the same side replaces the first
+            self._give_up(key, waiting)
+
+        if self.max_pending is not None and len(pending) >= self.max_pending:
+            if self.overflow == 'drop':
+                self._give_up(key, (side, value, 0.0))
+                return
+            self._give_up(*pending.popitem(last=False))
+
+        deadline = self._loop.time() + self.timeout
+        pending[key] = (side, value, deadline)
+        if self._timer is None:
+            self._timer = self._wheel.call_at(deadline, self._expire)
+
+    def _give_up(self, key: Any, waiting: _Pending) -> None:
+        if self.timeout_event is None:
+            return
+        if waiting[0] == _LEFT:
+            self.pubpen.publish(self.timeout_event, key, waiting[1], None)
+        else:
+            self.pubpen.publish(self.timeout_event, key, None, waiting[1])
+
+    def _expire(self) -> None:
+        self._timer = None
+        now = self._loop.time()
+        pending = self._pending
+        while pending:
+            key = next(iter(pending))
+            waiting = pending[key]
+            if waiting[2] > now:
+                self._timer = self._wheel.call_at(waiting[2], self._expire)
+                return
+            del pending[key]
+            self._give_up(key, waiting)
+
+    def close(self) -> None:
+        """Unsubscribe from the events and forget the halves that are waiting"""
+        if self._closed:
+            return
+        self._closed = True
+        for sub_id in self._sub_ids:
+            self.pubpen.unsubscribe(sub_id)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._pending.clear()
@@ -0,0 +1,422 @@
+# This file is part of PubMarine.
+#
+# PubMarine is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Foobar is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PubMarine.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+An append-only journal of published events.
+
+The journal records selected events to segmented, memory-mapped log files so that they survive
+a crash and can be replayed into a :class:`~pubmarine.PubPen` later.  Named consumers record how
+far they have read so that a restarted process can pick up where it left off.
+
+.. warning:: Event arguments are stored using :mod:`pickle`.  Only replay journals that were
+    written by a process you trust.
+"""
+
+import bisect
+import mmap
+import os
+import pickle
+import struct
+import time
+import zlib
+from functools import partial
+from itertools import takewhile
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import PubMarineError, PubPen
+
+
+#: Each record is prefixed by the payload length, the crc32 of the payload, and the sequence number
+_HEADER = struct.Struct('<IIQ')
+_SEGMENT_SUFFIX = '.seg'
+_OFFSET_SUFFIX = '.offset'
+
+
+class JournalError(PubMarineError):
+    """ Raised when the journal cannot be read or written
+    """
+    pass
+
+
+class _Segment:
+    """One memory-mapped file of the journal"""
+    def __init__(self, path: str, first_seq: int, size: int = 0) -> None:
+        self.path = path
+        self.first_seq = first_seq
+        self.last_seq = first_seq - 1
+        # Offset of the first unused byte in the segment
+        self.end = 0
+
+        mode = 'r+b' if os.path.exists(path) else 'w+b'
+        self._file = open(path, mode)
+        if size > os.fstat(self._file.fileno()).st_size:
+            self._file.truncate(size)
+        self.size = os.fstat(self._file.fileno()).st_size
+        self.map = mmap.mmap(self._file.fileno(), self.size)
+
+    def scan(self, start: int = 0) -> Iterator[Tuple[int, int, int]]:
+        """Yield ``(seq, payload_start, payload_end)`` for each intact record from ``start``"""
+        expected = self.first_seq
+        pos = 0
+        buf = self.map
+        size = self.size
+        header_size = _HEADER.size
+        while pos + header_size <= size:
+            length, crc, seq = _HEADER.unpack_from(buf, pos)
+            payload_end = pos + header_size + length
+            # A zero length means we've hit the preallocated space.  A bad sequence number or
+            # checksum means a write was torn by a crash or we're looking at stale data left over
+            # from before one.  Either way, the log ends here.
+            if length == 0 or seq != expected or payload_end > size:
+                break
+            if zlib.crc32(buf[pos + header_size:payload_end]) != crc:
+                break
+            if seq >= start:
+                yield seq, pos + header_size, payload_end
+            pos = payload_end
+            expected += 1
+
+    def recover(self) -> None:
+        """Find the end of the log after opening an existing segment"""
+        last_end = 0
+        for seq, dummy_start, payload_end in self.scan():
+            self.last_seq = seq
+            last_end = payload_end
+        self.end = last_end
+
+    def write(self, seq: int, payload: bytes) -> None:
+        header_end = self.end + _HEADER.size
+        _HEADER.pack_into(self.map, self.end, len(payload), zlib.crc32(payload), seq)
+        self.map[header_end:header_end + len(payload)] = payload
+        self.end = header_end + len(payload)
+        self.last_seq = seq
+        # Mark the new end of the log in case the space after us holds stale records
+        if self.end + _HEADER.size <= self.size:
+            _HEADER.pack_into(self.map, self.end, 0, 0, 0)
+
+    def fits(self, payload_len: int) -> bool:
+        return self.end + _HEADER.size + payload_len <= self.size
+
+    def flush(self) -> None:
+        self.map.flush()
+
+    def close(self, trim: bool = False) -> None:
+        if self.map.closed:
+            return
+        self.map.flush()
+        self.map.close()
+        if trim:
+            # The segment is full.  Give back the preallocated space we didn't use.
+            self._file.truncate(self.end)
+            self.size = self.end
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def reopen(self) -> None:
+        """Map a closed segment again so it can be read"""
+        if not self.map.closed:
+            return
+        self._file = open(self.path, 'r+b')
+        self.size = os.fstat(self._file.fileno()).st_size
+        self.map = mmap.mmap(self._file.fileno(), self.size)
+
+
+class EventJournal:
+    """
+    An append-only, memory-mapped log of events.
+
+    Records are written to segment files inside ``directory``.  Each record receives a monotonically
+    increasing sequence number, starting with 1.  Writes go to memory-mapped files so appending
+    is cheap; they are flushed to disk every ``sync_every`` records or ``sync_interval`` seconds,
+    whichever comes first, when :meth:`sync` is called, and when the journal is closed.
+
+    Use :meth:`attach` to record events as they are published on a :class:`~pubmarine.PubPen`
+    and await :meth:`replay` to publish them into a :class:`~pubmarine.PubPen` again.
+
+    .. note:: Recorded events are appended when the :class:`~pubmarine.PubPen` delivers them to the
+        journal, in the same loop iteration as all other subscribers of the event.
+    """
+    def __init__(self, directory: str, segment_size: int = 16 * 1024 * 1024,
+                 sync_every: int = 1000, sync_interval: Optional[float] = 1.0,
+                 serializer: Any = pickle) -> None:
+        """
+        :arg directory: Directory to keep the journal in.  It is created if it does not exist.
+        :kwarg segment_size: Size in bytes to preallocate for each segment file.  Records larger
+            than this get a segment of their own.
+        :kwarg sync_every: Number of appended records after which the journal is flushed to disk.
+        :kwarg sync_interval: If set, flush the journal on the next append after this many seconds
+            have passed since the last flush.
+        :kwarg serializer: Object with ``dumps()`` and ``loads()`` functions used to convert event
+            arguments to and from bytes.  Defaults to :mod:`pickle`.
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._dumps = serializer.dumps  # type: Callable[..., bytes]
+        self._loads = serializer.loads  # type: Callable[[bytes], Any]
+
+        self._offset_dir = os.path.join(directory, 'offsets')
+        os.makedirs(self._offset_dir, exist_ok=True)
+
+        self._segments = []  # type: List[_Segment]
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        self._pubpen = None  # type: Optional[PubPen]
+        self._recorders = {}  # type: Dict[str, Callable[..., int]]
+        self._recorder_ids = []  # type: List[int]
+
+        self._open_segments()
+
+    def _open_segments(self) -> None:
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(_SEGMENT_SUFFIX))
+        for name in names:
+            first_seq = int(name[:-len(_SEGMENT_SUFFIX)])
+            path = os.path.join(self.directory, name)
+            if not os.path.getsize(path):
+                # Created but never preallocated before a crash.  There is nothing to recover and
+                # an empty file cannot be mapped.  Appending recreates it.
+                os.remove(path)
+                continue
+            segment = _Segment(path, first_seq)
+            segment.recover()
+            self._segments.append(segment)
+
+        for segment in self._segments[:-1]:
+            segment.close()
+
+        if not self._segments:
+            self._roll(1, 0)
+
+    def _roll(self, first_seq: int, payload_len: int) -> _Segment:
+        if self._segments:
+            previous = self._segments[-1]
+            if previous.last_seq < previous.first_seq:
+                # Nothing was ever written to it.  Start over with a segment large enough to hold
+                # the record
+                self._segments.pop()
+                previous.close()
+                os.remove(previous.path)
+            else:
+                previous.close(trim=True)
+        path = os.path.join(self.directory, '{:020d}{}'.format(first_seq, _SEGMENT_SUFFIX))
+        size = max(self.segment_size, _HEADER.size * 2 + payload_len)
+        segment = _Segment(path, first_seq, size)
+        self._segments.append(segment)
+        return segment
+
+    @property
+    def last_seq(self) -> int:
+        """Sequence number of the most recently appended record, 0 if the journal is empty"""
+        return self._segments[-1].last_seq
+
+    def append(self, event: str, *args: Any, **kwargs: Any) -> int:
+        """ Append an event to the journal
+
+        :arg event: Name of the event
+        :returns: The sequence number assigned to the record
+
+        Other args and keyword args are recorded as the arguments of the event.
+        """
+        payload = self._dumps((event, args, kwargs))
+        segment = self._segments[-1]
+        seq = segment.last_seq + 1
+        if not segment.fits(len(payload)):
+            segment = self._roll(seq, len(payload))
+        segment.write(seq, payload)
+
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+        elif self.sync_interval is not None \
+                and time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+        return seq
+
+    def sync(self) -> None:
+        """Flush appended records to disk"""
+        self._segments[-1].flush()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def read(self, start: int = 1) -> Iterator[Tuple[int, str, tuple, dict]]:
+        """ Read records from the journal
+
+        :kwarg start: Sequence number of the first record to return
+        :returns: An iterator of ``(seq, event, args, kwargs)`` tuples
+        """
+        first_seqs = [s.first_seq for s in self._segments]
+        index = max(bisect.bisect_right(first_seqs, start) - 1, 0)
+        loads = self._loads
+        for segment in self._segments[index:]:
+            active = segment is self._segments[-1]
+            segment.reopen()
+            try:
+                buf = segment.map
+                for seq, payload_start, payload_end in segment.scan(start):
+                    event, args, kwargs = loads(buf[payload_start:payload_end])
+                    yield seq, event, args, kwargs
+            finally:
+                if not active and segment is not self._segments[-1]:
+                    segment.close()
+
+    def offset(self, consumer: str) -> int:
+        """ Sequence number of the last record that ``consumer`` has committed
+
+        :arg consumer: Name of the consumer
+        :returns: The committed sequence number or 0 if the consumer has not committed anything
+        """
+        try:
+            with open(self._offset_path(consumer), 'rb') as f:
+                return int(f.read())
+        except FileNotFoundError:
+            return 0
+
+    def commit(self, consumer: str, seq: int) -> None:
+        """ Durably record that ``consumer`` has processed everything up to ``seq``
+
+        :arg consumer: Name of the consumer
+        :arg seq: Sequence number of the last record processed
+        """
+        path = self._offset_path(consumer)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(str(seq).encode('ascii'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _offset_path(self, consumer: str) -> str:
+        if not consumer or os.sep in consumer or (os.altsep and os.altsep in consumer) \
+                or consumer.startswith('.'):
+            raise JournalError('{} is not a valid consumer name'.format(consumer))
+        return os.path.join(self._offset_dir, consumer + _OFFSET_SUFFIX)
+
+    async def replay(self, pubpen: PubPen, consumer: Optional[str] = None,
+                     start: Optional[int] = None, commit_every: int = 10000) -> int:
+        """ Publish journaled events into a :class:`~pubmarine.PubPen`
+
+        :arg pubpen: The :class:`~pubmarine.PubPen` to publish the events on.  It has to run on
+            an asyncio event loop.
+        :kwarg consumer: If given, start after the offset this consumer last committed and commit
+            the new offset as events are replayed.
+        :kwarg start: Sequence number to start from.  Overrides the consumer's offset.
+        :kwarg commit_every: Commit the consumer's offset after this many replayed events.
+        :returns: Sequence number of the last replayed record
+
+        This is a coroutine.  The consumer's offset is only committed once the subscribers have
+        been called with the events up to it (see :meth:`~pubmarine.PubPen.drain`) so a crash
+        while replaying does not skip events that were published but never delivered.
+
+        If this journal is attached to ``pubpen``, the replayed events are not recorded a second
+        time.  Events published by others, before the replay or while it waits for deliveries,
+        are recorded.
+        """
+        if start is None:
+            start = self.offset(consumer) + 1 if consumer is not None else 1
+        last = start - 1
+        # Records appended while we wait for deliveries were published live.  Don't replay them.
+        stop = self.last_seq
+
+        records = takewhile(lambda record: record[0] <= stop, self.read(start))
+        publish = pubpen.publish
+        while True:
+            # Pausing the recorders keeps the replayed events out of the journal.  Unlike
+            # unsubscribing, it leaves the live publications that are already queued for them
+            # to be recorded as long as they are resumed before the event loop runs again.
+            recorder_ids = self._recorder_ids if pubpen is self._pubpen else []
+            for sub_id in recorder_ids:
+                pubpen.pause(sub_id)
+            try:
+                pending = 0
+                for seq, event, args, kwargs in records:
+                    publish(event, *args, **kwargs)
+                    last = seq
+                    pending += 1
+                    if consumer is not None and pending >= commit_every:
+                        break
+            finally:
+                # Record live publications again while we wait for the deliveries
+                for sub_id in recorder_ids:
+                    pubpen.resume(sub_id)
+
+            if consumer is None or not pending:
+                break
+            await pubpen.drain()
+            self.commit(consumer, last)
+
+        return last
+
+    def attach(self, pubpen: PubPen, events: Iterable[str]) -> None:
+        """ Record events published on a :class:`~pubmarine.PubPen`
+
+        :arg pubpen: The :class:`~pubmarine.PubPen` to record events from
+        :arg events: Names of the events to record
+        """
+        if self._pubpen is not None and self._pubpen is not pubpen:
+            raise JournalError('The journal is already attached to a different PubPen')
+        self._pubpen = pubpen
+        for event in events:
+            if event in self._recorders:
+                continue
+            # PubPen only keeps weak references so we have to hold onto the recorder ourselves
+            recorder = partial(self.append, event)
+            self._recorders[event] = recorder
+            self._recorder_ids.append(pubpen.subscribe(event, recorder))
+
+    def detach(self) -> None:
+        """Stop recording events"""
+        if self._pubpen is not None:
+            for sub_id in self._recorder_ids:
+                self._pubpen.unsubscribe(sub_id)
+        self._pubpen = None
+        self._recorders = {}
+        self._recorder_ids = []
+
+    def prune(self) -> int:
+        """ Remove segments that every consumer has committed past
+
+        :returns: Number of segment files that were removed
+
+        The segment currently being written to is never removed.
+        """
+        offsets = [self.offset(name[:-len(_OFFSET_SUFFIX)])
+                   for name in os.listdir(self._offset_dir) if name.endswith(_OFFSET_SUFFIX)]
+        if not offsets:
+            return 0
+        low_water = min(offsets)
+
+        removed = 0
+        while len(self._segments) > 1 and self._segments[0].last_seq <= low_water:
+            segment = self._segments.pop(0)
+            segment.close()
+            os.remove(segment.path)
+            removed += 1
+        return removed
+
+    def close(self) -> None:
+        """Detach from the PubPen and flush and close all segments"""
+        self.detach()
+        for segment in self._segments:
+            segment.close()
+
+    def __enter__(self) -> 'EventJournal':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
@@ -0,0 +1,198 @@
+# This file is part of PubMarine.
+#
+# PubMarine is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Foobar is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PubMarine.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Dispatch metrics for :class:`~pubmarine.PubPen`.
+
+Metrics are off by default.  Turn them on with :meth:`pubmarine.PubPen.enable_metrics`::
+
+    metrics = pubpen.enable_metrics()
+    ...
+    print(metrics.snapshot()['server_msg']['queue_delay']['p99'])
+
+All of the aggregation is done with plain counters and fixed bucket histograms so that it is cheap
+enough to leave on in production.
+"""
+
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence
+
+
+#: Default histogram bucket upper bounds, in seconds.  From 1 microsecond to 10 seconds.
+DEFAULT_BOUNDS = (1e-6, 2.5e-6, 5e-6,
+                  1e-5, 2.5e-5, 5e-5,
+                  1e-4, 2.5e-4, 5e-4,
+                  1e-3, 2.5e-3, 5e-3,
+                  1e-2, 2.5e-2, 5e-2,
+                  0.1, 0.25, 0.5,
+                  1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    A histogram with fixed bucket boundaries.
+
+    Each observation increments the count of the first bucket whose upper bound is greater than or
+    equal to the value.  Values larger than the last bound are counted in an overflow bucket.
+    """
+    __slots__ = ('bounds', 'counts', 'count', 'total')
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BOUNDS) -> None:
+        """
+        :kwarg bounds: Sorted upper bounds of the buckets
+        """
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        """Record one value"""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    @property
+    def mean(self) -> float:
+        """Average of the observed values"""
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction: float) -> float:
+        """ Estimate a percentile
+
+        :arg fraction: The percentile to estimate as a fraction, for
+            instance, ``0.99`` for the 99th percentile.
+        :returns: Upper bound of the bucket the percentile falls into.
+            ``float('inf')`` if it falls into the overflow bucket.
+        """
+        if not self.count:
+            return 0.0
+        threshold = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= threshold and bucket_count:
+                break
+        if index < len(self.bounds):
+            return self.bounds[index]
+        return float('inf')
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the state of the histogram as a dict"""
+        return {'count': self.count,
+                'mean': self.mean,
+                'p50': self.percentile(0.5),
+                'p90': self.percentile(0.9),
+                'p99': self.percentile(0.99),
+                'buckets': dict(zip(self.bounds + (float('inf'),), self.counts))}
+
+
+class EventMetrics:
+    """Metrics for a single event"""
+    __slots__ = ('published', 'delivered', 'dead_handlers', 'shed', 'queue_delay', 'duration')
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BOUNDS) -> None:
+        #: Number of times the event was published
+        self.published = 0
+        #: Number of callbacks that were run for the event
+        self.delivered = 0
+        #: Number of subscriptions removed because their callback was garbage collected
+        self.dead_handlers = 0
+        #: Number of publications dropped by the load shedder
+        self.shed = 0
+        #: Time between a callback being queued and it starting to run
+        self.queue_delay = Histogram(bounds)
+        #: Time the callbacks took to run
+        self.duration = Histogram(bounds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the metrics as a dict"""
+        return {'published': self.published,
+                'delivered': self.delivered,
+                'dead_handlers': self.dead_handlers,
+                'shed': self.shed,
+                'queue_delay': self.queue_delay.snapshot(),
+                'duration': self.duration.snapshot()}
+
+
+def _timed_delivery(stats: EventMetrics, clock: Callable[[], float], queued: float,
+                    func: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+    start = clock()
+    stats.delivered += 1
+    stats.queue_delay.observe(start - queued)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        stats.duration.observe(clock() - start)
+
+
+class DispatchMetrics:
+    """
+    Per-event dispatch metrics of a :class:`~pubmarine.PubPen`.
+
+    Counts publications, deliveries, and cleanups of garbage collected subscribers for each event.
+    Keeps histograms of how long deliveries wait in the event loop before they run and how long the
+    callbacks take.
+    """
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BOUNDS,
+                 clock: Callable[[], float] = time.perf_counter) -> None:
+        """
+        :kwarg bounds: Upper bounds, in seconds, of the histogram buckets
+        :kwarg clock: Function returning the current time in seconds
+        """
+        self.bounds = tuple(bounds)
+        self.clock = clock
+        self.events = {}  # type: Dict[str, EventMetrics]
+
+    def for_event(self, event: str) -> EventMetrics:
+        """Return the :class:`EventMetrics` for an event, creating it if needed"""
+        try:
+            return self.events[event]
+        except KeyError:
+            stats = self.events[event] = EventMetrics(self.bounds)
+            return stats
+
+    def run(self, stats: EventMetrics, queued: float, func: Callable[..., Any], args: tuple,
+            kwargs: dict) -> Any:
+        """ Deliver to a callback now, counting and timing the delivery
+
+        :arg stats: The :class:`EventMetrics` to record into
+        :arg queued: Time, according to :attr:`clock`, that the delivery was queued
+        :arg func: The callback to deliver to
+        :arg args: Positional arguments for the callback
+        :arg kwargs: Keyword arguments for the callback
+        :returns: The return value of the callback
+
+        Call it from the queued delivery once it is known that the delivery is still wanted so
+        that cancelled deliveries are not counted.
+        """
+        return _timed_delivery(stats, self.clock, queued, func, args, kwargs)
+
+    def snapshot(self, events: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """ Return the metrics as a dict
+
+        :kwarg events: If given, only return metrics for these events
+        :returns: A dict mapping event names to their metrics
+        """
+        if events is None:
+            events = list(self.events)
+        return {event: self.events[event].snapshot() for event in events if event in self.events}
+
+    def reset(self) -> None:
+        """Forget all of the collected metrics"""
+        self.events = {}
@@ -0,0 +1,330 @@
+# This file is part of PubMarine.
+#
+# PubMarine is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Foobar is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PubMarine.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Derive new streams of values from events.
+
+A :class:`Flow` describes operators to apply to the publications of one or more events.  Nothing
+happens until the flow is ended with :meth:`Flow.subscribe` or :meth:`Flow.publish`::
+
+    hot = (Flow(pubpen, 'temperature')
+           .map(to_celsius)
+           .filter(lambda celsius: celsius > 30)
+           .distinct()
+           .publish('too_hot'))
+
+Each publication is turned into a single value the same way as for
+:class:`~pubmarine.EventStream`: the published value if the event was published with one
+positional argument, a tuple of the positional arguments if it was published with several, and an
+``(args, kwargs)`` tuple if it was published with keyword arguments.
+
+All of the operators of a flow run in the delivery of the event to a single subscription instead
+of each one republishing to the next.  Consecutive :meth:`~Flow.map` and :meth:`~Flow.filter`
+operators are fused into one function so a long chain of them costs little more than one.
+
+:class:`~pubmarine.PubPen` only keeps weak references to callbacks.  The :class:`Pipeline` that
+ending a flow returns holds the callbacks so keep it for as long as the flow should run and call
+:meth:`Pipeline.close` to stop it.
+"""
+
+from collections import deque
+from functools import partial
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+from . import PubPen, _payload
+
+
+_SENTINEL = object()
+
+
+def _fuse(stages: List[Tuple[str, Callable[[Any], Any]]],
+          downstream: Callable[[Any], None]) -> Callable[[Any], None]:
+    """Combine ``map`` and ``filter`` stages and the stage after them into one function"""
+    if not stages:
+        return downstream
+
+    if len(stages) == 1:
+        kind, func = stages[0]
+        if kind == 'map':
+            def push(item: Any) -> None:
+                downstream(func(item))
+        else:
+            def push(item: Any) -> None:
+                if func(item):
+                    downstream(item)
+        return push
+
+    steps = tuple((kind == 'filter', func) for kind, func in stages)
+
+    def push_all(item: Any) -> None:
+        for is_filter, func in steps:
+            if is_filter:
+                if not func(item):
+                    return
+            else:
+                item = func(item)
+        downstream(item)
+    return push_all
+
+
+class _Batch:
+    """Collect values into lists"""
+    def __init__(self, pubpen: PubPen, count: Optional[int], interval: Optional[float],
+                 downstream: Callable[[Any], None]) -> None:
+        self.pubpen = pubpen
+        self.count = count
+        self.interval = interval
+        self.downstream = downstream
+        self.items = []  # type: List[Any]
+        self.timer = None  # type: Any
+        if interval is not None:
+            pubpen._require_event_loop('batch() with an interval')
+
+    def push(self, item: Any) -> None:
+        self.items.append(item)
+        if self.count is not None and len(self.items) >= self.count:
+            self.flush()
+        elif self.interval is not None and self.timer is None:
+            self.timer = self.pubpen._timer_wheel().call_later(self.interval, self.flush)
+
+    def flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.items:
+            items = self.items
+            self.items = []
+            self.downstream(items)
+
+    def close(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.items = []
+
+
+class _Window:
+    """Pass on the last ``size`` values each time a value arrives"""
+    def __init__(self, size: int, downstream: Callable[[Any], None]) -> None:
+        self.items = deque(maxlen=size)  # type: Deque[Any]
+        self.downstream = downstream
+
+    def push(self, item: Any) -> None:
+        items = self.items
+        items.append(item)
+        if len(items) == items.maxlen:
+            self.downstream(tuple(items))
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.items.clear()
+
+
+class _Distinct:
+    """Drop values whose key is the same as the previous value's"""
+    def __init__(self, key: Optional[Callable[[Any], Any]],
+                 downstream: Callable[[Any], None]) -> None:
+        self.key = key
+        self.downstream = downstream
+        self.last = _SENTINEL  # type: Any
+
+    def push(self, item: Any) -> None:
+        key = item if self.key is None else self.key(item)
+        if key is self.last or key == self.last:
+            return
+        self.last = key
+        self.downstream(item)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.last = _SENTINEL
+
+
+class Flow:
+    """
+    Operators to apply to the publications of events.
+
+    Each operator method returns a new :class:`Flow` so one flow can be the start of several
+    others.
+    """
+    def __init__(self, pubpen: PubPen, *events: Any) -> None:
+        """
+        :arg pubpen: The :class:`~pubmarine.PubPen` to subscribe to
+        :arg events: The events whose publications start the flow.  These
+            are event names or classes of event objects, as for
+            :meth:`~pubmarine.PubPen.subscribe`.
+        """
+        if not events:
+            raise ValueError('A flow needs at least one event')
+        self.pubpen = pubpen
+        self.events = events
+        self._stages = ()  # type: Tuple[Tuple[Any, ...], ...]
+
+    def _then(self, *stage: Any) -> 'Flow':
+        flow = Flow(self.pubpen, *self.events)
+        flow._stages = self._stages + (stage,)
+        return flow
+
+    def map(self, func: Callable[[Any], Any]) -> 'Flow':
+        """Pass on ``func(value)`` instead of each value"""
+        return self._then('map', func)
+
+    def filter(self, predicate: Callable[[Any], Any]) -> 'Flow':
+        """Only pass on the values that ``predicate`` returns True for"""
+        return self._then('filter', predicate)
+
+    def batch(self, count: Optional[int] = None, interval: Optional[float] = None) -> 'Flow':
+        """ Pass on lists of values instead of single values
+
+        :kwarg count: Pass on a list once it has this many values
+        :kwarg interval: Pass on a list this many seconds after its first
+            value arrived even if it does not have ``count`` values yet.
+            Needs an asyncio event loop.
+
+        At least one of ``count`` and ``interval`` has to be given.
+        """
+        if count is None and interval is None:
+            raise ValueError('batch() needs a count, an interval, or both')
+        if count is not None and count < 1:
+            raise ValueError('count must be at least 1')
+        return self._then('batch', count, interval)
+
+    def window(self, size: int) -> 'Flow':
+        """ Pass on a tuple of the last ``size`` values each time a value arrives
+
+        Nothing is passed on until ``size`` values have arrived.
+        """
+        if size < 1:
+            raise ValueError('size must be at least 1')
+        return self._then('window', size)
+
+    def distinct(self, key: Optional[Callable[[Any], Any]] = None) -> 'Flow':
+        """ Drop values that are the same as the value before them
+
+        :kwarg key: If given, compare ``key(value)`` instead of the values
+            themselves
+        """
+        return self._then('distinct', key)
+
+    def merge(self, *sources: Any) -> 'Flow':
+        """ Add the values of other events or flows from here on
+
+        :arg sources: Event names, classes of event objects, or other
+            :class:`Flow` objects.  Their values skip the operators before
+            this point and go through the ones after it.
+        """
+        if not sources:
+            raise ValueError('merge() needs at least one event or flow')
+        return self._then('merge', sources)
+
+    def subscribe(self, callback: Callable[[Any], Any]) -> 'Pipeline':
+        """ Call a function with each value that comes out of the flow
+
+        :arg callback: Called with each value as its only argument
+        :returns: The running :class:`Pipeline`
+        """
+        return Pipeline(self, callback)
+
+    def publish(self, event: str) -> 'Pipeline':
+        """ Publish each value that comes out of the flow as an event
+
+        :arg event: Name of the event to publish.  The value is its only
+            argument.
+        :returns: The running :class:`Pipeline`
+        """
+        return Pipeline(self, partial(self.pubpen.publish, event))
+
+
+class Pipeline:
+    """
+    A :class:`Flow` that is subscribed to its events.
+
+    Create one with :meth:`Flow.subscribe` or :meth:`Flow.publish`.
+    """
+    def __init__(self, flow: Flow, sink: Callable[[Any], Any]) -> None:
+        self.pubpen = flow.pubpen
+        self._stateful = []  # type: List[Any]
+        # PubPen only keeps weak references so the pipeline holds the receivers
+        self._receivers = []  # type: List[Callable[..., None]]
+        self._sub_ids = []  # type: List[int]
+        self._merged = []  # type: List[Pipeline]
+        self._closed = False
+
+        # Build from the end so that each stage knows where to send its values
+        downstream = sink  # type: Callable[[Any], Any]
+        pure = []  # type: List[Tuple[str, Callable[[Any], Any]]]
+        entries = []  # type: List[Tuple[Tuple[Any, ...], Callable[[Any], Any]]]
+        for stage in reversed(flow._stages):
+            kind = stage[0]
+            if kind in ('map', 'filter'):
+                pure.insert(0, stage)
+                continue
+            downstream = _fuse(pure, downstream)
+            pure = []
+            if kind == 'merge':
+                entries.append((stage[1], downstream))
+                continue
+            if kind == 'batch':
+                state = _Batch(self.pubpen, stage[1], stage[2], downstream)  # type: Any
+            elif kind == 'window':
+                state = _Window(stage[1], downstream)
+            else:
+                state = _Distinct(stage[1], downstream)
+            self._stateful.append(state)
+            downstream = state.push
+        entries.append((flow.events, _fuse(pure, downstream)))
+
+        for sources, push in entries:
+            events = [source for source in sources if not isinstance(source, Flow)]
+            for source in sources:
+                if isinstance(source, Flow):
+                    self._merged.append(Pipeline(source, push))
+            if events:
+                receiver = self._receiver(push)
+                self._receivers.append(receiver)
+                self._sub_ids.append(self.pubpen.subscribe_many(events, receiver))
+
+    @staticmethod
+    def _receiver(push: Callable[[Any], Any]) -> Callable[..., None]:
+        def receive(*args: Any, **kwargs: Any) -> None:
+            push(_payload(args, kwargs))
+        return receive
+
+    def flush(self) -> None:
+        """Pass on the values that :meth:`Flow.batch` is holding without waiting"""
+        for pipeline in self._merged:
+            pipeline.flush()
+        # Upstream stages first so their values reach the batches after them
+        for state in reversed(self._stateful):
+            state.flush()
+
+    def close(self) -> None:
+        """Unsubscribe from the events and throw away any values being held"""
+        if self._closed:
+            return
+        self._closed = True
+        for sub_id in self._sub_ids:
+            self.pubpen.unsubscribe(sub_id)
+        for pipeline in self._merged:
+            pipeline.close()
+        for state in self._stateful:
+            state.close()
+        self._receivers = []
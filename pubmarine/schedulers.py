@@ -0,0 +1,199 @@
+# This file is part of PubMarine.
+#
+# PubMarine is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Foobar is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PubMarine.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Run deliveries without an asyncio event loop.
+
+A :class:`~pubmarine.PubPen` hands every delivery to the ``call_soon()`` method of the object it
+was created with.  An asyncio event loop is one such object.  The schedulers in this module are
+others, for programs that want the publish/subscribe wiring without the event loop::
+
+    scheduler = QueuedScheduler()
+    pubpen = PubPen(scheduler)
+    pubpen.subscribe('record', write_record)
+    for record in records:
+        pubpen.publish('record', record)
+    scheduler.run()
+
+* :class:`ImmediateScheduler` runs each callback as soon as it is published, before
+  :meth:`~pubmarine.PubPen.publish` returns.
+* :class:`QueuedScheduler` queues the callbacks and runs them, along with any callbacks they
+  queue, when :meth:`QueuedScheduler.run` is called.
+* :class:`ThreadPoolScheduler` runs the callbacks in a thread pool.
+
+The features of :class:`~pubmarine.PubPen` that return awaitables, like
+:meth:`~pubmarine.PubPen.request`, :meth:`~pubmarine.PubPen.stream`, and
+:meth:`~pubmarine.PubPen.wait_for`, still need an asyncio event loop.  So does everything that runs
+on a timer, like :meth:`~pubmarine.PubPen.publish_later`, :meth:`~pubmarine.PubPen.aggregate`,
+and load shedding.  Those raise :exc:`TypeError` when the :class:`~pubmarine.PubPen` was given a
+scheduler.
+"""
+
+import abc
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+
+log = logging.getLogger(__name__)
+
+
+class Scheduler(abc.ABC):
+    """
+    Base class for schedulers.
+
+    Subclasses must implement :meth:`call_soon`.
+    """
+    @abc.abstractmethod
+    def call_soon(self, callback: Callable[..., Any], *args: Any) -> None:
+        """ Arrange for a callback to be called
+
+        :arg callback: The function to call
+        Other args are passed to the callback.
+        """
+
+    def call_exception_handler(self, context: Dict[str, Any]) -> None:
+        """ Report an exception raised by a callback
+
+        :arg context: A dict with a ``message`` and the ``exception``, like
+            :meth:`asyncio.AbstractEventLoop.call_exception_handler` takes.
+
+        The default implementation logs the exception.  Override it to
+        handle errors differently.
+        """
+        log.error(context.get('message', 'Unhandled exception in callback'),
+                  exc_info=context.get('exception'))
+
+    def _run_callback(self, callback: Callable[..., Any], args: tuple) -> None:
+        try:
+            callback(*args)
+        except Exception as e:  # pylint: disable=broad-except
+            self.call_exception_handler({'message': 'Exception in callback {!r}'.format(callback),
+                                         'exception': e})
+
+
+class ImmediateScheduler(Scheduler):
+    """
+    Run callbacks synchronously.
+
+    Publishing calls every subscriber before :meth:`~pubmarine.PubPen.publish` returns.  Callbacks
+    that publish other events run those events' subscribers before returning as well.
+    """
+    def call_soon(self, callback: Callable[..., Any], *args: Any) -> None:
+        self._run_callback(callback, args)
+
+
+class QueuedScheduler(Scheduler):
+    """
+    Queue callbacks and run them to completion when asked to.
+
+    Callbacks run in the order they were queued, one at a time, the same as on an asyncio event
+    loop.  Nothing runs until :meth:`run` is called.
+    """
+    def __init__(self) -> None:
+        self._queue = deque()  # type: Deque[Tuple[Callable[..., Any], tuple]]
+        self._running = False
+
+    def __len__(self) -> int:
+        """Return the number of queued callbacks"""
+        return len(self._queue)
+
+    def call_soon(self, callback: Callable[..., Any], *args: Any) -> None:
+        self._queue.append((callback, args))
+
+    def run(self) -> int:
+        """ Run callbacks until the queue is empty
+
+        :returns: The number of callbacks that were run
+
+        Callbacks queued by the callbacks that are run are also run.  Calling
+        this from inside a callback does nothing as the callbacks are
+        already being run.
+        """
+        if self._running:
+            return 0
+
+        self._running = True
+        queue = self._queue
+        run_callback = self._run_callback
+        count = 0
+        try:
+            while queue:
+                callback, args = queue.popleft()
+                run_callback(callback, args)
+                count += 1
+        finally:
+            self._running = False
+        return count
+
+
+class ThreadPoolScheduler(Scheduler):
+    """
+    Run callbacks in a pool of threads.
+
+    Callbacks may run concurrently and in any order.  The :class:`~pubmarine.PubPen` itself is not
+    thread safe so subscribing and unsubscribing should be done from one thread.  Callbacks that
+    block on I/O are where this helps.  Pure Python callbacks that only use the CPU are limited by
+    the global interpreter lock.
+    """
+    def __init__(self, max_workers: Optional[int] = None,
+                 executor: Optional[Executor] = None) -> None:
+        """
+        :kwarg max_workers: Number of threads in the pool.  Ignored if
+            ``executor`` is given.
+        :kwarg executor: An executor to submit the callbacks to.  A new
+            :class:`~concurrent.futures.ThreadPoolExecutor` is created if not
+            given.
+        """
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers)
+        self.executor = executor
+        self._pending = 0
+        self._idle = threading.Condition()
+
+    def call_soon(self, callback: Callable[..., Any], *args: Any) -> None:
+        with self._idle:
+            self._pending += 1
+        self.executor.submit(self._run_pending, callback, args)
+
+    def _run_pending(self, callback: Callable[..., Any], args: tuple) -> None:
+        try:
+            self._run_callback(callback, args)
+        finally:
+            with self._idle:
+                self._pending -= 1
+                if not self._pending:
+                    self._idle.notify_all()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """ Wait until every submitted callback has run
+
+        :kwarg timeout: Maximum number of seconds to wait
+        :returns: True if all of the callbacks have run, False if the timeout
+            was reached first
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending, timeout)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """ Shut the thread pool down
+
+        :kwarg wait: Whether to wait for the queued callbacks to finish
+        """
+        self.executor.shutdown(wait)
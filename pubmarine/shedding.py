@@ -0,0 +1,216 @@
+# This file is part of PubMarine.
+#
+# PubMarine is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Foobar is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PubMarine.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Shed load when the event loop falls behind.
+
+When callbacks arrive faster than the event loop can run them, queueing every delivery only makes
+the loop fall further behind.  A :class:`LoadShedder` measures how late the event loop runs a
+timer (the loop lag) and, while the lag is over a threshold, drops or samples publications of the
+events that have been marked as sheddable::
+
+    shedder = pubpen.enable_shedding(LoadShedder(sample_above=0.05, drop_above=0.25))
+    shedder.mark('mouse_moved', SHEDDABLE)
+
+Events are :data:`CRITICAL` unless they are marked otherwise so nothing is shed until the program
+says which events it can do without.
+"""
+
+from typing import Any, Dict, Sequence
+
+from .metrics import DEFAULT_BOUNDS, Histogram
+
+#: Publications of the event may be dropped when the loop is lagging
+SHEDDABLE = 'sheddable'
+#: Publications of the event are always delivered
+CRITICAL = 'critical'
+
+#: Deliver every publication
+NORMAL = 'normal'
+#: Deliver one out of ``sample_every`` publications of sheddable events
+SAMPLING = 'sampling'
+#: Drop every publication of sheddable events
+DROPPING = 'dropping'
+
+
+class _ShedCounts:
+    """What was done with the publications of one sheddable event"""
+    __slots__ = ('seen', 'shed', 'sampled')
+
+    def __init__(self) -> None:
+        # Publications seen while shedding.  Used to pick the ones to sample.
+        self.seen = 0
+        self.shed = 0
+        self.sampled = 0
+
+
+class LoadShedder:
+    """
+    Watch the event loop's lag and shed sheddable events while it is too high.
+
+    Every ``interval`` seconds a timer is scheduled on the event loop.  The difference between the
+    time the timer was due and the time it ran is the lag.  The most recent lag sets the shedding
+    level:
+
+    * :data:`NORMAL`: The lag is below ``sample_above``.  Everything is delivered.
+    * :data:`SAMPLING`: The lag is at least ``sample_above``.  Only one out of ``sample_every``
+      publications of each sheddable event is delivered.
+    * :data:`DROPPING`: The lag is at least ``drop_above``.  No publications of sheddable events
+      are delivered.
+
+    A publication that is shed is not delivered to subscribers and does not resolve
+    :meth:`~pubmarine.PubPen.wait_for`.  It is still retained (see :meth:`~pubmarine.PubPen.retain`)
+    so subscribers catch up on the latest value once the loop recovers.
+    """
+    def __init__(self, sample_above: float = 0.05, drop_above: float = 0.25,
+                 sample_every: int = 10, interval: float = 0.1, default: str = CRITICAL,
+                 bounds: Sequence[float] = DEFAULT_BOUNDS) -> None:
+        """
+        :kwarg sample_above: Lag, in seconds, at which sheddable events start being sampled
+        :kwarg drop_above: Lag, in seconds, at which sheddable events are dropped entirely
+        :kwarg sample_every: While sampling, deliver one out of this many publications
+        :kwarg interval: Number of seconds between lag measurements
+        :kwarg default: Priority of events that have not been marked.  Either :data:`CRITICAL` or
+            :data:`SHEDDABLE`.
+        :kwarg bounds: Upper bounds, in seconds, of the lag histogram buckets
+        """
+        if default not in (SHEDDABLE, CRITICAL):
+            raise ValueError('{} is not a valid priority'.format(default))
+        self.sample_above = sample_above
+        self.drop_above = drop_above
+        self.sample_every = sample_every
+        self.interval = interval
+        self.default = default
+        self.loop = None  # type: Any
+
+        #: The current shedding level
+        self.level = NORMAL
+        #: The most recently measured lag
+        self.lag = 0.0
+        #: The largest lag measured
+        self.max_lag = 0.0
+        #: Histogram of the measured lag
+        self.lag_histogram = Histogram(bounds)
+        #: Number of times the level changed
+        self.transitions = 0
+
+        self._priorities = {}  # type: Dict[str, str]
+        self._counts = {}  # type: Dict[str, _ShedCounts]
+        self._timer = None  # type: Any
+
+    def mark(self, event: str, priority: str) -> None:
+        """ Set whether an event may be shed
+
+        :arg event: String name of the event
+        :arg priority: :data:`SHEDDABLE` or :data:`CRITICAL`
+        """
+        if priority not in (SHEDDABLE, CRITICAL):
+            raise ValueError('{} is not a valid priority'.format(priority))
+        self._priorities[event] = priority
+
+    def attach(self, loop: Any) -> None:
+        """Start measuring the lag of an event loop"""
+        self.detach()
+        self.loop = loop
+        self._schedule()
+
+    def detach(self) -> None:
+        """Stop measuring the lag and deliver everything again"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.level != NORMAL:
+            self.level = NORMAL
+            self.transitions += 1
+
+    def _schedule(self) -> None:
+        due = self.loop.time() + self.interval
+        self._timer = self.loop.call_at(due, self._measure, due)
+
+    def _measure(self, due: float) -> None:
+        self.record_lag(self.loop.time() - due)
+        self._schedule()
+
+    def record_lag(self, lag: float) -> None:
+        """ Record a lag measurement and update the shedding level
+
+        This is called by the timer that :meth:`attach` sets up.  It can also be called directly
+        to feed in measurements from elsewhere.
+
+        :arg lag: Number of seconds the event loop was behind
+        """
+        if lag < 0:
+            lag = 0.0
+        self.lag = lag
+        if lag > self.max_lag:
+            self.max_lag = lag
+        self.lag_histogram.observe(lag)
+
+        if lag >= self.drop_above:
+            level = DROPPING
+        elif lag >= self.sample_above:
+            level = SAMPLING
+        else:
+            level = NORMAL
+        if level != self.level:
+            self.level = level
+            self.transitions += 1
+
+    def admit(self, event: str) -> bool:
+        """ Decide whether a publication should be delivered
+
+        :arg event: The event being published
+        :returns: True if the publication should be delivered, False if it should be shed
+        """
+        level = self.level
+        if level == NORMAL or self._priorities.get(event, self.default) == CRITICAL:
+            return True
+
+        counts = self._counts.get(event)
+        if counts is None:
+            counts = self._counts[event] = _ShedCounts()
+        if level == SAMPLING:
+            counts.seen += 1
+            if counts.seen >= self.sample_every:
+                counts.seen = 0
+                counts.sampled += 1
+                return True
+        counts.shed += 1
+        return False
+
+    def snapshot(self) -> Dict[str, Any]:
+        """ Return the lag statistics and shedding decisions as a dict
+
+        :returns: A dict with the current ``level``, the most recent ``lag``, the ``max_lag``, the
+            number of level ``transitions``, a ``lag_histogram`` snapshot, and ``events``, which
+            maps each event that has been shed or sampled to the number of publications that were
+            ``shed`` and ``sampled``.
+        """
+        return {'level': self.level,
+                'lag': self.lag,
+                'max_lag': self.max_lag,
+                'transitions': self.transitions,
+                'lag_histogram': self.lag_histogram.snapshot(),
+                'events': {event: {'shed': counts.shed, 'sampled': counts.sampled}
+                           for event, counts in self._counts.items()}}
+
+    def reset(self) -> None:
+        """Forget the collected statistics.  The current level is kept."""
+        self.max_lag = self.lag
+        self.lag_histogram = Histogram(self.lag_histogram.bounds)
+        self.transitions = 0
+        self._counts = {}
@@ -0,0 +1,98 @@
+# This file is part of PubMarine.
+#
+# PubMarine is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Foobar is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PubMarine.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Helpers for testing code that uses pubmarine.
+
+:class:`VirtualTimeLoop` is an event loop whose clock only moves forward when there is nothing
+else to do.  Timeouts, :func:`asyncio.sleep`, and timers fire in the same order as they would on a
+normal event loop but the test does not have to wait for them::
+
+    loop = VirtualTimeLoop()
+    pubpen = PubPen(loop)
+    # Returns immediately even though the request takes a minute to time out
+    loop.run_until_complete(pubpen.request('slow', timeout=60))
+
+Combined with :meth:`pubmarine.PubPen.drain`, tests can publish, wait for every delivery to run,
+and then check the results without polling the event loop's tasks.
+"""
+
+import asyncio
+import selectors
+from typing import Any, List, Mapping, Optional, Tuple
+
+
+class _VirtualTimeSelector(selectors.BaseSelector):
+    """
+    Wrap a selector so that waiting for I/O advances the virtual clock instead of blocking.
+
+    If the event loop has a timer scheduled, the selector only polls for I/O and then moves the
+    clock forward to the timer's due time.  If nothing is scheduled, it blocks for real I/O like a
+    normal event loop.
+    """
+    def __init__(self, selector: selectors.BaseSelector, loop: 'VirtualTimeLoop') -> None:
+        self._selector = selector
+        self._loop = loop
+
+    def select(self, timeout: Optional[float] = None) -> List[Tuple[selectors.SelectorKey, int]]:
+        if timeout is None:
+            return self._selector.select(None)
+
+        events = self._selector.select(0)
+        if not events and timeout > 0:
+            self._loop.advance(timeout)
+        return events
+
+    def register(self, fileobj: Any, events: int, data: Any = None) -> selectors.SelectorKey:
+        return self._selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj: Any) -> selectors.SelectorKey:
+        return self._selector.unregister(fileobj)
+
+    def modify(self, fileobj: Any, events: int, data: Any = None) -> selectors.SelectorKey:
+        return self._selector.modify(fileobj, events, data)
+
+    def get_map(self) -> Mapping[Any, selectors.SelectorKey]:
+        return self._selector.get_map()
+
+    def close(self) -> None:
+        self._selector.close()
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """
+    An event loop that skips ahead instead of sleeping.
+
+    :meth:`time` returns a virtual clock which starts at 0.  Whenever the loop would wait for a
+    timer, the clock jumps to the timer's due time instead.  Real I/O still works.
+    """
+    def __init__(self) -> None:
+        self._now = 0.0
+        super().__init__(_VirtualTimeSelector(selectors.DefaultSelector(), self))
+
+    def time(self) -> float:
+        """Return the virtual time"""
+        return self._now
+
+    def advance(self, seconds: float) -> None:
+        """ Move the virtual clock forward
+
+        :arg seconds: Number of seconds to advance the clock by.  Timers that
+            become due run the next time the event loop runs.
+        """
+        if seconds > 0:
+            self._now += seconds
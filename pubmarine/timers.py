@@ -0,0 +1,295 @@
+# This file is part of PubMarine.
+#
+# PubMarine is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Foobar is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PubMarine.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+A hierarchical timer wheel for large numbers of timers.
+
+:meth:`asyncio.AbstractEventLoop.call_later` keeps its timers in a heap so adding and cancelling
+a timer costs ``O(log n)``, and cancelled timers stay in the heap until they are due or the heap
+is rebuilt.  A :class:`TimerWheel` sorts timers into slots by when they are due instead.  Adding
+and cancelling a timer is ``O(1)`` and the wheel only keeps a single timer scheduled on the event
+loop, for the next slot that has something in it.
+
+The price is resolution.  Timers are rounded up to the next ``tick`` so they never fire early but
+may fire up to one tick late.
+
+:meth:`pubmarine.PubPen.publish_later`, :meth:`~pubmarine.PubPen.publish_at`, and
+:meth:`~pubmarine.PubPen.publish_every` use a timer wheel.
+"""
+
+import math
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Timer:
+    """ A timer scheduled on a :class:`TimerWheel`
+
+    Use :meth:`cancel` to keep it from firing.
+    """
+    __slots__ = ('when', 'period', 'callback', 'args', '_tick', '_slot')
+
+    def __init__(self, when: float, period: Optional[float], callback: Callable[..., Any],
+                 args: tuple) -> None:
+        #: Loop time at which the timer is due
+        self.when = when
+        #: Number of seconds between firings of a periodic timer.  None for one-shot timers.
+        self.period = period
+        self.callback = callback
+        self.args = args
+        self._tick = 0
+        # The slot the timer is in or None if it is not scheduled
+        self._slot = None  # type: Optional[Dict[Timer, None]]
+
+    def cancel(self) -> None:
+        """Keep the timer from firing.  Cancelling a timer that has already fired does nothing."""
+        slot = self._slot
+        if slot is not None:
+            del slot[self]
+            self._slot = None
+
+    def cancelled(self) -> bool:
+        """Return True if the timer is no longer scheduled"""
+        return self._slot is None
+
+
+class TimerWheel:
+    """
+    Timers sorted into the slots of several wheels.
+
+    The first wheel has one slot per ``tick``.  Each slot of the next wheel covers a whole
+    revolution of the wheel below it.  When a wheel completes a revolution, the timers in the next
+    slot of the wheel above are moved down into the slots they belong in.  With the default of four
+    wheels of 256 slots and a 10 millisecond tick, timers can be up to about 497 days away before
+    they need to be moved more than once.
+    """
+    def __init__(self, loop: Any, tick: float = 0.01, slot_bits: int = 8,
+                 levels: int = 4) -> None:
+        """
+        :arg loop: The asyncio event loop to run the timers on
+        :kwarg tick: Resolution of the wheel in seconds
+        :kwarg slot_bits: Each wheel has ``2 ** slot_bits`` slots
+        :kwarg levels: Number of wheels
+        """
+        self.loop = loop
+        self.tick = tick
+        self._bits = slot_bits
+        self._mask = (1 << slot_bits) - 1
+        self._range = 1 << (slot_bits * levels)
+        self._wheels = [[{} for dummy in range(1 << slot_bits)]
+                        for dummy in range(levels)]  # type: List[List[Dict[Timer, None]]]
+        # One bitmap per wheel of the slots that timers have been placed in.  Slots emptied by
+        # cancelling timers are only cleared from it when they are looked at.
+        self._occupied = [0] * levels
+
+        self._origin = loop.time()
+        # The last tick that has been processed
+        self._current = 0
+        self._handle = None  # type: Any
+        self._armed_tick = None  # type: Optional[int]
+
+    def __len__(self) -> int:
+        """Return the number of scheduled timers"""
+        return sum(len(slot) for wheel in self._wheels for slot in wheel)
+
+    def call_at(self, when: float, callback: Callable[..., Any], *args: Any) -> Timer:
+        """ Call a callback at a loop time
+
+        :arg when: Time, according to the event loop's clock, to call the callback
+        :arg callback: The function to call
+        :returns: A :class:`Timer` that can be cancelled
+
+        Other args are passed to the callback.
+        """
+        timer = Timer(when, None, callback, args)
+        self._add(timer)
+        return timer
+
+    def call_later(self, delay: float, callback: Callable[..., Any], *args: Any) -> Timer:
+        """ Call a callback after a delay
+
+        :arg delay: Number of seconds to wait
+        :arg callback: The function to call
+        :returns: A :class:`Timer` that can be cancelled
+
+        Other args are passed to the callback.
+        """
+        return self.call_at(self.loop.time() + delay, callback, *args)
+
+    def call_every(self, period: float, callback: Callable[..., Any], *args: Any) -> Timer:
+        """ Call a callback periodically
+
+        :arg period: Number of seconds between calls.  The first call is one
+            period from now.
+        :arg callback: The function to call
+        :returns: A :class:`Timer` that can be cancelled to stop the calls
+
+        The calls are scheduled relative to when this method was called, not
+        to when the previous call ran, so they do not drift.  If the event
+        loop falls so far behind that a call is missed entirely, it is
+        skipped.
+
+        Other args are passed to the callback.
+        """
+        if period <= 0:
+            raise ValueError('period must be greater than 0')
+        timer = Timer(self.loop.time() + period, period, callback, args)
+        self._add(timer)
+        return timer
+
+    def _add(self, timer: Timer) -> None:
+        # Round up so the timer never fires early
+        tick = int(math.ceil((timer.when - self._origin) / self.tick))
+        if tick <= self._current:
+            tick = self._current + 1
+        timer._tick = tick
+        self._place(timer)
+
+        armed = self._armed_tick
+        if armed is None or tick < armed:
+            self._arm(tick)
+
+    def _place(self, timer: Timer) -> None:
+        current = self._current
+        # Timers further away than the wheels reach wait in the furthest slot and are placed
+        # again when it is reached
+        tick = min(timer._tick, current + self._range - 1)
+        delta = tick - current
+        level = 0
+        while delta >> (self._bits * (level + 1)):
+            level += 1
+        index = (tick >> (self._bits * level)) & self._mask
+        slot = self._wheels[level][index]
+        slot[timer] = None
+        timer._slot = slot
+        self._occupied[level] |= 1 << index
+
+    def _arm(self, tick: int) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+        self._armed_tick = tick
+        self._handle = self.loop.call_at(self._origin + tick * self.tick, self._run)
+
+    def _next_tick(self) -> Optional[int]:
+        """Return the next tick at which timers fire or have to be moved down a wheel"""
+        current = self._current
+        bits = self._bits
+        mask = self._mask
+        size = mask + 1
+        best = None
+        for level, wheel in enumerate(self._wheels):
+            shift = bits * level
+            base = current >> shift
+            if best is not None and best <= (base + 1) << shift:
+                # Nothing on this wheel or the ones above it can happen before best
+                break
+            occupied = self._occupied[level]
+            start = (base + 1) & mask
+            while occupied:
+                # Rotate the bitmap so the slot after the current one is bit 0 and find the
+                # first occupied slot from there
+                rotated = ((occupied >> start) | (occupied << (size - start))) & ((1 << size) - 1)
+                offset = (rotated & -rotated).bit_length() - 1
+                index = (start + offset) & mask
+                if wheel[index]:
+                    tick = (base + 1 + offset) << shift
+                    if best is None or tick < best:
+                        best = tick
+                    break
+                # Every timer in the slot was cancelled
+                occupied &= ~(1 << index)
+            self._occupied[level] = occupied
+        return best
+
+    def _run(self) -> None:
+        self._handle = None
+        self._armed_tick = None
+        # The event loop may run us a hair early
+        now = int((self.loop.time() - self._origin) / self.tick + 1e-6)
+
+        tick = self._next_tick()
+        while tick is not None and tick <= now:
+            self._current = tick
+            self._cascade(tick)
+            self._fire(tick)
+            tick = self._next_tick()
+        if now > self._current:
+            # Nothing happens between the last tick and now so the next tick stays the same
+            self._current = now
+
+        if tick is not None and (self._armed_tick is None or tick < self._armed_tick):
+            self._arm(tick)
+
+    def _cascade(self, tick: int) -> None:
+        """Move the timers of the slots that are now current down to the lower wheels"""
+        bits = self._bits
+        mask = self._mask
+        level = 1
+        while level < len(self._wheels) and not tick & ((1 << (bits * level)) - 1):
+            level += 1
+        # Move from the highest wheel down so that timers can cascade through several wheels
+        for level in range(level - 1, 0, -1):
+            index = (tick >> (bits * level)) & mask
+            slot = self._wheels[level][index]
+            if slot:
+                self._wheels[level][index] = {}
+                self._occupied[level] &= ~(1 << index)
+                for timer in slot:
+                    self._place(timer)
+
+    def _fire(self, tick: int) -> None:
+        index = tick & self._mask
+        slot = self._wheels[0][index]
+        if not slot:
+            return
+        self._wheels[0][index] = {}
+        self._occupied[0] &= ~(1 << index)
+        for timer in list(slot):
+            if timer._slot is not slot:
+                # Cancelled by one of the callbacks that already ran
+                continue
+            if timer._tick > tick:
+                # Parked in the furthest slot because it was out of range.  Place it again.
+                self._place(timer)
+                continue
+            timer._slot = None
+            if timer.period is not None:
+                now = self.loop.time()
+                timer.when += timer.period
+                if timer.when <= now:
+                    # Skip the calls that were missed
+                    timer.when += (math.floor((now - timer.when) / timer.period) + 1) * timer.period
+                self._add(timer)
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:  # pylint: disable=broad-except
+                self.loop.call_exception_handler({
+                    'message': 'Exception in timer callback {!r}'.format(timer.callback),
+                    'exception': e,
+                })
+
+    def close(self) -> None:
+        """Cancel all of the timers"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._armed_tick = None
+        for wheel in self._wheels:
+            for slot in wheel:
+                for timer in slot:
+                    timer._slot = None
+                slot.clear()
+        self._occupied = [0] * len(self._wheels)
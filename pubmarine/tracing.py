@@ -0,0 +1,187 @@
+# This file is part of PubMarine.
+#
+# PubMarine is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Foobar is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PubMarine.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright: 2017, Toshio Kuratomi
+# License: LGPLv3+
+"""
+Trace which publication caused which callback.
+
+Install a :class:`Tracer` with :meth:`pubmarine.PubPen.enable_tracing`.  Every call to
+:meth:`~pubmarine.PubPen.publish` then opens a span and every delivery of that publication gets
+a child span.  The current span is kept in a :mod:`contextvars` variable while a callback runs so
+events published from inside a callback become part of the same trace.
+
+Records are handed to a sink.  :class:`RingBufferSink` keeps the most recent records in memory and
+:class:`JsonLinesSink` writes them to a file, one JSON object per line.  Any object with an
+``emit(record)`` method can be used as a sink.
+
+Tracing requires Python-3.7 or later.
+"""
+
+import json
+import time
+from collections import deque
+from functools import partial
+from itertools import count
+from typing import Any, Callable, Deque, Dict, IO, List, Optional, Tuple, Union
+
+try:
+    import contextvars
+except ImportError:  # pragma: no cover
+    # Python < 3.7
+    contextvars = None  # type: ignore
+
+
+if contextvars is not None:
+    _current_span = contextvars.ContextVar(
+        'pubmarine_span', default=None)  # type: contextvars.ContextVar[Optional[Tuple[int, int]]]
+
+
+def current_span() -> Optional[Tuple[int, int]]:
+    """ Return the span that the running code belongs to
+
+    :returns: A ``(trace_id, span_id)`` tuple while a traced callback is running, otherwise None
+    """
+    if contextvars is None:
+        return None
+    return _current_span.get()
+
+
+class RingBufferSink:
+    """Keep the most recent trace records in memory"""
+    def __init__(self, size: int = 10000) -> None:
+        """
+        :kwarg size: Number of records to keep
+        """
+        self.records = deque(maxlen=size)  # type: Deque[Dict[str, Any]]
+
+    def emit(self, record: Dict[str, Any]) -> None:
+        self.records.append(record)
+
+
+class JsonLinesSink:
+    """Write trace records to a file as JSON lines"""
+    def __init__(self, file: Union[str, IO[str]]) -> None:
+        """
+        :arg file: Path of a file to append to or an open text file
+        """
+        if isinstance(file, str):
+            self._file = open(file, 'a')  # type: IO[str]
+            self._owned = True
+        else:
+            self._file = file
+            self._owned = False
+
+    def emit(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, default=repr))
+        self._file.write('\n')
+
+    def close(self) -> None:
+        """Flush the records and close the file if we opened it"""
+        self._file.flush()
+        if self._owned:
+            self._file.close()
+
+
+class Tracer:
+    """
+    Assign trace and span ids to publications and deliveries.
+
+    Each publication emits a ``publish`` record.  Each delivery emits a ``start`` record before the
+    callback runs and an ``end`` record, including the duration, after it returns.  Records are
+    dicts with the keys ``type``, ``trace_id``, ``span_id``, ``parent_id``, ``event``, and
+    ``time``.  Delivery records also have ``sub_id``, and ``end`` records have ``duration`` and
+    ``error``.
+    """
+    def __init__(self, sink: Any = None,
+                 clock: Callable[[], float] = time.time) -> None:
+        """
+        :kwarg sink: Object with an ``emit(record)`` method.  Defaults to a new
+            :class:`RingBufferSink`.
+        :kwarg clock: Function returning the current time in seconds
+        """
+        if contextvars is None:  # pragma: no cover
+            raise RuntimeError('Tracing requires Python-3.7 or later')
+        self.sink = sink if sink is not None else RingBufferSink()
+        self.clock = clock
+        self._next_id = count(1)
+
+    def publish_span(self, event: str) -> Tuple[int, int, Optional[int]]:
+        """ Open the span for a publication
+
+        :arg event: The event being published
+        :returns: ``(trace_id, span_id, parent_id)`` of the new span
+        """
+        span_id = next(self._next_id)
+        parent = _current_span.get()
+        if parent is None:
+            trace_id = span_id
+            parent_id = None
+        else:
+            trace_id, parent_id = parent
+        self.sink.emit({'type': 'publish', 'trace_id': trace_id, 'span_id': span_id,
+                        'parent_id': parent_id, 'event': event, 'time': self.clock()})
+        return trace_id, span_id, parent_id
+
+    def wrap(self, span: Tuple[int, int, Optional[int]], event: str, sub_id: int,
+             func: Callable[[], Any],
+             subscribed: Optional[Callable[[], bool]] = None) -> Callable[[], Any]:
+        """ Trace a delivery
+
+        :arg span: The span of the publication, as returned by :meth:`publish_span`
+        :arg event: The event being published
+        :arg sub_id: The subscription being delivered to
+        :arg func: The delivery
+        :kwarg subscribed: If given, called when the delivery runs.  If it
+            returns False, the delivery was cancelled while it was queued and
+            ``func`` is run without a span.
+        :returns: A delivery that runs ``func`` in its own span
+        """
+        return partial(self._deliver, span[0], span[1], next(self._next_id), event, sub_id, func,
+                       subscribed)
+
+    def _deliver(self, trace_id: int, parent_id: int, span_id: int, event: str, sub_id: int,
+                 func: Callable[[], Any], subscribed: Optional[Callable[[], bool]]) -> Any:
+        if subscribed is not None and not subscribed():
+            # Cancelled by unsubscribing.  func skips the callback on its own.
+            return func()
+        emit = self.sink.emit
+        clock = self.clock
+        start = clock()
+        emit({'type': 'start', 'trace_id': trace_id, 'span_id': span_id, 'parent_id': parent_id,
+              'event': event, 'sub_id': sub_id, 'time': start})
+        token = _current_span.set((trace_id, span_id))
+        error = None
+        try:
+            return func()
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            end = clock()
+            emit({'type': 'end', 'trace_id': trace_id, 'span_id': span_id,
+                  'parent_id': parent_id, 'event': event, 'sub_id': sub_id, 'time': end,
+                  'duration': end - start, 'error': error})
+
+
+def spans(records: List[Dict[str, Any]], trace_id: int) -> List[Dict[str, Any]]:
+    """ Pick the records that belong to one trace
+
+    :arg records: Trace records, for instance, from :attr:`RingBufferSink.records`
+    :arg trace_id: The trace to return
+    :returns: The records of the trace in the order they were emitted
+    """
+    return [record for record in records if record['trace_id'] == trace_id]
@@ -0,0 +1,13 @@
+"""Fixtures shared by the tests.  Plain helper functions are in helpers.py."""
+import pytest
+
+from pubmarine import PubPen
+from pubmarine.testing import VirtualTimeLoop
+
+
+@pytest.fixture
+def pubpen():
+    """A PubPen on a loop whose clock jumps ahead to the next timer instead of waiting for it"""
+    loop = VirtualTimeLoop()
+    yield PubPen(loop)
+    loop.close()
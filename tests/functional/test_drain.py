@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import pytest
+
+from pubmarine import PubPen
+from pubmarine.testing import VirtualTimeLoop
+
+
+@pytest.fixture
+def pubpen(request):
+    loop = VirtualTimeLoop()
+    yield PubPen(loop)
+    loop.close()
+
+
+class Function:
+    def __init__(self, pubpen=None, republish=None):
+        self.pubpen = pubpen
+        self.republish = republish
+        self.called = 0
+
+    def __call__(self, *args):
+        self.called += 1
+        if self.republish:
+            self.pubpen.publish(self.republish)
+
+
+class TestDrain:
+    def test_nothing_queued(self, pubpen):
+        pubpen.loop.run_until_complete(pubpen.drain())
+
+    def test_waits_for_deliveries(self, pubpen):
+        function = Function()
+        pubpen.subscribe('test_event', function)
+        for dummy in range(3):
+            pubpen.publish('test_event')
+        pubpen.loop.run_until_complete(pubpen.drain())
+        assert function.called == 3
+
+    def test_waits_for_cascades(self, pubpen):
+        second = Function()
+        third = Function()
+        first = Function(pubpen, republish='second_event')
+        relay = Function(pubpen, republish='third_event')
+        pubpen.subscribe('first_event', first)
+        pubpen.subscribe('second_event', second)
+        pubpen.subscribe('second_event', relay)
+        pubpen.subscribe('third_event', third)
+
+        pubpen.publish('first_event')
+        pubpen.loop.run_until_complete(pubpen.drain())
+        assert (first.called, second.called, third.called) == (1, 1, 1)
+
+    def test_waits_for_chunked_fanout(self, pubpen):
+        pubpen.enable_chunked_fanout(chunk_size=2)
+        functions = [Function() for dummy in range(7)]
+        for function in functions:
+            pubpen.subscribe('test_event', function)
+        pubpen.publish('test_event')
+        pubpen.loop.run_until_complete(pubpen.drain())
+        assert [function.called for function in functions] == [1] * 7
+
+    def test_waits_for_retained_replays(self, pubpen):
+        class SubscribeNext:
+            def __init__(self, remaining):
+                self.remaining = remaining
+                self.next = None
+
+            def __call__(self, *args):
+                if self.remaining:
+                    self.next = SubscribeNext(self.remaining - 1)
+                    pubpen.subscribe('retained_event', self.next, retained=True)
+
+        pubpen.retain('retained_event')
+        pubpen.publish('retained_event')
+        pubpen.loop.run_until_complete(pubpen.drain())
+
+        # Each replay queues the next one without publishing anything
+        first = SubscribeNext(5)
+        pubpen.subscribe('retained_event', first, retained=True)
+        pubpen.loop.run_until_complete(pubpen.drain())
+        subscriber = first
+        while subscriber.next is not None:
+            subscriber = subscriber.next
+        assert subscriber.remaining == 0
+
+    def test_timeout(self):
+        # A callback that keeps republishing never lets the queue empty
+        # (The virtual clock never advances while callbacks are ready so use a real loop)
+        loop = asyncio.new_event_loop()
+        pubpen = PubPen(loop)
+        loop_forever = Function(pubpen, republish='test_event')
+        pubpen.subscribe('test_event', loop_forever)
+        pubpen.publish('test_event')
+
+        with pytest.raises(asyncio.TimeoutError):
+            loop.run_until_complete(pubpen.drain(timeout=0.01))
+        assert loop_forever.called > 1
+        loop.close()
+
+
+class TestVirtualTimeLoop:
+    def test_sleep_does_not_wait(self):
+        loop = VirtualTimeLoop()
+        start = time.perf_counter()
+        loop.run_until_complete(asyncio.sleep(3600))
+        assert time.perf_counter() - start < 1
+        assert loop.time() == pytest.approx(3600)
+        loop.close()
+
+    def test_timers_fire_in_order(self):
+        loop = VirtualTimeLoop()
+        fired = []
+        for delay in (3, 1, 2):
+            loop.call_later(delay, fired.append, delay)
+        loop.run_until_complete(asyncio.sleep(5))
+        assert fired == [1, 2, 3]
+        loop.close()
+
+    def test_advance(self):
+        loop = VirtualTimeLoop()
+        loop.advance(10)
+        assert loop.time() == 10
+        loop.advance(-1)
+        assert loop.time() == 10
+        loop.close()
@@ -1,4 +1,3 @@
-import asyncio
 from unittest import mock
 
 import pytest
@@ -67,8 +66,7 @@ class TestFunctionalPublish:
 
         for iteration in range(1, 3):
             pubpen.publish('test_event')
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert foo.called == 1 * iteration
 
     def test_one_event_one_callback(self, pubpen):
@@ -82,8 +80,7 @@ class TestFunctionalPublish:
 
         for iteration in range(1, 3):
             pubpen.publish('test_event')
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 1 * iteration
 
     def test_one_event_one_callback_several_times(self, pubpen):
@@ -99,8 +96,7 @@ class TestFunctionalPublish:
 
         for iteration in range(1, 3):
             pubpen.publish('test_event')
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 3 * iteration
 
     def test_multi_events_one_callback_all_events_called(self, pubpen):
@@ -118,8 +114,7 @@ class TestFunctionalPublish:
             pubpen.publish('test_event1')
             pubpen.publish('test_event2')
             pubpen.publish('test_event3')
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 3 * iteration
 
     def test_multi_events_one_callback_one_event_called(self, pubpen):
@@ -136,8 +131,7 @@ class TestFunctionalPublish:
 
         for iteration in range(1, 3):
             pubpen.publish('test_event1')
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 1 * iteration
 
     def test_one_event_multi_callback(self, pubpen):
@@ -152,8 +146,7 @@ class TestFunctionalPublish:
         assert self.function2.called == 0
 
         pubpen.publish('test_event')
-        pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-        pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+        pubpen.loop.run_until_complete(pubpen.drain())
         assert self.function1.called == 1
         assert self.function2.called == 1
 
@@ -170,8 +163,7 @@ class TestFunctionalPublish:
 
         for iteration in range(1, 3):
             pubpen.publish('test_event')
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 1 * iteration
             assert self.function2.called == 1 * iteration
 
@@ -189,8 +181,7 @@ class TestFunctionalPublish:
         for iteration in range(1, 3):
             pubpen.publish('test_event1')
             pubpen.publish('test_event2')
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 1 * iteration
             assert self.function2.called == 1 * iteration
 
@@ -207,8 +198,7 @@ class TestFunctionalPublish:
 
         for iteration in range(1, 3):
             pubpen.publish('test_event1')
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 1 * iteration
             assert self.function2.called == 0
 
@@ -226,8 +216,7 @@ class TestFunctionalPublish:
         for iteration in range(1, 3):
             pubpen.publish('test_event1')
             pubpen.publish('test_event2')
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 1 * iteration
             assert self.function2.called == 1 * iteration
 
@@ -240,8 +229,7 @@ class TestFunctionalPublish:
 
         for iteration in range(1, 3):
             pubpen.publish('test_event', iteration)
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 1 * iteration
             assert self.function1.args == (iteration,)
 
@@ -254,8 +242,7 @@ class TestFunctionalPublish:
 
         for iteration in range(1, 3):
             pubpen.publish('test_event', test_no=iteration)
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 1 * iteration
             assert self.function1.kwargs == {'test_no': iteration}
 
@@ -268,8 +255,7 @@ class TestFunctionalPublish:
 
         for iteration in range(1, 3):
             pubpen.publish('test_event', iteration, test_no=iteration)
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 1 * iteration
             assert self.function1.args == (iteration,)
             assert self.function1.kwargs == {'test_no': iteration}
@@ -281,8 +267,7 @@ class TestFunctionalPublish:
         del foo
 
         pubpen.publish('test_event1')
-        pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-        pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+        pubpen.loop.run_until_complete(pubpen.drain())
 
         # check internal state as I can't think of how to check this
         # externally
@@ -310,14 +295,32 @@ class TestFunctionalPublish:
         del foo
 
         pubpen.publish('test_event1')
-        pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-        pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+        pubpen.loop.run_until_complete(pubpen.drain())
 
         # check internal state as I can't think of how to check this
         # externally
         assert len(pubpen._event_handlers['test_event1']) == 0
         assert len(pubpen._subscriptions) == 0
 
+    def test_method_goes_away_before_delivery(self, pubpen):
+        calls = []
+
+        class Owner:
+            def method(self):
+                calls.append(self)
+
+        foo = Owner()
+        first = pubpen.subscribe('test_event1', foo.method)
+        pubpen.publish('test_event1')
+        del foo
+
+        # The queued delivery does not keep the object alive and is skipped
+        pubpen.loop.run_until_complete(pubpen.drain())
+        assert calls == []
+        pubpen.publish('test_event1')
+        assert len(pubpen._event_handlers['test_event1']) == 0
+        assert len(pubpen._subscriptions) == 0
+
     def test_method_goes_away_mocked(self, pubpen_mocked):
         foo = Method()
         first = pubpen_mocked.subscribe('test_event1', foo.method)
@@ -346,6 +349,5 @@ class TestFunctionalEmit:
 
         for iteration in range(1, 3):
             pubpen.emit('test_event')
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 1 * iteration
@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+import pubmarine
+from pubmarine import PubPen
+from pubmarine.testing import VirtualTimeLoop
+
+
+@pytest.fixture
+def pubpen(request):
+    # The timeouts in these tests pass without waiting for them
+    loop = VirtualTimeLoop()
+    yield PubPen(loop)
+    loop.close()
+
+
+class Responder:
+    def __init__(self):
+        self.called = 0
+        self.cancelled = False
+
+    def double(self, value, extra=0):
+        self.called += 1
+        return value * 2 + extra
+
+    async def slow_double(self, value, delay=0):
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return value * 2
+
+    def fail(self, value):
+        raise ValueError(value)
+
+
+class TestFunctionalRequest:
+    def test_request_reply(self, pubpen):
+        responder = Responder()
+        pubpen.respond('double', responder.double)
+
+        result = pubpen.loop.run_until_complete(pubpen.request('double', 21))
+        assert result == 42
+        assert responder.called == 1
+
+    def test_request_kwargs(self, pubpen):
+        responder = Responder()
+        pubpen.respond('double', responder.double)
+
+        result = pubpen.loop.run_until_complete(pubpen.request('double', 20, extra=2))
+        assert result == 42
+
+    def test_coroutine_responder(self, pubpen):
+        responder = Responder()
+        pubpen.respond('double', responder.slow_double)
+
+        result = pubpen.loop.run_until_complete(pubpen.request('double', 21))
+        assert result == 42
+
+    def test_responder_exception(self, pubpen):
+        responder = Responder()
+        pubpen.respond('fail', responder.fail)
+
+        with pytest.raises(ValueError):
+            pubpen.loop.run_until_complete(pubpen.request('fail', 1))
+        assert len(pubpen._pending_requests) == 0
+
+    def test_no_responder(self, pubpen):
+        with pytest.raises(pubmarine.NoResponderError):
+            pubpen.loop.run_until_complete(pubpen.request('double', 1))
+
+    def test_responder_goes_away(self, pubpen):
+        responder = Responder()
+        pubpen.respond('double', responder.double)
+        del responder
+
+        with pytest.raises(pubmarine.NoResponderError):
+            pubpen.loop.run_until_complete(pubpen.request('double', 1))
+        assert 'double' not in pubpen._responders
+
+    def test_stop_responding(self, pubpen):
+        responder = Responder()
+        pubpen.respond('double', responder.double)
+        pubpen.stop_responding('double')
+
+        with pytest.raises(pubmarine.NoResponderError):
+            pubpen.loop.run_until_complete(pubpen.request('double', 1))
+
+    def test_event_list_fail(self, event_loop):
+        pubpen = PubPen(event_loop, event_list=['double'])
+        with pytest.raises(pubmarine.EventNotFoundError):
+            pubpen.respond('triple', Responder().double)
+        with pytest.raises(pubmarine.EventNotFoundError):
+            pubpen.loop.run_until_complete(pubpen.request('triple', 1))
+
+    def test_timeout(self, pubpen):
+        responder = Responder()
+        pubpen.respond('double', responder.slow_double)
+
+        with pytest.raises(asyncio.TimeoutError):
+            pubpen.loop.run_until_complete(pubpen.request('double', 1, delay=1, timeout=0.01))
+        assert len(pubpen._pending_requests) == 0
+
+    def test_timeout_cancels_responder(self, pubpen):
+        responder = Responder()
+        pubpen.respond('double', responder.slow_double)
+
+        with pytest.raises(asyncio.TimeoutError):
+            pubpen.loop.run_until_complete(pubpen.request('double', 1, delay=1, timeout=0.01))
+        pubpen.loop.run_until_complete(asyncio.sleep(0))
+        assert responder.cancelled
+
+    def test_cancel_cancels_responder(self, pubpen):
+        responder = Responder()
+        pubpen.respond('double', responder.slow_double)
+
+        request = pubpen.loop.create_task(pubpen.request('double', 1, delay=1))
+        pubpen.loop.run_until_complete(asyncio.sleep(0.01))
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            pubpen.loop.run_until_complete(request)
+        pubpen.loop.run_until_complete(asyncio.sleep(0))
+        assert responder.cancelled
+
+    def test_reply_before_timeout(self, pubpen):
+        responder = Responder()
+        pubpen.respond('double', responder.slow_double)
+
+        result = pubpen.loop.run_until_complete(pubpen.request('double', 1, timeout=1))
+        assert result == 2
+
+    def test_many_outstanding_requests(self, pubpen):
+        responder = Responder()
+        pubpen.respond('double', responder.slow_double)
+
+        async def make_requests():
+            requests = [pubpen.request('double', num, delay=0.01, timeout=0.5 + num / 1000)
+                        for num in range(1000)]
+            return await asyncio.gather(*requests)
+
+        results = pubpen.loop.run_until_complete(make_requests())
+        assert results == [num * 2 for num in range(1000)]
+        assert len(pubpen._pending_requests) == 0
+
+    def test_mixed_timeouts(self, pubpen):
+        responder = Responder()
+        pubpen.respond('double', responder.slow_double)
+
+        async def make_requests():
+            requests = [pubpen.request('double', 1, delay=0.05, timeout=timeout)
+                        for timeout in (1, 0.01, None)]
+            return await asyncio.gather(*requests, return_exceptions=True)
+
+        results = pubpen.loop.run_until_complete(make_requests())
+        assert results[0] == 2
+        assert isinstance(results[1], asyncio.TimeoutError)
+        assert results[2] == 2
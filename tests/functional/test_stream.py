@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+import pubmarine
+from pubmarine import PubPen
+
+
+@pytest.fixture
+def pubpen(request, event_loop):
+    pubpen = PubPen(event_loop)
+    return pubpen
+
+
+async def collect(stream, count):
+    items = []
+    async for item in stream:
+        items.append(item)
+        if len(items) >= count:
+            break
+    return items
+
+
+class TestFunctionalStream:
+    def test_stream_items(self, pubpen):
+        async def run():
+            async with pubpen.stream('test_event') as stream:
+                pubpen.publish('test_event', 1)
+                pubpen.publish('test_event', 2, 3)
+                pubpen.publish('test_event', 4, key='value')
+                return await collect(stream, 3)
+
+        items = pubpen.loop.run_until_complete(run())
+        assert items == [1, (2, 3), ((4,), {'key': 'value'})]
+
+    def test_stream_waits_for_publish(self, pubpen):
+        async def publisher():
+            for num in range(3):
+                await asyncio.sleep(0.001)
+                pubpen.publish('test_event', num)
+
+        async def run():
+            async with pubpen.stream('test_event') as stream:
+                task = asyncio.ensure_future(publisher())
+                items = await collect(stream, 3)
+                await task
+                return items
+
+        assert pubpen.loop.run_until_complete(run()) == [0, 1, 2]
+
+    def test_unsubscribes_on_exit(self, pubpen):
+        async def run():
+            async with pubpen.stream('test_event') as stream:
+                assert len(pubpen._event_handlers['test_event']) == 1
+            return stream
+
+        pubpen.loop.run_until_complete(run())
+        assert len(pubpen._event_handlers['test_event']) == 0
+        assert len(pubpen._subscriptions) == 0
+
+    def test_close_ends_iteration(self, pubpen):
+        async def run():
+            stream = pubpen.stream('test_event')
+            pubpen.publish('test_event', 1)
+            pubpen.loop.call_later(0.01, stream.close)
+            return await collect(stream, 10)
+
+        # Already buffered items are still returned after close
+        assert pubpen.loop.run_until_complete(run()) == [1]
+
+    def test_maxsize_drops_oldest(self, pubpen):
+        async def run():
+            async with pubpen.stream('test_event', maxsize=2) as stream:
+                for num in range(5):
+                    pubpen.publish('test_event', num)
+                return await collect(stream, 2), stream.dropped
+
+        items, dropped = pubpen.loop.run_until_complete(run())
+        assert items == [3, 4]
+        assert dropped == 3
+
+    def test_batch(self, pubpen):
+        async def run():
+            async with pubpen.stream('test_event', batch=3) as stream:
+                for num in range(5):
+                    pubpen.publish('test_event', num)
+                return await collect(stream, 2)
+
+        assert pubpen.loop.run_until_complete(run()) == [[0, 1, 2], [3, 4]]
+
+    def test_stream_event_list_fail(self, event_loop):
+        pubpen = PubPen(event_loop, event_list=['test_event'])
+        with pytest.raises(pubmarine.EventNotFoundError):
+            pubpen.stream('test_event_bad')
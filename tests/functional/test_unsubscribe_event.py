@@ -1,4 +1,3 @@
-import asyncio
 
 import pytest
 
@@ -44,8 +43,7 @@ class TestFunctionalUnsubscribe:
 
         for iteration in range(1, 3):
             pubpen.emit('test_event')
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 0
 
     def test_no_further_callbacks_made(self, pubpen):
@@ -57,14 +55,30 @@ class TestFunctionalUnsubscribe:
         first = pubpen.subscribe('test_event', self.function1)
         assert self.function1.called == 0
         pubpen.emit('test_event')
+        pubpen.loop.run_until_complete(pubpen.drain())
         pubpen.unsubscribe(first)
 
         for iteration in range(1, 3):
             pubpen.emit('test_event')
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 1
 
+    def test_pending_callbacks_cancelled(self, pubpen):
+        """
+        Subscribe to an event, publish it twice, then unsubscribe before the callbacks run.
+
+        The callbacks that were already queued are not called
+        """
+        first = pubpen.subscribe('test_event', self.function1)
+        second = pubpen.subscribe('test_event', self.function2)
+        pubpen.publish('test_event')
+        pubpen.publish('test_event')
+        pubpen.unsubscribe(first)
+
+        pubpen.loop.run_until_complete(pubpen.drain())
+        assert self.function1.called == 0
+        assert self.function2.called == 2
+
     def test_events_and_callbacks_isolated(self, pubpen):
         """
         Subscribe to two events.  Unsubscribe from one of them
@@ -80,8 +94,7 @@ class TestFunctionalUnsubscribe:
         for iteration in range(1, 3):
             pubpen.emit('test_event1')
             pubpen.emit('test_event2')
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 0
             assert self.function2.called == 1 * iteration
 
@@ -99,8 +112,7 @@ class TestFunctionalUnsubscribe:
         for iteration in range(1, 3):
             pubpen.emit('test_event1')
             pubpen.emit('test_event2')
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 1 * iteration
 
     def test_callbacks_isolated(self, pubpen):
@@ -117,7 +129,6 @@ class TestFunctionalUnsubscribe:
 
         for iteration in range(1, 3):
             pubpen.emit('test_event')
-            pending = asyncio.Task.all_tasks(loop=pubpen.loop)
-            pubpen.loop.run_until_complete(asyncio.gather(*pending, loop=pubpen.loop))
+            pubpen.loop.run_until_complete(pubpen.drain())
             assert self.function1.called == 0
             assert self.function2.called == 1 * iteration
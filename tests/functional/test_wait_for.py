@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+import pubmarine
+from pubmarine import PubPen
+
+
+@pytest.fixture
+def pubpen(request, event_loop):
+    pubpen = PubPen(event_loop)
+    return pubpen
+
+
+def publish_later(pubpen, *args, **kwargs):
+    # Give the waiter a chance to start waiting first
+    pubpen.loop.call_later(0.001, lambda: pubpen.publish(*args, **kwargs))
+
+
+class TestFunctionalWaitFor:
+    def test_wait_for(self, pubpen):
+        publish_later(pubpen, 'test_event', 1)
+        result = pubpen.loop.run_until_complete(pubpen.wait_for('test_event'))
+        assert result == 1
+
+        # Waiting does not leave anything behind
+        assert len(pubpen._waiters) == 0
+        assert len(pubpen._subscriptions) == 0
+
+    def test_wait_for_payload(self, pubpen):
+        publish_later(pubpen, 'test_event', 1, key='value')
+        result = pubpen.loop.run_until_complete(pubpen.wait_for('test_event'))
+        assert result == ((1,), {'key': 'value'})
+
+    def test_predicate(self, pubpen):
+        for num in range(5):
+            publish_later(pubpen, 'test_event', num)
+        result = pubpen.loop.run_until_complete(
+            pubpen.wait_for('test_event', predicate=lambda num: num > 2))
+        assert result == 3
+
+    def test_predicate_exception(self, pubpen):
+        def predicate(num):
+            raise ValueError(num)
+
+        publish_later(pubpen, 'test_event', 1)
+        with pytest.raises(ValueError):
+            pubpen.loop.run_until_complete(pubpen.wait_for('test_event', predicate=predicate))
+        assert len(pubpen._waiters) == 0
+
+    def test_key(self, pubpen):
+        async def run():
+            waiters = [asyncio.ensure_future(pubpen.wait_for('conn_lost', key=peer))
+                       for peer in ('peer1', 'peer2')]
+            await asyncio.sleep(0)
+            assert len(pubpen._waiters['conn_lost']) == 2
+
+            pubpen.publish('conn_lost', 'peer2', 'reset')
+            await asyncio.sleep(0)
+            assert waiters[1].result() == ('peer2', 'reset')
+            assert not waiters[0].done()
+
+            pubpen.publish('conn_lost', 'peer1', 'closed')
+            return await waiters[0]
+
+        assert pubpen.loop.run_until_complete(run()) == ('peer1', 'closed')
+        assert len(pubpen._waiters) == 0
+
+    def test_unhashable_first_arg(self, pubpen):
+        async def run():
+            keyed = asyncio.ensure_future(pubpen.wait_for('test_event', key='peer1'))
+            unkeyed = asyncio.ensure_future(pubpen.wait_for('test_event'))
+            await asyncio.sleep(0)
+            pubpen.publish('test_event', [1])
+            result = await unkeyed
+            keyed.cancel()
+            return result
+
+        assert pubpen.loop.run_until_complete(run()) == [1]
+
+    def test_timeout(self, pubpen):
+        with pytest.raises(asyncio.TimeoutError):
+            pubpen.loop.run_until_complete(pubpen.wait_for('test_event', timeout=0.01))
+        assert len(pubpen._waiters) == 0
+
+    def test_cancel(self, pubpen):
+        async def run():
+            waiter = asyncio.ensure_future(pubpen.wait_for('test_event', key='peer'))
+            await asyncio.sleep(0)
+            assert len(pubpen._waiters) == 1
+            waiter.cancel()
+            await asyncio.sleep(0)
+
+        pubpen.loop.run_until_complete(run())
+        assert len(pubpen._waiters) == 0
+
+    def test_many_waiters_one_publish(self, pubpen):
+        async def run():
+            waiters = [asyncio.ensure_future(pubpen.wait_for('test_event'))
+                       for dummy in range(100)]
+            await asyncio.sleep(0)
+            pubpen.publish('test_event', 'done')
+            return await asyncio.gather(*waiters)
+
+        assert pubpen.loop.run_until_complete(run()) == ['done'] * 100
+
+    def test_event_list_fail(self, event_loop):
+        pubpen = PubPen(event_loop, event_list=['test_event'])
+        with pytest.raises(pubmarine.EventNotFoundError):
+            pubpen.loop.run_until_complete(pubpen.wait_for('test_event_bad'))
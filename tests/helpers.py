@@ -0,0 +1,38 @@
+"""Helpers shared by the tests"""
+import asyncio
+
+
+def drain(pubpen):
+    """Run the event loop until every queued delivery has run"""
+    pubpen.loop.run_until_complete(pubpen.drain())
+
+
+def advance(pubpen, seconds):
+    """Move the loop's clock forward, running the timers that come due on the way"""
+    pubpen.loop.run_until_complete(asyncio.sleep(seconds))
+
+
+class Recorder:
+    """A subscriber that remembers what it was called with
+
+    :kwarg clock: If given, a function such as ``loop.time`` that is read on each call
+    """
+    def __init__(self, clock=None):
+        self.clock = clock
+        #: The positional arguments of each call
+        self.calls = []
+        #: The keyword arguments of each call
+        self.kwargs = []
+        #: The clock's reading at each call, when a clock was given
+        self.times = []
+
+    def __call__(self, *args, **kwargs):
+        if self.clock is not None:
+            self.times.append(self.clock())
+        self.calls.append(args)
+        self.kwargs.append(kwargs)
+
+    @property
+    def values(self):
+        """The first argument of each call"""
+        return [args[0] for args in self.calls]
@@ -0,0 +1,115 @@
+import gc
+
+import pytest
+
+from helpers import Recorder, advance
+
+
+class TestAggregate:
+    def test_tumbling(self, pubpen):
+        recorder = Recorder()
+        pubpen.aggregate('latency', recorder, window=1)
+        for value in (3, 1, 2):
+            pubpen.publish('latency', value)
+        advance(pubpen, 1.05)
+        pubpen.publish('latency', 10)
+        advance(pubpen, 1)
+
+        first, second = recorder.values
+        assert first['event'] == 'latency'
+        assert (first['count'], first['sum'], first['min'], first['max'], first['mean']) == \
+            (3, 6, 1, 3, 2)
+        assert first['end'] - first['start'] == pytest.approx(1)
+        assert (second['count'], second['sum']) == (1, 10)
+
+    def test_no_deliveries_queued(self, pubpen):
+        recorder = Recorder()
+        pubpen.aggregate('latency', recorder, window=1)
+        calls = []
+        pubpen.loop.call_soon = lambda *args, **kwargs: calls.append(args)
+        for value in range(100):
+            pubpen.publish('latency', value)
+        assert calls == []
+
+    def test_sliding(self, pubpen):
+        recorder = Recorder()
+        pubpen.aggregate('latency', recorder, window=3, step=1)
+        for value in (1, 2, 3, 4):
+            pubpen.publish('latency', value)
+            advance(pubpen, 1)
+        assert [s['sum'] for s in recorder.values] == [1, 3, 6, 9]
+        advance(pubpen, 2)
+        assert [s['sum'] for s in recorder.values[4:]] == [7, 4]
+
+    def test_value(self, pubpen):
+        recorder = Recorder()
+        pubpen.aggregate('request', recorder, window=1,
+                         value=lambda path, elapsed: elapsed)
+        pubpen.publish('request', '/', elapsed=0.5)
+        pubpen.publish('request', '/about', elapsed=1.5)
+        advance(pubpen, 1)
+        assert recorder.values[0]['sum'] == 2
+
+    def test_percentiles(self, pubpen):
+        recorder = Recorder()
+        pubpen.aggregate('latency', recorder, window=2, step=1, bounds=(1, 2, 4, 8))
+        for dummy in range(90):
+            pubpen.publish('latency', 0.5)
+        advance(pubpen, 1)
+        for dummy in range(10):
+            pubpen.publish('latency', 7)
+        advance(pubpen, 1)
+        summary = recorder.values[1]
+        assert summary['count'] == 100
+        assert summary['p50'] <= 1
+        assert 4 < summary['p99'] <= 8
+
+    def test_emit_empty(self, pubpen):
+        quiet = Recorder()
+        chatty = Recorder()
+        pubpen.aggregate('latency', quiet, window=1)
+        pubpen.aggregate('latency', chatty, window=1, emit_empty=True)
+        advance(pubpen, 2.05)
+        assert quiet.values == []
+        assert [s['count'] for s in chatty.values] == [0, 0]
+        assert chatty.values[0]['min'] is None
+        assert chatty.values[0]['mean'] is None
+
+    def test_close(self, pubpen):
+        recorder = Recorder()
+        aggregation = pubpen.aggregate('latency', recorder, window=1)
+        pubpen.publish('latency', 1)
+        aggregation.close()
+        aggregation.close()
+        assert 'latency' not in pubpen._aggregations
+        pubpen.publish('latency', 1)
+        advance(pubpen, 2)
+        assert recorder.values == []
+
+    def test_dead_callback(self, pubpen):
+        recorder = Recorder()
+        pubpen.aggregate('latency', recorder, window=1)
+        del recorder
+        gc.collect()
+        advance(pubpen, 1.05)
+        assert pubpen._aggregations == {}
+
+    def test_typed_event(self, pubpen):
+        class Request:
+            def __init__(self, elapsed):
+                self.elapsed = elapsed
+
+        recorder = Recorder()
+        pubpen.aggregate(Request, recorder, window=1, value=lambda request: request.elapsed)
+        pubpen.publish(Request(2))
+        advance(pubpen, 1)
+        assert recorder.values[0]['sum'] == 2
+
+    def test_validation(self, pubpen):
+        recorder = Recorder()
+        with pytest.raises(ValueError):
+            pubpen.aggregate('latency', recorder, window=0)
+        with pytest.raises(ValueError):
+            pubpen.aggregate('latency', recorder, window=1, step=2)
+        with pytest.raises(ValueError):
+            pubpen.aggregate('latency', recorder, window=1, step=0.3)
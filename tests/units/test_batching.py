@@ -0,0 +1,189 @@
+import gc
+
+import pytest
+
+from helpers import Recorder, advance, drain
+
+
+class TestBatchSize:
+    def test_full_batches(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('sample', recorder, batch_size=3)
+        for value in range(7):
+            pubpen.publish('sample', value)
+        drain(pubpen)
+        assert recorder.values == [[0, 1, 2], [3, 4, 5]]
+
+    def test_one_loop_callback_per_batch(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('sample', recorder, batch_size=10)
+        calls = []
+        call_soon = pubpen.loop.call_soon
+
+        def counting_call_soon(*args, **kwargs):
+            calls.append(args)
+            return call_soon(*args, **kwargs)
+        pubpen.loop.call_soon = counting_call_soon
+        for value in range(100):
+            pubpen.publish('sample', value)
+        assert len(calls) == 10
+
+    def test_payloads(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('sample', recorder, batch_size=3)
+        pubpen.publish('sample', 1)
+        pubpen.publish('sample', 1, 2)
+        pubpen.publish('sample', 1, key=2)
+        drain(pubpen)
+        assert recorder.values == [[1, (1, 2), ((1,), {'key': 2})]]
+
+    def test_unsubscribe_cancels(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe('sample', recorder, batch_size=2, max_delay=1)
+        for value in range(3):
+            pubpen.publish('sample', value)
+        pubpen.unsubscribe(sub_id)
+        advance(pubpen, 2)
+        assert recorder.values == []
+        assert pubpen._batches == {}
+
+    def test_dead_callback(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('sample', recorder, batch_size=2, max_delay=1)
+        pubpen.publish('sample', 1)
+        del recorder
+        gc.collect()
+        pubpen.publish('sample', 2)
+        advance(pubpen, 2)
+        assert pubpen._batches == {}
+
+    def test_other_subscribers(self, pubpen):
+        recorder = Recorder()
+        single = []
+
+        def one(value):
+            single.append(value)
+        pubpen.subscribe('sample', recorder, batch_size=2)
+        pubpen.subscribe('sample', one)
+        pubpen.publish('sample', 1)
+        pubpen.publish('sample', 2)
+        drain(pubpen)
+        assert recorder.values == [[1, 2]]
+        assert single == [1, 2]
+
+
+class TestMaxDelay:
+    def test_partial_batch(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('sample', recorder, batch_size=10, max_delay=0.5)
+        pubpen.publish('sample', 1)
+        advance(pubpen, 0.25)
+        pubpen.publish('sample', 2)
+        advance(pubpen, 0.3)
+        assert recorder.values == [[1, 2]]
+        pubpen.publish('sample', 3)
+        advance(pubpen, 0.55)
+        assert recorder.values == [[1, 2], [3]]
+
+    def test_delay_only(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('sample', recorder, max_delay=1)
+        for value in range(50):
+            pubpen.publish('sample', value)
+        drain(pubpen)
+        assert recorder.values == []
+        advance(pubpen, 1.05)
+        assert recorder.values == [list(range(50))]
+
+    def test_full_batch_restarts_delay(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('sample', recorder, batch_size=2, max_delay=1)
+        pubpen.publish('sample', 1)
+        advance(pubpen, 0.9)
+        pubpen.publish('sample', 2)
+        pubpen.publish('sample', 3)
+        advance(pubpen, 0.5)
+        assert recorder.values == [[1, 2]]
+        advance(pubpen, 0.55)
+        assert recorder.values == [[1, 2], [3]]
+
+
+class TestBatchingWithOtherFeatures:
+    def test_retained(self, pubpen):
+        pubpen.retain('sample', history=3)
+        for value in range(3):
+            pubpen.publish('sample', value)
+        recorder = Recorder()
+        pubpen.subscribe('sample', recorder, retained=True, batch_size=3)
+        drain(pubpen)
+        assert recorder.values == [[0, 1, 2]]
+
+    def test_pause_keep_last(self, pubpen):
+        recorder = Recorder()
+        subscription = pubpen.subscribe('sample', recorder, batch_size=2, handle=True)
+        subscription.pause(keep_last=True)
+        pubpen.publish('sample', 1)
+        pubpen.publish('sample', 2)
+        subscription.resume()
+        pubpen.publish('sample', 3)
+        drain(pubpen)
+        assert recorder.values == [[2, 3]]
+
+    def test_pause_keeps_batches(self, pubpen):
+        recorder = Recorder()
+        subscription = pubpen.subscribe('sample', recorder, batch_size=2, handle=True)
+        pubpen.publish('sample', 1)
+        pubpen.publish('sample', 2)
+        # The full batch is already queued when the subscription is paused
+        subscription.pause()
+        drain(pubpen)
+        assert recorder.values == []
+        subscription.resume()
+        pubpen.publish('sample', 3)
+        pubpen.publish('sample', 4)
+        drain(pubpen)
+        assert recorder.values == [[1, 2], [3, 4]]
+
+    def test_pause_keeps_delayed_batch(self, pubpen):
+        recorder = Recorder()
+        subscription = pubpen.subscribe('sample', recorder, max_delay=1, handle=True)
+        pubpen.publish('sample', 1)
+        subscription.pause()
+        advance(pubpen, 1.05)
+        assert recorder.values == []
+        subscription.resume()
+        drain(pubpen)
+        assert recorder.values == [[1]]
+
+    def test_unsubscribe_while_paused(self, pubpen):
+        recorder = Recorder()
+        subscription = pubpen.subscribe('sample', recorder, max_delay=1, handle=True)
+        pubpen.publish('sample', 1)
+        subscription.pause()
+        advance(pubpen, 1.05)
+        subscription.unsubscribe()
+        drain(pubpen)
+        assert recorder.values == []
+
+    def test_typed_events(self, pubpen):
+        class Tick:
+            pass
+
+        recorder = Recorder()
+        pubpen.subscribe(Tick, recorder, batch_size=2)
+        ticks = [Tick(), Tick()]
+        for tick in ticks:
+            pubpen.publish(tick)
+        drain(pubpen)
+        assert recorder.values == [ticks]
+
+    def test_validation(self, pubpen):
+        recorder = Recorder()
+        with pytest.raises(ValueError):
+            pubpen.subscribe('sample', recorder, batch_size=0)
+        with pytest.raises(ValueError):
+            pubpen.subscribe('sample', recorder, max_delay=0)
+        with pytest.raises(ValueError):
+            pubpen.subscribe('sample', recorder, batch_size=2, once=True)
+        with pytest.raises(ValueError):
+            pubpen.subscribe('sample', recorder, max_delay=1, max_calls=2)
@@ -0,0 +1,137 @@
+from unittest import mock
+
+import pytest
+
+from pubmarine import PubPen
+from pubmarine.breaker import EXECUTOR, REPORT, SUSPEND, SlowSubscriberBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_pubpen(event_loop, clock, **kwargs):
+    pubpen = PubPen(event_loop)
+    pubpen.loop = mock.MagicMock()
+    pubpen.enable_breaker(SlowSubscriberBreaker(budget=0.01, clock=clock, **kwargs))
+
+    def slow_handler():
+        clock.now += 0.05
+        return 'slow'
+
+    def fast_handler():
+        return 'fast'
+
+    pubpen._subscriptions[0] = 'test_event'
+    pubpen._subscriptions[1] = 'test_event'
+    pubpen._event_handlers['test_event'][0] = lambda: slow_handler
+    pubpen._event_handlers['test_event'][1] = lambda: fast_handler
+    return pubpen
+
+
+def publish_and_run(pubpen):
+    pubpen.loop.call_soon.reset_mock()
+    pubpen.publish('test_event')
+    return [call[0][0]() for call in pubpen.loop.call_soon.call_args_list]
+
+
+class TestSlowSubscriberBreaker:
+    def test_bad_action(self):
+        with pytest.raises(ValueError):
+            SlowSubscriberBreaker(action='explode')
+
+    def test_report(self, event_loop, clock):
+        slow_calls = []
+        pubpen = make_pubpen(event_loop, clock, trip_after=1,
+                             on_slow=lambda *args: slow_calls.append(args))
+
+        for dummy in range(3):
+            assert publish_and_run(pubpen) == ['slow', 'fast']
+
+        offenders = pubpen.breaker.offenders()
+        assert list(offenders) == [0]
+        assert offenders[0]['slow_calls'] == 3
+        assert offenders[0]['worst'] == pytest.approx(0.05)
+        assert offenders[0]['status'] == 'active'
+        assert offenders[0]['trips'] == 0
+        assert [call[:2] for call in slow_calls] == [('test_event', 0)] * 3
+
+    def test_suspend(self, event_loop, clock):
+        pubpen = make_pubpen(event_loop, clock, trip_after=2, action=SUSPEND, cooldown=1.0)
+
+        assert publish_and_run(pubpen) == ['slow', 'fast']
+        assert publish_and_run(pubpen) == ['slow', 'fast']
+        # Tripped: the slow subscriber is skipped
+        assert publish_and_run(pubpen) == ['fast']
+
+        offenders = pubpen.breaker.offenders()
+        assert offenders[0]['status'] == SUSPEND
+        assert offenders[0]['trips'] == 1
+        assert offenders[0]['skipped'] == 1
+
+        # After the cooldown it is delivered to again
+        clock.now += 1.0
+        assert publish_and_run(pubpen) == ['slow', 'fast']
+        assert pubpen.breaker.offenders()[0]['status'] == 'active'
+
+    def test_strikes_must_be_consecutive(self, event_loop, clock):
+        pubpen = make_pubpen(event_loop, clock, trip_after=2, action=SUSPEND)
+        slow = [True, False, True, False]
+
+        def sometimes_slow_handler():
+            if slow.pop(0):
+                clock.now += 0.05
+            return 'sometimes'
+        pubpen._event_handlers['test_event'][0] = lambda: sometimes_slow_handler
+
+        for dummy in range(4):
+            assert publish_and_run(pubpen) == ['sometimes', 'fast']
+        assert pubpen.breaker.offenders()[0]['trips'] == 0
+
+    def test_executor(self, event_loop, clock):
+        pubpen = make_pubpen(event_loop, clock, trip_after=1, action=EXECUTOR, cooldown=1.0)
+
+        publish_and_run(pubpen)
+        pubpen.loop.run_in_executor.reset_mock()
+        publish_and_run(pubpen)
+
+        assert pubpen.loop.run_in_executor.call_count == 1
+        executor, func = pubpen.loop.run_in_executor.call_args[0]
+        assert executor is None
+        assert func() == 'slow'
+
+    def test_sampling(self, event_loop, clock):
+        pubpen = make_pubpen(event_loop, clock, trip_after=1, sample_every=2)
+        del pubpen._event_handlers['test_event'][1]
+
+        publish_and_run(pubpen)
+        assert pubpen.breaker.offenders() == {}
+        publish_and_run(pubpen)
+        assert pubpen.breaker.offenders()[0]['slow_calls'] == 1
+
+    def test_unsubscribe_forgets(self, event_loop, clock):
+        pubpen = make_pubpen(event_loop, clock, trip_after=1)
+        publish_and_run(pubpen)
+        pubpen.unsubscribe(0)
+        assert pubpen.breaker.offenders() == {}
+
+    def test_disable(self, event_loop, clock):
+        pubpen = make_pubpen(event_loop, clock, trip_after=1, action=SUSPEND)
+        publish_and_run(pubpen)
+        pubpen.disable_breaker()
+        assert publish_and_run(pubpen) == ['slow', 'fast']
+
+    def test_default_breaker_reports(self, event_loop):
+        pubpen = PubPen(event_loop)
+        breaker = pubpen.enable_breaker()
+        assert breaker.action == REPORT
+        assert pubpen.breaker is breaker
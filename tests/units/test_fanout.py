@@ -0,0 +1,178 @@
+import array
+
+import pytest
+
+from helpers import Recorder
+
+
+class LogRecorder(Recorder):
+    """Also appends its name and arguments to a log shared by several subscribers"""
+    def __init__(self, log, name):
+        super().__init__()
+        self.log = log
+        self.name = name
+
+    def __call__(self, *args, **kwargs):
+        super().__call__(*args, **kwargs)
+        self.log.append((self.name,) + args)
+
+
+@pytest.fixture
+def pubpen(pubpen):
+    pubpen.enable_chunked_fanout(chunk_size=2)
+    return pubpen
+
+
+def subscribe(pubpen, count, log, event='test_event'):
+    recorders = [LogRecorder(log, num) for num in range(count)]
+    for recorder in recorders:
+        pubpen.subscribe(event, recorder)
+    return recorders
+
+
+def run_once(pubpen):
+    """Run one iteration of the event loop"""
+    pubpen.loop.call_soon(pubpen.loop.stop)
+    pubpen.loop.run_forever()
+
+
+def run_all(pubpen):
+    while pubpen._fanout_queue:
+        run_once(pubpen)
+
+
+class TestChunkedFanout:
+    def test_small_fanout_not_chunked(self, pubpen):
+        log = []
+        recorders = subscribe(pubpen, 2, log)
+        pubpen.publish('test_event', 1)
+        assert not pubpen._fanout_queue
+        run_once(pubpen)
+        assert log == [(0, 1), (1, 1)]
+
+    def test_slices(self, pubpen):
+        log = []
+        recorders = subscribe(pubpen, 5, log)
+        pubpen.publish('test_event', 1)
+        run_once(pubpen)
+        assert log == [(0, 1), (1, 1)]
+        run_once(pubpen)
+        assert log == [(0, 1), (1, 1), (2, 1), (3, 1)]
+        run_all(pubpen)
+        assert len(log) == 5
+
+    def test_io_runs_between_slices(self, pubpen):
+        log = []
+        recorders = subscribe(pubpen, 6, log)
+        pubpen.publish('test_event', 1)
+        pubpen.loop.call_soon(log.append, 'io')
+        run_all(pubpen)
+        assert log.index('io') < 4
+
+    def test_ordering_per_subscriber(self, pubpen):
+        log = []
+        recorders = subscribe(pubpen, 3, log)
+        pubpen.publish('test_event', 1)
+        # Drop below the chunk size.  This publication must still queue behind the first one.
+        pubpen.unsubscribe(0)
+        pubpen.publish('test_event', 2)
+        run_all(pubpen)
+        assert [entry for entry in log if entry[0] == 2] == [(2, 1), (2, 2)]
+        assert [entry for entry in log if entry[0] == 1] == [(1, 1), (1, 2)]
+
+    def test_time_budget(self, pubpen):
+        log = []
+        recorders = subscribe(pubpen, 5, log)
+        pubpen.enable_chunked_fanout(chunk_size=2, time_budget=0)
+        pubpen.publish('test_event', 1)
+        run_once(pubpen)
+        assert log == [(0, 1)]
+
+    def test_time_budget_only(self, pubpen):
+        log = []
+        recorders = subscribe(pubpen, 1, log)
+        pubpen.enable_chunked_fanout(chunk_size=None, time_budget=0)
+        pubpen.publish('test_event', 1)
+        assert pubpen._fanout_queue
+        run_all(pubpen)
+        assert log == [(0, 1)]
+
+    def test_needs_a_limit(self, pubpen):
+        with pytest.raises(ValueError):
+            pubpen.enable_chunked_fanout(chunk_size=None)
+
+    def test_exception_does_not_stop_slice(self, pubpen):
+        log = []
+        errors = []
+        pubpen.loop.set_exception_handler(lambda loop, context: errors.append(context))
+
+        def failing(*args):
+            raise ValueError('boom')
+        recorders = subscribe(pubpen, 2, log)
+        pubpen.subscribe('test_event', failing)
+        pubpen.publish('test_event', 1)
+        run_all(pubpen)
+        assert log == [(0, 1), (1, 1)]
+        assert isinstance(errors[0]['exception'], ValueError)
+
+    def test_disable_finishes_queue(self, pubpen):
+        log = []
+        recorders = subscribe(pubpen, 5, log)
+        pubpen.publish('test_event', 1)
+        pubpen.disable_chunked_fanout()
+        run_once(pubpen)
+        assert len(log) == 5
+        assert not pubpen._fanout_queue
+
+
+class TestChunkedFanoutOrdering:
+    def test_publisher_context(self, pubpen):
+        contextvars = pytest.importorskip('contextvars')
+        request_id = contextvars.ContextVar('request_id', default=None)
+        seen = []
+
+        def record(value):
+            seen.append((value, request_id.get()))
+        for dummy in range(3):
+            pubpen.subscribe('test_event', record)
+
+        def publish(value):
+            request_id.set(value)
+            pubpen.publish('test_event', value)
+        # The second publication is queued behind the first and run by the same slice callback
+        contextvars.copy_context().run(publish, 'first')
+        contextvars.copy_context().run(publish, 'second')
+        run_all(pubpen)
+        assert seen == [('first', 'first')] * 3 + [('second', 'second')] * 3
+
+    def test_retained_replay_waits(self, pubpen):
+        log = []
+        recorders = subscribe(pubpen, 3, log)
+        pubpen.retain('other_event')
+        pubpen.publish('other_event', 'retained')
+        pubpen.publish('test_event', 1)
+        late = LogRecorder(log, 'late')
+        pubpen.subscribe('other_event', late, retained=True)
+        run_all(pubpen)
+        assert log[-1] == ('late', 'retained')
+
+    def test_columnar_waits(self, pubpen):
+        log = []
+        recorders = subscribe(pubpen, 3, log)
+        columnar = LogRecorder(log, 'columnar')
+        pubpen.subscribe('other_event', columnar, columnar=True)
+        pubpen.publish('test_event', 1)
+        pubpen.publish_array('other_event', array.array('i', [1, 2]))
+        run_all(pubpen)
+        assert log[:3] == [(0, 1), (1, 1), (2, 1)]
+        assert log[3][0] == 'columnar'
+
+    def test_batch_waits(self, pubpen):
+        log = []
+        recorders = subscribe(pubpen, 3, log)
+        batched = LogRecorder(log, 'batch')
+        pubpen.subscribe('other_event', batched, batch_size=1)
+        pubpen.publish('test_event', 1)
+        pubpen.publish('other_event', 2)
+        run_all(pubpen)
+        assert log == [(0, 1), (1, 1), (2, 1), ('batch', [2])]
@@ -0,0 +1,167 @@
+import pytest
+
+from helpers import Recorder, drain
+
+
+class Base:
+    pass
+
+
+class Child(Base):
+    pass
+
+
+def redact(event, args, kwargs):
+    kwargs.pop('password', None)
+    return args, kwargs
+
+
+def drop(event, args, kwargs):
+    return None
+
+
+class TestPublishInterceptors:
+    def test_no_interceptors(self, pubpen):
+        assert pubpen._interceptors is None
+
+    def test_modify(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('login', recorder)
+        pubpen.add_publish_interceptor(redact)
+        pubpen.publish('login', 'user', password='secret')
+        drain(pubpen)
+        assert recorder.calls == [('user',)]
+        assert recorder.kwargs == [{}]
+
+    def test_drop(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('test_event', recorder)
+        pubpen.retain('test_event')
+        pubpen.add_publish_interceptor(drop)
+        pubpen.publish('test_event', 1)
+        drain(pubpen)
+        assert recorder.calls == []
+        assert not pubpen._retention['test_event'].items
+
+    def test_raise_propagates(self, pubpen):
+        def deny(event, args, kwargs):
+            raise PermissionError(event)
+        pubpen.add_publish_interceptor(deny)
+        with pytest.raises(PermissionError):
+            pubpen.publish('test_event')
+
+    def test_chain_order(self, pubpen):
+        seen = []
+
+        def first(event, args, kwargs):
+            seen.append(('first', args))
+            return args + ('first',), kwargs
+
+        def second(event, args, kwargs):
+            seen.append(('second', args))
+            return args + ('second',), kwargs
+        recorder = Recorder()
+        pubpen.subscribe('test_event', recorder)
+        pubpen.add_publish_interceptor(first)
+        pubpen.add_publish_interceptor(second)
+        pubpen.publish('test_event')
+        drain(pubpen)
+        assert seen == [('first', ()), ('second', ('first',))]
+        assert recorder.calls == [('first', 'second')]
+
+    def test_events_filter(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('login', recorder)
+        pubpen.subscribe('other', recorder)
+        pubpen.add_publish_interceptor(drop, events=['other'])
+        pubpen.publish('login', 1)
+        pubpen.publish('other', 2)
+        drain(pubpen)
+        assert recorder.calls == [(1,)]
+        assert pubpen._interceptors.for_event('login') == (None, None)
+
+    def test_typed_events_filter(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe(Base, recorder)
+        pubpen.add_publish_interceptor(drop, events=[Base])
+        pubpen.publish(Child())
+        drain(pubpen)
+        assert recorder.calls == []
+
+    def test_remove(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('test_event', recorder)
+        pubpen.add_publish_interceptor(drop)
+        pubpen.publish('test_event', 1)
+        pubpen.remove_interceptor(drop)
+        assert pubpen._interceptors is None
+        pubpen.publish('test_event', 2)
+        drain(pubpen)
+        assert recorder.calls == [(2,)]
+        # Removing again is fine
+        pubpen.remove_interceptor(drop)
+
+
+class TestDeliveryInterceptors:
+    def test_wrap(self, pubpen):
+        log = []
+
+        def around(event, sub_id, deliver):
+            def wrapped():
+                log.append(('before', event, sub_id))
+                deliver()
+                log.append('after')
+            return wrapped
+        recorder = Recorder()
+        sub_id = pubpen.subscribe('test_event', recorder)
+        pubpen.add_delivery_interceptor(around)
+        pubpen.publish('test_event', 1)
+        drain(pubpen)
+        assert log == [('before', 'test_event', sub_id), 'after']
+        assert recorder.calls == [(1,)]
+
+    def test_skip(self, pubpen):
+        first = Recorder()
+        second = Recorder()
+        first_id = pubpen.subscribe('test_event', first)
+        pubpen.subscribe('test_event', second)
+
+        def skip_first(event, sub_id, deliver):
+            return None if sub_id == first_id else deliver
+        pubpen.add_delivery_interceptor(skip_first)
+        pubpen.publish('test_event', 1)
+        drain(pubpen)
+        assert first.calls == []
+        assert second.calls == [(1,)]
+
+    def test_first_added_is_outermost(self, pubpen):
+        log = []
+
+        def make(name):
+            def interceptor(event, sub_id, deliver):
+                def wrapped():
+                    log.append(name)
+                    deliver()
+                return wrapped
+            return interceptor
+        recorder = Recorder()
+        pubpen.subscribe('test_event', recorder)
+        outer = make('outer')
+        inner = make('inner')
+        pubpen.add_delivery_interceptor(outer)
+        pubpen.add_delivery_interceptor(inner)
+        pubpen.publish('test_event')
+        drain(pubpen)
+        assert log == ['outer', 'inner']
+        assert len(recorder.calls) == 1
+
+    def test_unsubscribe_still_cancels(self, pubpen):
+        def passthrough(event, sub_id, deliver):
+            return deliver
+        recorder = Recorder()
+        sub_id = pubpen.subscribe('test_event', recorder)
+        pubpen.add_delivery_interceptor(passthrough)
+        pubpen.publish('test_event')
+        pubpen.unsubscribe(sub_id)
+        drain(pubpen)
+        assert recorder.calls == []
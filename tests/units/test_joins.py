@@ -0,0 +1,145 @@
+import pytest
+
+from pubmarine import EventNotFoundError, PubPen
+from pubmarine.joins import Join
+from pubmarine.testing import VirtualTimeLoop
+
+from helpers import Recorder, advance, drain
+
+
+@pytest.fixture
+def results(pubpen):
+    done, lost = Recorder(), Recorder()
+    pubpen.subscribe('done', done)
+    pubpen.subscribe('lost', lost)
+    return done, lost
+
+
+class TestJoin:
+    def test_pairs(self, pubpen, results):
+        done, lost = results
+        join = Join(pubpen, 'sent', 'received', 'done', timeout=1, timeout_event='lost')
+        pubpen.publish('sent', 1, 'ping')
+        pubpen.publish('sent', 2, 'ping')
+        pubpen.publish('received', 2, 'pong')
+        pubpen.publish('received', 1, 'pong')
+        drain(pubpen)
+        assert done.calls == [(2, (2, 'ping'), (2, 'pong')), (1, (1, 'ping'), (1, 'pong'))]
+        assert lost.calls == []
+        assert len(join) == 0
+        join.close()
+
+    def test_right_first(self, pubpen, results):
+        done, dummy = results
+        join = Join(pubpen, 'sent', 'received', 'done', timeout=1)
+        pubpen.publish('received', 1, 'pong')
+        pubpen.publish('sent', 1, 'ping')
+        drain(pubpen)
+        assert done.calls == [(1, (1, 'ping'), (1, 'pong'))]
+        join.close()
+
+    def test_key_functions(self, pubpen, results):
+        done, dummy = results
+        join = Join(pubpen, 'sent', 'received', 'done', timeout=1,
+                    left_key=lambda request_id: request_id,
+                    right_key=lambda body, request_id=None: request_id)
+        pubpen.publish('sent', 'a')
+        pubpen.publish('received', 'pong', request_id='a')
+        drain(pubpen)
+        assert done.calls == [('a', 'a', (('pong',), {'request_id': 'a'}))]
+        join.close()
+
+    def test_timeout(self, pubpen, results):
+        done, lost = results
+        join = Join(pubpen, 'sent', 'received', 'done', timeout=1, timeout_event='lost')
+        pubpen.publish('sent', 1)
+        advance(pubpen, 0.5)
+        pubpen.publish('received', 2)
+        advance(pubpen, 0.55)
+        assert lost.calls == [(1, 1, None)]
+        advance(pubpen, 0.5)
+        assert lost.calls == [(1, 1, None), (2, None, 2)]
+        # Too late to pair up
+        pubpen.publish('received', 1)
+        drain(pubpen)
+        assert done.calls == []
+        assert len(join) == 1
+        join.close()
+
+    def test_timeout_without_event(self, pubpen, results):
+        join = Join(pubpen, 'sent', 'received', 'done', timeout=1)
+        pubpen.publish('sent', 1)
+        advance(pubpen, 1.05)
+        assert len(join) == 0
+        join.close()
+
+    def test_same_side_replaces(self, pubpen, results):
+        done, lost = results
+        join = Join(pubpen, 'sent', 'received', 'done', timeout=1, timeout_event='lost')
+        pubpen.publish('sent', 1, 'first')
+        pubpen.publish('sent', 1, 'second')
+        pubpen.publish('received', 1, 'pong')
+        drain(pubpen)
+        assert lost.calls == [(1, (1, 'first'), None)]
+        assert done.calls == [(1, (1, 'second'), (1, 'pong'))]
+        join.close()
+
+    def test_evict(self, pubpen, results):
+        dummy, lost = results
+        join = Join(pubpen, 'sent', 'received', 'done', timeout=1, timeout_event='lost',
+                    max_pending=2)
+        for request_id in range(4):
+            pubpen.publish('sent', request_id)
+        drain(pubpen)
+        assert lost.calls == [(0, 0, None), (1, 1, None)]
+        assert len(join) == 2
+        join.close()
+
+    def test_drop(self, pubpen, results):
+        dummy, lost = results
+        join = Join(pubpen, 'sent', 'received', 'done', timeout=1, timeout_event='lost',
+                    max_pending=2, overflow='drop')
+        for request_id in range(4):
+            pubpen.publish('sent', request_id)
+        drain(pubpen)
+        assert lost.calls == [(2, 2, None), (3, 3, None)]
+        assert len(join) == 2
+        join.close()
+
+    def test_memory_levels_off(self, pubpen, results):
+        join = Join(pubpen, 'sent', 'received', 'done', timeout=1)
+        for second in range(5):
+            for request_id in range(second * 100, second * 100 + 100):
+                pubpen.publish('sent', request_id)
+            advance(pubpen, 1)
+            assert len(join) <= 100
+        join.close()
+
+    def test_close(self, pubpen, results):
+        done, lost = results
+        join = Join(pubpen, 'sent', 'received', 'done', timeout=1, timeout_event='lost')
+        pubpen.publish('sent', 1)
+        drain(pubpen)
+        join.close()
+        join.close()
+        pubpen.publish('received', 1)
+        advance(pubpen, 2)
+        assert done.calls == []
+        assert lost.calls == []
+
+    def test_validation(self, pubpen):
+        with pytest.raises(ValueError):
+            Join(pubpen, 'sent', 'sent', 'done', timeout=1)
+        with pytest.raises(ValueError):
+            Join(pubpen, 'sent', 'received', 'done', timeout=0)
+        with pytest.raises(ValueError):
+            Join(pubpen, 'sent', 'received', 'done', timeout=1, max_pending=0)
+        with pytest.raises(ValueError):
+            Join(pubpen, 'sent', 'received', 'done', timeout=1, overflow='block')
+
+    def test_unregistered_event(self):
+        loop = VirtualTimeLoop()
+        pubpen = PubPen(loop, event_list=['sent', 'received', 'done'])
+        with pytest.raises(EventNotFoundError):
+            Join(pubpen, 'sent', 'received', 'done', timeout=1, timeout_event='lost')
+        loop.close()
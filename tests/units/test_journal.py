@@ -0,0 +1,235 @@
+import os
+from unittest import mock
+
+import pytest
+
+from pubmarine import PubPen
+from pubmarine.journal import EventJournal, JournalError
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = EventJournal(str(tmp_path), segment_size=256)
+    yield journal
+    journal.close()
+
+
+@pytest.fixture
+def pubpen(event_loop):
+    pubpen = PubPen(event_loop)
+    pubpen.publish = mock.MagicMock()
+    return pubpen
+
+
+def segment_files(directory):
+    return sorted(n for n in os.listdir(directory) if n.endswith('.seg'))
+
+
+class TestEventJournal:
+    def test_append_assigns_sequence(self, journal):
+        assert journal.last_seq == 0
+        assert journal.append('test_event', 1) == 1
+        assert journal.append('test_event', 2) == 2
+        assert journal.last_seq == 2
+
+    def test_read(self, journal):
+        journal.append('test_event1', 1, 2)
+        journal.append('test_event2', key='value')
+
+        records = list(journal.read())
+        assert records == [(1, 'test_event1', (1, 2), {}),
+                           (2, 'test_event2', (), {'key': 'value'})]
+
+    def test_read_from_start(self, journal):
+        for num in range(10):
+            journal.append('test_event', num)
+
+        records = list(journal.read(start=8))
+        assert [r[0] for r in records] == [8, 9, 10]
+        assert [r[2] for r in records] == [(7,), (8,), (9,)]
+
+    def test_segments_roll(self, journal, tmp_path):
+        for num in range(50):
+            journal.append('test_event', num)
+
+        assert len(segment_files(str(tmp_path))) > 1
+        assert [r[2][0] for r in journal.read()] == list(range(50))
+        assert [r[0] for r in journal.read(start=37)] == list(range(37, 51))
+
+    def test_oversized_record(self, journal):
+        journal.append('test_event', 'a')
+        journal.append('test_event', 'b' * 1000)
+        journal.append('test_event', 'c')
+        assert [r[2][0] for r in journal.read()] == ['a', 'b' * 1000, 'c']
+
+    def test_reopen_recovers(self, tmp_path):
+        with EventJournal(str(tmp_path), segment_size=256) as journal:
+            for num in range(30):
+                journal.append('test_event', num)
+
+        with EventJournal(str(tmp_path), segment_size=256) as journal:
+            assert journal.last_seq == 30
+            assert journal.append('test_event', 30) == 31
+            assert [r[2][0] for r in journal.read()] == list(range(31))
+
+    def test_torn_write_ignored(self, tmp_path):
+        with EventJournal(str(tmp_path), segment_size=4096) as journal:
+            journal.append('test_event', 1)
+            journal.append('test_event', 2)
+
+        # Corrupt the payload of the last record
+        path = os.path.join(str(tmp_path), segment_files(str(tmp_path))[-1])
+        with open(path, 'r+b') as f:
+            data = bytearray(f.read())
+            end = data.index(b'\x00' * 16, 40)
+            data[end - 2] ^= 0xff
+            f.seek(0)
+            f.write(data)
+
+        with EventJournal(str(tmp_path), segment_size=4096) as journal:
+            assert journal.last_seq == 1
+            assert journal.append('test_event', 3) == 2
+            assert [r[2][0] for r in journal.read()] == [1, 3]
+
+    def test_offsets(self, journal):
+        assert journal.offset('consumer') == 0
+        journal.commit('consumer', 12)
+        assert journal.offset('consumer') == 12
+
+    def test_bad_consumer_name(self, journal):
+        with pytest.raises(JournalError):
+            journal.commit('../consumer', 1)
+
+    def test_replay_from_consumer_offset(self, journal, pubpen):
+        for num in range(5):
+            journal.append('test_event', num)
+        journal.commit('consumer', 3)
+
+        last = pubpen.loop.run_until_complete(journal.replay(pubpen, consumer='consumer'))
+        assert last == 5
+        assert pubpen.publish.call_args_list == [mock.call('test_event', 3),
+                                                 mock.call('test_event', 4)]
+        assert journal.offset('consumer') == 5
+
+        pubpen.publish.reset_mock()
+        assert pubpen.loop.run_until_complete(journal.replay(pubpen, consumer='consumer')) == 5
+        assert pubpen.publish.called is False
+
+    def test_reopen_empty_segment(self, tmp_path):
+        with EventJournal(str(tmp_path), segment_size=256) as journal:
+            for num in range(3):
+                journal.append('test_event', num)
+        # A crash between creating the next segment and preallocating it leaves an empty file
+        open(os.path.join(str(tmp_path), '{:020d}.seg'.format(4)), 'wb').close()
+
+        with EventJournal(str(tmp_path), segment_size=256) as journal:
+            assert journal.last_seq == 3
+            assert journal.append('test_event', 3) == 4
+            assert [r[2][0] for r in journal.read()] == list(range(4))
+
+    def test_reopen_only_empty_segment(self, tmp_path):
+        open(os.path.join(str(tmp_path), '{:020d}.seg'.format(1)), 'wb').close()
+
+        with EventJournal(str(tmp_path), segment_size=256) as journal:
+            assert journal.last_seq == 0
+            assert journal.append('test_event', 0) == 1
+
+    def test_prune(self, journal, tmp_path):
+        for num in range(50):
+            journal.append('test_event', num)
+        before = len(segment_files(str(tmp_path)))
+
+        journal.commit('consumer', 40)
+        assert journal.prune() > 0
+        assert len(segment_files(str(tmp_path))) < before
+        assert [r[0] for r in journal.read(start=41)] == list(range(41, 51))
+
+
+class TestEventJournalAttach:
+    def test_attach_records(self, journal, event_loop):
+        pubpen = PubPen(event_loop)
+        journal.attach(pubpen, ['test_event1'])
+
+        pubpen.publish('test_event1', 1)
+        pubpen.publish('test_event2', 2)
+        event_loop.run_until_complete(run_callbacks(event_loop))
+
+        assert list(journal.read()) == [(1, 'test_event1', (1,), {})]
+
+    def test_replay_into_attached_pubpen(self, journal, event_loop):
+        pubpen = PubPen(event_loop)
+        journal.append('test_event1', 1)
+        journal.attach(pubpen, ['test_event1'])
+
+        event_loop.run_until_complete(journal.replay(pubpen))
+
+        # Replayed events are not recorded again but we're still attached afterwards
+        assert journal.last_seq == 1
+        pubpen.publish('test_event1', 2)
+        event_loop.run_until_complete(run_callbacks(event_loop))
+        assert journal.last_seq == 2
+
+    def test_replay_commits_after_delivery(self, journal, event_loop):
+        pubpen = PubPen(event_loop)
+        for num in range(5):
+            journal.append('test_event', num)
+        seen = []
+
+        def record_offset(num):
+            seen.append((num, journal.offset('consumer')))
+        pubpen.subscribe('test_event', record_offset)
+
+        event_loop.run_until_complete(journal.replay(pubpen, consumer='consumer',
+                                                     commit_every=2))
+        # The offset never moves past an event that has not been delivered yet
+        assert seen == [(0, 0), (1, 0), (2, 2), (3, 2), (4, 4)]
+        assert journal.offset('consumer') == 5
+
+    def test_replay_skips_live_records(self, journal, event_loop):
+        pubpen = PubPen(event_loop)
+        for num in range(4):
+            journal.append('test_event1', num)
+        journal.attach(pubpen, ['test_event1'])
+        seen = []
+
+        def publish_live(num):
+            seen.append(num)
+            if num == 1:
+                pubpen.publish('test_event1', 'live')
+        pubpen.subscribe('test_event1', publish_live)
+
+        event_loop.run_until_complete(journal.replay(pubpen, consumer='consumer',
+                                                     commit_every=2))
+        # The live publication is recorded but not replayed a second time
+        assert seen == [0, 1, 'live', 2, 3]
+        assert journal.last_seq == 5
+        assert journal.offset('consumer') == 4
+
+    def test_replay_records_queued_live_publication(self, journal, event_loop):
+        pubpen = PubPen(event_loop)
+        journal.append('test_event1', 1)
+        journal.append('test_event1', 2)
+        journal.attach(pubpen, ['test_event1'])
+
+        async def publish_and_replay():
+            # Published before the replay starts but not delivered to the journal yet
+            pubpen.publish('test_event1', 3)
+            await journal.replay(pubpen, consumer='consumer')
+        event_loop.run_until_complete(publish_and_replay())
+        event_loop.run_until_complete(run_callbacks(event_loop))
+
+        assert list(journal.read()) == [(1, 'test_event1', (1,), {}),
+                                        (2, 'test_event1', (2,), {}),
+                                        (3, 'test_event1', (3,), {})]
+
+    def test_attach_other_pubpen(self, journal, event_loop):
+        journal.attach(PubPen(event_loop), ['test_event1'])
+        with pytest.raises(JournalError):
+            journal.attach(PubPen(event_loop), ['test_event1'])
+
+
+async def run_callbacks(loop):
+    """Let callbacks scheduled with call_soon run"""
+    fut = loop.create_future()
+    loop.call_soon(fut.set_result, None)
+    await fut
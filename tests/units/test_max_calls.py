@@ -0,0 +1,107 @@
+import pytest
+
+from pubmarine import PubPen
+from pubmarine.schedulers import ImmediateScheduler
+
+from helpers import Recorder, drain
+
+
+class TestMaxCalls:
+    def test_once(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe('test_event', recorder, once=True)
+        pubpen.publish('test_event', 1)
+        # Retired when the publication is dispatched, not when it is delivered
+        assert sub_id not in pubpen._subscriptions
+        assert sub_id not in pubpen._event_handlers['test_event']
+        pubpen.publish('test_event', 2)
+        drain(pubpen)
+        assert recorder.calls == [(1,)]
+        assert not pubpen._call_limits
+
+    def test_max_calls(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('test_event', recorder, max_calls=3)
+        for num in range(5):
+            pubpen.publish('test_event', num)
+        drain(pubpen)
+        assert recorder.calls == [(0,), (1,), (2,)]
+
+    def test_other_subscribers_unaffected(self, pubpen):
+        limited = Recorder()
+        unlimited = Recorder()
+        pubpen.subscribe('test_event', limited, once=True)
+        pubpen.subscribe('test_event', unlimited)
+        pubpen.publish('test_event', 1)
+        pubpen.publish('test_event', 2)
+        drain(pubpen)
+        assert limited.calls == [(1,)]
+        assert unlimited.calls == [(1,), (2,)]
+
+    def test_unsubscribe_cancels_pending(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe('test_event', recorder, max_calls=2)
+        pubpen.publish('test_event', 1)
+        pubpen.unsubscribe(sub_id)
+        drain(pubpen)
+        assert recorder.calls == []
+        assert not pubpen._call_limits
+
+    def test_unsubscribe_after_retired(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe('test_event', recorder, once=True)
+        pubpen.publish('test_event', 1)
+        # Retired, but the queued delivery can still be cancelled
+        pubpen.unsubscribe(sub_id)
+        drain(pubpen)
+        assert recorder.calls == []
+        assert not pubpen._retired
+
+    def test_retired_record_released(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe('test_event', recorder, once=True)
+        pubpen.publish('test_event', 1)
+        drain(pubpen)
+        assert recorder.calls == [(1,)]
+        # Nothing left to cancel once the last delivery has run
+        assert sub_id not in pubpen._retired
+        pubpen.unsubscribe(sub_id)
+
+    def test_retained_counts(self, pubpen):
+        pubpen.retain('test_event', 3)
+        for num in range(3):
+            pubpen.publish('test_event', num)
+        recorder = Recorder()
+        sub_id = pubpen.subscribe('test_event', recorder, retained=True, max_calls=2)
+        assert sub_id not in pubpen._subscriptions
+        pubpen.publish('test_event', 3)
+        drain(pubpen)
+        assert recorder.calls == [(0,), (1,)]
+
+    def test_retained_counts_before_delivery(self):
+        pubpen = PubPen(ImmediateScheduler())
+        pubpen.retain('test_event', 3)
+        for num in range(3):
+            pubpen.publish('test_event', num)
+        calls = []
+
+        def republish(value):
+            calls.append(value)
+            pubpen.publish('test_event', 'again')
+        pubpen.subscribe('test_event', republish, retained=True, max_calls=2)
+        assert calls == [0, 'again']
+        assert not pubpen._subscriptions
+
+    def test_dead_handler_forgotten(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('test_event', recorder, max_calls=2)
+        del recorder
+        pubpen.publish('test_event', 1)
+        assert not pubpen._call_limits
+        assert not pubpen._subscriptions
+
+    @pytest.mark.parametrize('kwargs', ({'max_calls': 0}, {'max_calls': -1},
+                                        {'once': True, 'max_calls': 2}))
+    def test_invalid(self, pubpen, kwargs):
+        with pytest.raises(ValueError):
+            pubpen.subscribe('test_event', Recorder(), **kwargs)
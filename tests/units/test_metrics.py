@@ -0,0 +1,128 @@
+from unittest import mock
+
+import pytest
+
+from pubmarine import PubPen
+from pubmarine.metrics import DispatchMetrics, Histogram
+
+
+def handler1():
+    return 'handler1'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def pubpen(event_loop, clock):
+    pubpen = PubPen(event_loop)
+    pubpen.loop = mock.MagicMock()
+    pubpen.enable_metrics(DispatchMetrics(clock=clock))
+    pubpen._subscriptions[0] = 'test_event1'
+    pubpen._subscriptions[1] = 'test_event1'
+    pubpen._event_handlers['test_event1'][0] = lambda: handler1
+    # A weakref whose target has been deallocated
+    pubpen._event_handlers['test_event1'][1] = lambda: None
+    return pubpen
+
+
+class TestHistogram:
+    def test_observe(self):
+        histogram = Histogram(bounds=(1, 10, 100))
+        for value in (0.5, 1, 5, 50, 500):
+            histogram.observe(value)
+
+        assert histogram.counts == [2, 1, 1, 1]
+        assert histogram.count == 5
+        assert histogram.mean == pytest.approx(556.5 / 5)
+
+    def test_percentile(self):
+        histogram = Histogram(bounds=(1, 10, 100))
+        for dummy in range(98):
+            histogram.observe(0.5)
+        histogram.observe(50)
+        histogram.observe(500)
+
+        assert histogram.percentile(0.5) == 1
+        assert histogram.percentile(0.99) == 100
+        assert histogram.percentile(1.0) == float('inf')
+
+    def test_empty(self):
+        histogram = Histogram()
+        assert histogram.percentile(0.99) == 0.0
+        assert histogram.mean == 0.0
+
+
+class TestPubPenMetrics:
+    def test_disabled_by_default(self, event_loop):
+        pubpen = PubPen(event_loop)
+        assert pubpen.metrics is None
+
+    def test_counts(self, pubpen, clock):
+        pubpen.publish('test_event1')
+        pubpen.publish('test_event2')
+
+        stats = pubpen.metrics.events['test_event1']
+        assert stats.published == 1
+        assert stats.dead_handlers == 1
+        assert stats.delivered == 0
+        assert pubpen.metrics.events['test_event2'].published == 1
+
+        # Running the delivery counts it and still returns the callback's result
+        assert pubpen.loop.call_soon.call_args[0][0]() == 'handler1'
+        assert stats.delivered == 1
+
+    def test_queue_delay(self, pubpen, clock):
+        pubpen.publish('test_event1')
+        clock.now = 0.003
+        pubpen.loop.call_soon.call_args[0][0]()
+
+        queue_delay = pubpen.metrics.events['test_event1'].queue_delay
+        assert queue_delay.count == 1
+        assert queue_delay.total == pytest.approx(0.003)
+        assert queue_delay.percentile(0.5) == 0.005
+
+    def test_duration(self, pubpen, clock):
+        def slow_handler():
+            clock.now += 0.2
+        pubpen._event_handlers['test_event1'][0] = lambda: slow_handler
+
+        pubpen.publish('test_event1')
+        pubpen.loop.call_soon.call_args[0][0]()
+
+        duration = pubpen.metrics.events['test_event1'].duration
+        assert duration.count == 1
+        assert duration.total == pytest.approx(0.2)
+
+    def test_cancelled_delivery_not_counted(self, pubpen):
+        pubpen.publish('test_event1')
+        pubpen.unsubscribe(0)
+        assert pubpen.loop.call_soon.call_args[0][0]() is None
+
+        stats = pubpen.metrics.events['test_event1']
+        assert stats.delivered == 0
+        assert stats.queue_delay.count == 0
+        assert stats.duration.count == 0
+
+    def test_snapshot(self, pubpen):
+        pubpen.publish('test_event1')
+        snapshot = pubpen.metrics.snapshot()
+        assert snapshot['test_event1']['published'] == 1
+        assert snapshot['test_event1']['queue_delay']['count'] == 0
+        assert pubpen.metrics.snapshot(['test_event2']) == {}
+
+    def test_disable(self, pubpen):
+        pubpen.disable_metrics()
+        pubpen.publish('test_event1')
+        assert pubpen.metrics is None
+        assert pubpen.loop.call_soon.call_args[0][0]() == 'handler1'
@@ -0,0 +1,147 @@
+import pytest
+
+from pubmarine.operators import Flow
+
+from helpers import advance, drain
+
+
+def publish_all(pubpen, event, values):
+    for value in values:
+        pubpen.publish(event, value)
+    drain(pubpen)
+
+
+class TestFlow:
+    def test_map_filter(self, pubpen):
+        out = []
+        pipeline = Flow(pubpen, 'raw').map(lambda x: x * 2).filter(lambda x: x > 2) \
+            .subscribe(out.append)
+        publish_all(pubpen, 'raw', [1, 2, 3])
+        assert out == [4, 6]
+        pipeline.close()
+
+    def test_one_hop(self, pubpen):
+        out = []
+        flow = Flow(pubpen, 'raw')
+        for dummy in range(5):
+            flow = flow.map(lambda x: x + 1)
+        pipeline = flow.subscribe(out.append)
+        pubpen.publish('raw', 0)
+        # Everything runs in the one delivery of the event
+        pubpen.loop.call_soon(pubpen.loop.stop)
+        pubpen.loop.run_forever()
+        assert out == [5]
+        pipeline.close()
+
+    def test_payloads(self, pubpen):
+        out = []
+        pipeline = Flow(pubpen, 'raw').subscribe(out.append)
+        pubpen.publish('raw', 1)
+        pubpen.publish('raw', 1, 2)
+        pubpen.publish('raw', 1, key=2)
+        drain(pubpen)
+        assert out == [1, (1, 2), ((1,), {'key': 2})]
+        pipeline.close()
+
+    def test_publish(self, pubpen):
+        out = []
+
+        def cooked(value):
+            out.append(value)
+        pubpen.subscribe('cooked', cooked)
+        pipeline = Flow(pubpen, 'raw').map(str).publish('cooked')
+        publish_all(pubpen, 'raw', [1, 2])
+        assert out == ['1', '2']
+        pipeline.close()
+
+    def test_batch_count(self, pubpen):
+        out = []
+        pipeline = Flow(pubpen, 'raw').batch(count=2).subscribe(out.append)
+        publish_all(pubpen, 'raw', [1, 2, 3])
+        assert out == [[1, 2]]
+        pipeline.flush()
+        assert out == [[1, 2], [3]]
+        pipeline.close()
+
+    def test_batch_interval(self, pubpen):
+        out = []
+        pipeline = Flow(pubpen, 'raw').batch(interval=1).subscribe(out.append)
+        publish_all(pubpen, 'raw', [1, 2])
+        assert out == []
+        advance(pubpen, 1.5)
+        assert out == [[1, 2]]
+        pipeline.close()
+
+    def test_window(self, pubpen):
+        out = []
+        pipeline = Flow(pubpen, 'raw').window(3).subscribe(out.append)
+        publish_all(pubpen, 'raw', [1, 2, 3, 4])
+        assert out == [(1, 2, 3), (2, 3, 4)]
+        pipeline.close()
+
+    def test_distinct(self, pubpen):
+        out = []
+        pipeline = Flow(pubpen, 'raw').distinct(key=abs).subscribe(out.append)
+        publish_all(pubpen, 'raw', [1, -1, 2, 2, 1])
+        assert out == [1, 2, 1]
+        pipeline.close()
+
+    def test_several_events(self, pubpen):
+        out = []
+        pipeline = Flow(pubpen, 'a', 'b').subscribe(out.append)
+        pubpen.publish('a', 1)
+        pubpen.publish('b', 2)
+        drain(pubpen)
+        assert out == [1, 2]
+        pipeline.close()
+
+    def test_merge(self, pubpen):
+        out = []
+        doubled_b = Flow(pubpen, 'b').map(lambda x: x * 2)
+        pipeline = (Flow(pubpen, 'a').map(lambda x: x + 100)
+                    .merge('c', doubled_b)
+                    .map(str)
+                    .subscribe(out.append))
+        pubpen.publish('a', 1)
+        pubpen.publish('b', 2)
+        pubpen.publish('c', 3)
+        drain(pubpen)
+        assert out == ['101', '4', '3']
+        pipeline.close()
+        publish_all(pubpen, 'b', [5])
+        assert len(out) == 3
+
+    def test_branching(self, pubpen):
+        first = []
+        second = []
+        base = Flow(pubpen, 'raw').map(lambda x: x + 1)
+        pipelines = [base.map(str).subscribe(first.append),
+                     base.filter(lambda x: x > 2).subscribe(second.append)]
+        publish_all(pubpen, 'raw', [1, 2])
+        assert first == ['2', '3']
+        assert second == [3]
+        for pipeline in pipelines:
+            pipeline.close()
+
+    def test_close(self, pubpen):
+        out = []
+        pipeline = Flow(pubpen, 'raw').batch(count=10).subscribe(out.append)
+        publish_all(pubpen, 'raw', [1])
+        pipeline.close()
+        assert not pubpen._subscriptions
+        pipeline.flush()
+        assert out == []
+        pipeline.close()
+
+    @pytest.mark.parametrize('make', (lambda flow: flow.batch(),
+                                      lambda flow: flow.batch(count=0),
+                                      lambda flow: flow.window(0),
+                                      lambda flow: flow.merge()))
+    def test_invalid(self, pubpen, make):
+        with pytest.raises(ValueError):
+            make(Flow(pubpen, 'raw'))
+
+    def test_no_events(self, pubpen):
+        with pytest.raises(ValueError):
+            Flow(pubpen)
+
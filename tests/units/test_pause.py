@@ -0,0 +1,154 @@
+import pytest
+
+from pubmarine import PubPen, Subscription
+from pubmarine.schedulers import ImmediateScheduler
+
+from helpers import Recorder, drain
+
+
+class TestSubscriptionHandle:
+    def test_handle_is_the_id(self, pubpen):
+        recorder = Recorder()
+        sub = pubpen.subscribe('test_event', recorder, handle=True)
+        assert isinstance(sub, Subscription)
+        assert pubpen._subscriptions[sub] == 'test_event'
+        assert int(sub) in pubpen._event_handlers['test_event']
+
+    def test_plain_id_by_default(self, pubpen):
+        recorder = Recorder()
+        assert type(pubpen.subscribe('test_event', recorder)) is int
+
+    def test_unsubscribe(self, pubpen):
+        recorder = Recorder()
+        sub = pubpen.subscribe('test_event', recorder, handle=True)
+        sub.unsubscribe()
+        assert not pubpen._subscriptions
+
+
+class TestPause:
+    def test_pause_and_resume(self, pubpen):
+        recorder = Recorder()
+        sub = pubpen.subscribe('test_event', recorder, handle=True)
+        sub.pause()
+        assert sub.paused
+        assert sub not in pubpen._event_handlers['test_event']
+        pubpen.publish('test_event', 1)
+        drain(pubpen)
+        assert recorder.calls == []
+
+        sub.resume()
+        assert not sub.paused
+        pubpen.publish('test_event', 2)
+        drain(pubpen)
+        assert recorder.calls == [(2,)]
+
+    @pytest.mark.parametrize('max_calls', (None, 5))
+    def test_queued_skipped_while_paused(self, pubpen, max_calls):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe('test_event', recorder, max_calls=max_calls)
+        pubpen.publish('test_event', 1)
+        pubpen.pause(sub_id)
+        drain(pubpen)
+        pubpen.resume(sub_id)
+        pubpen.publish('test_event', 2)
+        drain(pubpen)
+        assert recorder.calls == [(2,)]
+
+    def test_keep_last(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe('test_event', recorder)
+        pubpen.pause(sub_id, keep_last=True)
+        for num in range(3):
+            pubpen.publish('test_event', num)
+        pubpen.resume(sub_id)
+        assert not pubpen._held
+        drain(pubpen)
+        assert recorder.calls == [(2,)]
+
+    def test_keep_last_nothing_published(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe('test_event', recorder)
+        pubpen.publish('test_event', 1)
+        drain(pubpen)
+        pubpen.pause(sub_id, keep_last=True)
+        pubpen.resume(sub_id)
+        drain(pubpen)
+        assert recorder.calls == [(1,)]
+
+    def test_keep_last_only_after_pause(self, pubpen):
+        first = Recorder()
+        second = Recorder()
+        first_id = pubpen.subscribe('test_event', first)
+        second_id = pubpen.subscribe('test_event', second)
+        pubpen.pause(first_id, keep_last=True)
+        pubpen.publish('test_event', 1)
+        pubpen.pause(second_id, keep_last=True)
+        pubpen.resume(first_id)
+        pubpen.resume(second_id)
+        drain(pubpen)
+        assert first.calls == [(1,)]
+        assert second.calls == [(1,)]
+        assert not pubpen._held
+
+    def test_keep_last_counts_towards_max_calls(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe('test_event', recorder, once=True)
+        pubpen.pause(sub_id, keep_last=True)
+        pubpen.publish('test_event', 1)
+        pubpen.resume(sub_id)
+        assert sub_id not in pubpen._subscriptions
+        pubpen.publish('test_event', 2)
+        drain(pubpen)
+        assert recorder.calls == [(1,)]
+
+    def test_keep_last_counts_before_delivery(self):
+        pubpen = PubPen(ImmediateScheduler())
+        calls = []
+
+        def unsubscribe(value):
+            calls.append(value)
+            handle.unsubscribe()
+        handle = pubpen.subscribe('test_event', unsubscribe, once=True, handle=True)
+        handle.pause(keep_last=True)
+        pubpen.publish('test_event', 1)
+        handle.resume()
+        assert calls == [1]
+        assert not pubpen._subscriptions
+        assert not pubpen._call_limits
+
+    def test_keep_last_several_events_with_max_calls(self):
+        pubpen = PubPen(ImmediateScheduler())
+        calls = []
+
+        def republish(value):
+            calls.append(value)
+            pubpen.publish('test_event', 'again')
+        sub_id = pubpen.subscribe_many(['test_event', 'other_event'], republish, max_calls=2)
+        pubpen.pause(sub_id, keep_last=True)
+        pubpen.publish('test_event', 1)
+        pubpen.publish('other_event', 2)
+        pubpen.resume(sub_id)
+        assert calls == [1, 'again']
+        assert not pubpen._subscriptions
+
+    def test_unsubscribe_while_paused(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe('test_event', recorder)
+        pubpen.pause(sub_id, keep_last=True)
+        pubpen.unsubscribe(sub_id)
+        assert not pubpen._paused
+        assert not pubpen._held
+        assert not pubpen._subscriptions
+        pubpen.resume(sub_id)
+        pubpen.publish('test_event', 1)
+        drain(pubpen)
+        assert recorder.calls == []
+
+    def test_pause_twice_and_unknown(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe('test_event', recorder)
+        pubpen.pause(sub_id, keep_last=True)
+        pubpen.pause(sub_id, keep_last=True)
+        assert pubpen._held['test_event'][0] == 1
+        pubpen.pause(sub_id + 1)
+        pubpen.resume(sub_id + 1)
@@ -1,4 +1,6 @@
+import asyncio
 from unittest import mock
+
 import pytest
 
 import pubmarine
@@ -146,6 +148,105 @@ class TestPubPenPublish:
         assert pubpenhpr._subscriptions[0] == 'test_event1'
 
 
+def enable_interceptor(pubpen):
+    pubpen.add_publish_interceptor(lambda event, args, kwargs: (args, kwargs))
+
+
+def subscribe_limited(pubpen, event='test_event'):
+    return pubpen.subscribe(event, handler1, max_calls=2)
+
+
+def subscribe_batching(pubpen, event='test_event'):
+    return pubpen.subscribe(event, handler1, batch_size=2)
+
+
+def subscribe_columnar(pubpen, event='test_event'):
+    return pubpen.subscribe(event, handler1, columnar=True)
+
+
+def pause_keep_last(pubpen):
+    pubpen.pause(pubpen.subscribe('test_event', handler1), keep_last=True)
+
+
+class TestPlainPublish:
+    """Publications that only need delivering take a fast path that is cached per event"""
+    @pytest.mark.parametrize('enable', [
+        lambda pubpen: pubpen.enable_metrics(),
+        lambda pubpen: pubpen.enable_breaker(),
+        lambda pubpen: pubpen.enable_tracing(),
+        lambda pubpen: pubpen.enable_shedding(),
+        lambda pubpen: pubpen.enable_chunked_fanout(),
+        lambda pubpen: pubpen.retain('test_event'),
+        lambda pubpen: pubpen.aggregate('test_event', handler1, window=1),
+        enable_interceptor,
+        subscribe_limited,
+        subscribe_batching,
+        subscribe_columnar,
+        pause_keep_last,
+    ])
+    def test_features_leave_fast_path(self, event_loop, enable):
+        pubpen = PubPen(event_loop)
+        pubpen.publish('test_event', 1)
+        assert pubpen._plain == {'test_event': True}
+        enable(pubpen)
+        pubpen.publish('test_event', 1)
+        assert pubpen._plain == {'test_event': False}
+
+    def test_wait_for_leaves_fast_path(self, event_loop):
+        pubpen = PubPen(event_loop)
+        pubpen.publish('test_event', 1)
+        waiter = event_loop.create_task(pubpen.wait_for('test_event'))
+        event_loop.run_until_complete(asyncio.sleep(0))
+        pubpen.publish('test_event', 2)
+        assert event_loop.run_until_complete(waiter) == 2
+
+    @pytest.mark.parametrize('subscribe', [
+        subscribe_limited,
+        subscribe_batching,
+        subscribe_columnar,
+    ])
+    def test_subscription_to_other_event(self, event_loop, subscribe):
+        pubpen = PubPen(event_loop)
+        sub_id = subscribe(pubpen, 'other_event')
+        pubpen.publish('test_event', 1)
+        pubpen.publish('other_event', 1)
+        assert pubpen._plain == {'test_event': True, 'other_event': False}
+        pubpen.unsubscribe(sub_id)
+        assert pubpen._plain == {'test_event': True}
+        pubpen.publish('other_event', 1)
+        assert pubpen._plain == {'test_event': True, 'other_event': True}
+
+    def test_interceptor_for_other_event(self, event_loop):
+        pubpen = PubPen(event_loop)
+        pubpen.add_publish_interceptor(lambda event, args, kwargs: (args, kwargs),
+                                       events=['other_event'])
+        pubpen.publish('test_event', 1)
+        pubpen.publish('other_event', 1)
+        assert pubpen._plain == {'test_event': True, 'other_event': False}
+
+    def test_back_on_fast_path(self, event_loop):
+        pubpen = PubPen(event_loop)
+        pubpen.enable_metrics()
+        pubpen.publish('test_event')
+        assert pubpen._plain == {'test_event': False}
+        pubpen.disable_metrics()
+        pubpen.publish('test_event')
+        assert pubpen._plain == {'test_event': True}
+
+    def test_retired_subscription(self, event_loop):
+        pubpen = PubPen(event_loop)
+        pubpen.subscribe('test_event', handler1, once=True)
+        pubpen.publish('test_event')
+        pubpen.publish('test_event')
+        assert pubpen._plain == {'test_event': True}
+
+    def test_event_list_checked(self, pubpen_predefined):
+        pubpen_predefined.publish('test_event1')
+        with pytest.raises(pubmarine.EventNotFoundError):
+            pubpen_predefined.publish('test_event_bad')
+        assert 'test_event_bad' not in pubpen_predefined._plain
+
+
 class TestPubPenEmit:
     def test_emit_warns(self, pubpen):
         with pytest.warns(DeprecationWarning) as e:
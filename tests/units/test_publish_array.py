@@ -0,0 +1,233 @@
+import array
+
+import pytest
+
+from pubmarine import EventNotFoundError, PubPen
+from pubmarine.testing import VirtualTimeLoop
+
+from helpers import Recorder, advance, drain
+
+
+class TestPublishArray:
+    def test_ordinary_subscribers_get_rows(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('tick', recorder)
+        pubpen.publish_array('tick', array.array('d', [1, 2]), array.array('l', [10, 20]))
+        drain(pubpen)
+        assert recorder.calls == [(1.0, 10), (2.0, 20)]
+
+    def test_columnar(self, pubpen):
+        recorder = Recorder()
+        prices = array.array('d', [1.5, 2.5])
+        volumes = array.array('l', [10, 20])
+        pubpen.subscribe('tick', recorder, columnar=True)
+        pubpen.publish_array('tick', prices, volumes)
+        # Columnar subscriptions are not called for single publications
+        pubpen.publish('tick', 3.5, 30)
+        drain(pubpen)
+        assert recorder.calls == [(prices, volumes)]
+
+    def test_columnar_with_ordinary(self, pubpen):
+        columns = Recorder()
+        rows = Recorder()
+        pubpen.subscribe('tick', columns, columnar=True)
+        pubpen.subscribe('tick', rows)
+        values = array.array('d', [1, 2, 3])
+        pubpen.publish_array('tick', values)
+        drain(pubpen)
+        assert columns.calls == [(values,)]
+        assert rows.calls == [(1.0,), (2.0,), (3.0,)]
+
+    def test_one_loop_callback(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('tick', recorder, columnar=True)
+        calls = []
+        call_soon = pubpen.loop.call_soon
+
+        def counting_call_soon(*args, **kwargs):
+            calls.append(args)
+            return call_soon(*args, **kwargs)
+        pubpen.loop.call_soon = counting_call_soon
+        pubpen.publish_array('tick', array.array('d', range(1000)))
+        assert len(calls) == 1
+
+    def test_unsubscribe_cancels(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe('tick', recorder, columnar=True)
+        pubpen.publish_array('tick', [1, 2])
+        pubpen.unsubscribe(sub_id)
+        drain(pubpen)
+        assert recorder.calls == []
+        assert pubpen._columnar == {}
+
+    def test_batching(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('tick', recorder, batch_size=4, max_delay=1)
+        pubpen.publish_array('tick', [1, 2, 3, 4, 5, 6, 7, 8, 9])
+        drain(pubpen)
+        assert recorder.calls == [([1, 2, 3, 4],), ([5, 6, 7, 8],)]
+        advance(pubpen, 1.05)
+        assert recorder.calls[-1] == ([9],)
+
+    def test_batching_several_columns(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('tick', recorder, batch_size=2)
+        pubpen.publish_array('tick', [1, 2], ['a', 'b'])
+        drain(pubpen)
+        assert recorder.calls == [([(1, 'a'), (2, 'b')],)]
+
+    def test_columnar_where(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('tick', recorder, columnar=True,
+                         where=lambda price, volume: volume > 15)
+        pubpen.publish_array('tick', array.array('d', [1, 2, 3]), array.array('l', [10, 20, 30]))
+        # Nothing is delivered when no row is selected
+        pubpen.publish_array('tick', array.array('d', [4]), array.array('l', [5]))
+        drain(pubpen)
+        assert recorder.calls == [(array.array('d', [2, 3]), array.array('l', [20, 30]))]
+
+    def test_columnar_where_all_rows(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('tick', recorder, columnar=True, where=lambda value: value > 0)
+        values = [1, 2, 3]
+        pubpen.publish_array('tick', values)
+        drain(pubpen)
+        assert recorder.calls[0][0] is values
+
+    def test_batching_where(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('tick', recorder, batch_size=2, where=lambda value: value % 2)
+        pubpen.publish_array('tick', [1, 2, 3, 4, 5])
+        pubpen.publish('tick', 6)
+        pubpen.publish('tick', 7)
+        drain(pubpen)
+        assert recorder.values == [[1, 3], [5, 7]]
+
+    def test_batching_where_several_columns(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('tick', recorder, batch_size=2,
+                         where=lambda value, name: name != 'b')
+        pubpen.publish_array('tick', [1, 2, 3], ['a', 'b', 'c'])
+        drain(pubpen)
+        assert recorder.values == [[(1, 'a'), (3, 'c')]]
+
+    def test_aggregate(self, pubpen):
+        recorder = Recorder()
+        pubpen.aggregate('tick', recorder, window=1, bounds=(1, 2, 4))
+        pubpen.publish_array('tick', array.array('d', [0.5, 1.5, 3, 5]))
+        pubpen.publish('tick', 1)
+        advance(pubpen, 1)
+        summary = recorder.calls[0][0]
+        assert (summary['count'], summary['sum'], summary['min'], summary['max']) == \
+            (5, 11, 0.5, 5)
+        assert summary['p50'] == 2
+
+    def test_aggregate_value(self, pubpen):
+        recorder = Recorder()
+        pubpen.aggregate('tick', recorder, window=1, value=lambda price, volume: price * volume)
+        pubpen.publish_array('tick', [1, 2], [10, 20])
+        advance(pubpen, 1)
+        assert recorder.calls[0][0]['sum'] == 50
+
+    def test_aggregate_row_by_row(self, pubpen):
+        recorder = Recorder()
+        rows = Recorder()
+        pubpen.subscribe('tick', rows)
+        pubpen.aggregate('tick', recorder, window=1)
+        pubpen.publish_array('tick', [1, 2, 3])
+        advance(pubpen, 1)
+        assert recorder.calls[0][0]['count'] == 3
+        assert len(rows.calls) == 3
+
+    def test_retained(self, pubpen):
+        pubpen.retain('tick', history=2)
+        pubpen.publish_array('tick', [1, 2, 3])
+        recorder = Recorder()
+        pubpen.subscribe('tick', recorder, retained=True)
+        drain(pubpen)
+        assert recorder.calls == [(2,), (3,)]
+
+    def test_empty(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('tick', recorder, columnar=True)
+        pubpen.publish_array('tick', [])
+        drain(pubpen)
+        assert recorder.calls == []
+
+    def test_validation(self, pubpen):
+        recorder = Recorder()
+        with pytest.raises(ValueError):
+            pubpen.publish_array('tick')
+        with pytest.raises(ValueError):
+            pubpen.publish_array('tick', [1, 2], [1])
+        with pytest.raises(ValueError):
+            pubpen.subscribe('tick', recorder, columnar=True, batch_size=2)
+        with pytest.raises(ValueError):
+            pubpen.subscribe('tick', recorder, columnar=True, retained=True)
+        with pytest.raises(ValueError):
+            pubpen.subscribe('tick', recorder, where=bool)
+
+    def test_unregistered_event(self):
+        loop = VirtualTimeLoop()
+        pubpen = PubPen(loop, event_list=['tick'])
+        with pytest.raises(EventNotFoundError):
+            pubpen.publish_array('tock', [1])
+        loop.close()
+
+
+class TestNumPy:
+    def test_aggregate(self, pubpen):
+        numpy = pytest.importorskip('numpy')
+        recorder = Recorder()
+        pubpen.aggregate('tick', recorder, window=1, bounds=(1, 2, 4))
+        pubpen.publish_array('tick', numpy.array([0.5, 1.5, 3, 5, 1]))
+        advance(pubpen, 1)
+        summary = recorder.calls[0][0]
+        assert (summary['count'], summary['sum'], summary['min'], summary['max']) == \
+            (5, 11, 0.5, 5)
+        assert summary['p50'] == 2
+
+    def test_columnar(self, pubpen):
+        numpy = pytest.importorskip('numpy')
+        recorder = Recorder()
+        pubpen.subscribe('tick', recorder, columnar=True)
+        values = numpy.arange(10.0)
+        pubpen.publish_array('tick', values)
+        drain(pubpen)
+        assert recorder.calls[0][0] is values
+
+    def test_columnar_where(self, pubpen):
+        numpy = pytest.importorskip('numpy')
+        recorder = Recorder()
+        calls = []
+
+        def where(price, volume):
+            calls.append(price)
+            return volume > 15
+        pubpen.subscribe('tick', recorder, columnar=True, where=where)
+        pubpen.publish_array('tick', numpy.array([1.0, 2.0, 3.0]), numpy.array([10, 20, 30]))
+        drain(pubpen)
+        # The filter is called once with the columns
+        assert len(calls) == 1
+        prices, volumes = recorder.calls[0]
+        assert prices.tolist() == [2.0, 3.0]
+        assert volumes.tolist() == [20, 30]
+
+    def test_columnar_where_scalar(self, pubpen):
+        numpy = pytest.importorskip('numpy')
+        recorder = Recorder()
+        pubpen.subscribe('tick', recorder, columnar=True,
+                         where=lambda values: values.sum() > 10)
+        pubpen.publish_array('tick', numpy.array([1, 2]))
+        small = numpy.array([5, 6])
+        pubpen.publish_array('tick', small)
+        drain(pubpen)
+        assert recorder.calls == [(small,)]
+
+    def test_batching_where(self, pubpen):
+        numpy = pytest.importorskip('numpy')
+        recorder = Recorder()
+        pubpen.subscribe('tick', recorder, batch_size=2, where=lambda values: values > 2)
+        pubpen.publish_array('tick', numpy.arange(6))
+        drain(pubpen)
+        assert [[int(value) for value in batch] for batch in recorder.values] == [[3, 4]]
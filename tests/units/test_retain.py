@@ -0,0 +1,115 @@
+from unittest import mock
+
+import pytest
+
+import pubmarine
+from pubmarine import PubPen
+
+
+@pytest.fixture
+def pubpen(event_loop):
+    pubpen = PubPen(event_loop)
+    pubpen.loop = mock.MagicMock()
+    return pubpen
+
+
+@pytest.fixture
+def pubpen_predefined(event_loop):
+    pubpen = PubPen(event_loop, event_list=['test_event1'])
+    pubpen.loop = mock.MagicMock()
+    return pubpen
+
+
+class Function:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+
+
+def retained_args(pubpen, event):
+    return [item[0] for item in pubpen._retention[event].items]
+
+
+def run_scheduled(pubpen):
+    for call in pubpen.loop.call_soon.call_args_list:
+        call[0][0]()
+
+
+class TestPubPenRetain:
+    def test_not_retained_by_default(self, pubpen):
+        pubpen.publish('test_event', 1)
+        assert len(pubpen._retention) == 0
+
+    def test_last_value(self, pubpen):
+        pubpen.retain('test_event')
+        pubpen.publish('test_event', 1)
+        pubpen.publish('test_event', 2)
+        assert retained_args(pubpen, 'test_event') == [(2,)]
+
+    def test_history(self, pubpen):
+        pubpen.retain('test_event', history=3)
+        for num in range(5):
+            pubpen.publish('test_event', num)
+        assert retained_args(pubpen, 'test_event') == [(2,), (3,), (4,)]
+
+    def test_max_bytes(self, pubpen):
+        pubpen.retain('test_event', history=100, max_bytes=1000)
+        for num in range(100):
+            pubpen.publish('test_event', 'x' * 100)
+
+        retention = pubpen._retention['test_event']
+        assert 0 < len(retention.items) < 100
+        assert retention.size <= 1000
+
+    def test_max_bytes_keeps_newest(self, pubpen):
+        pubpen.retain('test_event', history=10, max_bytes=10)
+        pubpen.publish('test_event', 'x' * 100)
+        pubpen.publish('test_event', 'y' * 100)
+        assert retained_args(pubpen, 'test_event') == [('y' * 100,)]
+
+    def test_stop_retaining(self, pubpen):
+        pubpen.retain('test_event')
+        pubpen.publish('test_event', 1)
+        pubpen.retain('test_event', history=0)
+        assert 'test_event' not in pubpen._retention
+
+    def test_change_history_keeps_values(self, pubpen):
+        pubpen.retain('test_event', history=3)
+        for num in range(3):
+            pubpen.publish('test_event', num)
+        pubpen.retain('test_event', history=2)
+        assert retained_args(pubpen, 'test_event') == [(1,), (2,)]
+
+    def test_retain_event_list_fail(self, pubpen_predefined):
+        with pytest.raises(pubmarine.EventNotFoundError):
+            pubpen_predefined.retain('test_event_bad')
+
+
+class TestPubPenSubscribeRetained:
+    def test_subscribe_retained(self, pubpen):
+        pubpen.retain('test_event', history=2)
+        pubpen.publish('test_event', 1)
+        pubpen.publish('test_event', 2, key='value')
+
+        function = Function()
+        pubpen.subscribe('test_event', function, retained=True)
+        assert pubpen.loop.call_soon.call_count == 2
+        run_scheduled(pubpen)
+        assert function.calls == [((1,), {}), ((2,), {'key': 'value'})]
+
+    def test_subscribe_without_retained(self, pubpen):
+        pubpen.retain('test_event')
+        pubpen.publish('test_event', 1)
+
+        function = Function()
+        pubpen.subscribe('test_event', function)
+        assert pubpen.loop.call_soon.called is False
+
+    def test_subscribe_retained_nothing_published(self, pubpen):
+        pubpen.retain('test_event')
+
+        function = Function()
+        pubpen.subscribe('test_event', function, retained=True)
+        assert pubpen.loop.call_soon.called is False
@@ -0,0 +1,266 @@
+import threading
+from unittest import mock
+
+import pytest
+
+from pubmarine import PubPen
+from pubmarine.breaker import EXECUTOR, SlowSubscriberBreaker
+from pubmarine.schedulers import (ImmediateScheduler, QueuedScheduler, Scheduler,
+                                  ThreadPoolScheduler)
+
+
+class Function:
+    def __init__(self, pubpen=None, republish=None):
+        self.pubpen = pubpen
+        self.republish = republish
+        self.calls = []
+        self.threads = set()
+
+    def __call__(self, *args):
+        self.calls.append(args)
+        self.threads.add(threading.get_ident())
+        if self.republish:
+            self.pubpen.publish(self.republish, *args)
+
+
+def failing(*args):
+    raise ValueError('boom')
+
+
+class TestScheduler:
+    def test_call_soon_is_abstract(self):
+        with pytest.raises(TypeError):
+            Scheduler()
+
+    def test_exception_handler_logs(self):
+        scheduler = ImmediateScheduler()
+        with mock.patch('pubmarine.schedulers.log') as log:
+            scheduler.call_soon(failing)
+        assert log.error.call_count == 1
+        assert isinstance(log.error.call_args[1]['exc_info'], ValueError)
+
+
+class TestImmediateScheduler:
+    def test_delivered_before_publish_returns(self):
+        pubpen = PubPen(ImmediateScheduler())
+        first = Function()
+        pubpen.subscribe('test_event', first)
+        pubpen.publish('test_event', 1)
+        assert first.calls == [(1,)]
+
+    def test_cascade(self):
+        pubpen = PubPen(ImmediateScheduler())
+        second = Function()
+        first = Function(pubpen, republish='second_event')
+        pubpen.subscribe('first_event', first)
+        pubpen.subscribe('second_event', second)
+        pubpen.publish('first_event', 1)
+        assert second.calls == [(1,)]
+
+    def test_exception_does_not_stop_delivery(self):
+        scheduler = ImmediateScheduler()
+        scheduler.call_exception_handler = mock.MagicMock()
+        pubpen = PubPen(scheduler)
+        function = Function()
+        pubpen.subscribe('test_event', failing)
+        pubpen.subscribe('test_event', function)
+        pubpen.publish('test_event')
+        assert function.calls == [()]
+        assert scheduler.call_exception_handler.call_count == 1
+
+    def test_subscribe_from_callback(self):
+        pubpen = PubPen(ImmediateScheduler())
+        late = Function()
+        last = Function()
+
+        def subscriber(*args):
+            pubpen.subscribe('test_event', late)
+        pubpen.subscribe('test_event', subscriber)
+        pubpen.subscribe('test_event', last)
+        pubpen.publish('test_event', 1)
+        assert last.calls == [(1,)]
+        # Subscribed after the publication was dispatched
+        assert late.calls == []
+        pubpen.publish('test_event', 2)
+        assert late.calls == [(2,)]
+
+    def test_unsubscribe_from_callback(self):
+        pubpen = PubPen(ImmediateScheduler())
+        second = Function()
+
+        def first(*args):
+            pubpen.unsubscribe(second_id)
+        pubpen.subscribe('test_event', first)
+        second_id = pubpen.subscribe('test_event', second)
+        pubpen.publish('test_event', 1)
+        assert second.calls == []
+
+    def test_once(self):
+        pubpen = PubPen(ImmediateScheduler())
+        once = Function(pubpen, republish='test_event')
+        last = Function()
+        pubpen.subscribe('test_event', once, once=True)
+        pubpen.subscribe('test_event', last)
+        pubpen.publish('test_event', 1)
+        # The republication from inside the callback does not reach the used up subscription
+        assert once.calls == [(1,)]
+        assert last.calls == [(1,), (1,)]
+
+    def test_close_pipeline_from_callback(self):
+        from pubmarine.operators import Flow
+        pubpen = PubPen(ImmediateScheduler())
+        values = []
+        last = Function()
+        pipeline = Flow(pubpen, 'test_event').subscribe(values.append)
+
+        def closer(*args):
+            pipeline.close()
+        pubpen.subscribe('test_event', closer)
+        pubpen.subscribe('test_event', last)
+        pubpen.publish('test_event', 1)
+        pubpen.publish('test_event', 2)
+        assert values == [1]
+        assert last.calls == [(1,), (2,)]
+
+    def test_publish_array_unsubscribe_from_callback(self):
+        pubpen = PubPen(ImmediateScheduler())
+        second = Function()
+
+        def first(*args):
+            pubpen.unsubscribe(second_id)
+        pubpen.subscribe('test_event', first, columnar=True)
+        second_id = pubpen.subscribe('test_event', second, columnar=True)
+        pubpen.publish_array('test_event', [1, 2])
+        assert second.calls == []
+
+
+class TestNeedsEventLoop:
+    @pytest.mark.parametrize('use', [
+        lambda pubpen: pubpen.publish_later(1, 'test_event'),
+        lambda pubpen: pubpen.publish_at(1, 'test_event'),
+        lambda pubpen: pubpen.publish_every(1, 'test_event'),
+        lambda pubpen: pubpen.aggregate('test_event', print, window=1),
+        lambda pubpen: pubpen.subscribe('test_event', print, max_delay=1),
+        lambda pubpen: pubpen.enable_shedding(),
+        lambda pubpen: pubpen.enable_breaker(SlowSubscriberBreaker(action=EXECUTOR)),
+        lambda pubpen: pubpen.enable_chunked_fanout(time_budget=1),
+    ])
+    def test_rejected(self, use):
+        pubpen = PubPen(QueuedScheduler())
+        with pytest.raises(TypeError):
+            use(pubpen)
+
+    def test_breaker_report_works(self):
+        pubpen = PubPen(ImmediateScheduler())
+        pubpen.enable_breaker()
+        function = Function()
+        pubpen.subscribe('test_event', function)
+        pubpen.publish('test_event', 1)
+        assert function.calls == [(1,)]
+
+
+class TestQueuedScheduler:
+    def test_run_to_completion(self):
+        scheduler = QueuedScheduler()
+        pubpen = PubPen(scheduler)
+        second = Function()
+        first = Function(pubpen, republish='second_event')
+        pubpen.subscribe('first_event', first)
+        pubpen.subscribe('second_event', second)
+
+        pubpen.publish('first_event', 1)
+        pubpen.publish('first_event', 2)
+        assert first.calls == []
+        assert len(scheduler) == 2
+
+        assert scheduler.run() == 4
+        assert first.calls == [(1,), (2,)]
+        assert second.calls == [(1,), (2,)]
+        assert len(scheduler) == 0
+
+    def test_run_is_not_reentrant(self):
+        scheduler = QueuedScheduler()
+        results = []
+        scheduler.call_soon(lambda: results.append(scheduler.run()))
+        scheduler.call_soon(results.append, 'second')
+        scheduler.run()
+        assert results == [0, 'second']
+
+
+class TestThreadPoolScheduler:
+    def test_delivered_in_threads(self):
+        scheduler = ThreadPoolScheduler(max_workers=2)
+        pubpen = PubPen(scheduler)
+        function = Function()
+        pubpen.subscribe('test_event', function)
+        for num in range(10):
+            pubpen.publish('test_event', num)
+        assert scheduler.join(timeout=5)
+        scheduler.shutdown()
+
+        assert sorted(function.calls) == [(num,) for num in range(10)]
+        assert threading.get_ident() not in function.threads
+
+    def test_join_waits_for_cascades(self):
+        scheduler = ThreadPoolScheduler(max_workers=2)
+        pubpen = PubPen(scheduler)
+        second = Function()
+        first = Function(pubpen, republish='second_event')
+        pubpen.subscribe('first_event', first)
+        pubpen.subscribe('second_event', second)
+        pubpen.publish('first_event', 1)
+        assert scheduler.join(timeout=5)
+        scheduler.shutdown()
+        assert second.calls == [(1,)]
+
+    def test_join_timeout(self):
+        scheduler = ThreadPoolScheduler(max_workers=1)
+        release = threading.Event()
+        scheduler.call_soon(release.wait)
+        assert not scheduler.join(timeout=0.01)
+        release.set()
+        assert scheduler.join(timeout=5)
+        scheduler.shutdown()
+
+
+class TestChunkedFanout:
+    def subscribe(self, pubpen, count):
+        functions = [Function() for dummy in range(count)]
+        for function in functions:
+            pubpen.subscribe('test_event', function)
+        return functions
+
+    def test_immediate(self):
+        pubpen = PubPen(ImmediateScheduler())
+        pubpen.enable_chunked_fanout(chunk_size=2)
+        functions = self.subscribe(pubpen, 3)
+        for num in range(5):
+            pubpen.publish('test_event', num)
+        assert not pubpen._fanout_queue
+        for function in functions:
+            assert function.calls == [(num,) for num in range(5)]
+
+    def test_immediate_publish_from_slice(self):
+        pubpen = PubPen(ImmediateScheduler())
+        pubpen.enable_chunked_fanout(chunk_size=2)
+        functions = self.subscribe(pubpen, 3)
+        second = Function()
+        republisher = Function(pubpen, republish='second_event')
+        pubpen.subscribe('test_event', republisher)
+        pubpen.subscribe('second_event', second)
+        pubpen.publish('test_event', 1)
+        assert not pubpen._fanout_queue
+        assert second.calls == [(1,)]
+        assert [function.calls for function in functions] == [[(1,)]] * 3
+
+    def test_queued(self):
+        scheduler = QueuedScheduler()
+        pubpen = PubPen(scheduler)
+        pubpen.enable_chunked_fanout(chunk_size=2)
+        functions = self.subscribe(pubpen, 3)
+        for num in range(5):
+            pubpen.publish('test_event', num)
+        scheduler.run()
+        assert not pubpen._fanout_queue
+        for function in functions:
+            assert function.calls == [(num,) for num in range(5)]
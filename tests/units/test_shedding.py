@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from pubmarine import PubPen
+from pubmarine.shedding import (CRITICAL, DROPPING, NORMAL, SAMPLING, SHEDDABLE,
+                                LoadShedder)
+
+from helpers import Recorder, drain
+
+
+@pytest.fixture
+def pubpen(pubpen):
+    shedder = pubpen.enable_shedding(LoadShedder(sample_above=0.05, drop_above=0.25,
+                                                 sample_every=3))
+    shedder.mark('ticks', SHEDDABLE)
+    return pubpen
+
+
+class TestLoadShedder:
+    def test_bad_priority(self):
+        with pytest.raises(ValueError):
+            LoadShedder(default='optional')
+        with pytest.raises(ValueError):
+            LoadShedder().mark('ticks', 'optional')
+
+    def test_levels(self):
+        shedder = LoadShedder(sample_above=0.05, drop_above=0.25)
+        assert shedder.level == NORMAL
+        shedder.record_lag(0.1)
+        assert shedder.level == SAMPLING
+        shedder.record_lag(0.3)
+        assert shedder.level == DROPPING
+        shedder.record_lag(-0.001)
+        assert shedder.level == NORMAL
+        assert shedder.lag == 0.0
+        assert shedder.max_lag == 0.3
+        assert shedder.transitions == 3
+
+    def test_no_shedding_while_normal(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('ticks', recorder)
+        for num in range(5):
+            pubpen.publish('ticks', num)
+        drain(pubpen)
+        assert len(recorder.calls) == 5
+
+    def test_sampling(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('ticks', recorder)
+        pubpen.shedder.record_lag(0.1)
+        for num in range(9):
+            pubpen.publish('ticks', num)
+        drain(pubpen)
+        assert recorder.calls == [(2,), (5,), (8,)]
+        assert pubpen.shedder.snapshot()['events'] == {'ticks': {'shed': 6, 'sampled': 3}}
+
+    def test_dropping_keeps_critical(self, pubpen):
+        ticks = Recorder()
+        errors = Recorder()
+        pubpen.subscribe('ticks', ticks)
+        pubpen.subscribe('error', errors)
+        pubpen.shedder.record_lag(1.0)
+        pubpen.publish('ticks', 1)
+        pubpen.publish('error', 'disk full')
+        drain(pubpen)
+        assert ticks.calls == []
+        assert errors.calls == [('disk full',)]
+
+    def test_default_sheddable(self, event_loop):
+        pubpen = PubPen(event_loop)
+        shedder = pubpen.enable_shedding(LoadShedder(default=SHEDDABLE))
+        shedder.mark('error', CRITICAL)
+        recorder = Recorder()
+        pubpen.subscribe('ticks', recorder)
+        pubpen.subscribe('error', recorder)
+        shedder.record_lag(1.0)
+        pubpen.publish('ticks', 1)
+        pubpen.publish('error', 2)
+        drain(pubpen)
+        assert recorder.calls == [(2,)]
+
+    def test_shed_publication_is_retained(self, pubpen):
+        pubpen.retain('ticks')
+        pubpen.shedder.record_lag(1.0)
+        pubpen.publish('ticks', 1)
+
+        recorder = Recorder()
+        pubpen.subscribe('ticks', recorder, retained=True)
+        drain(pubpen)
+        assert recorder.calls == [(1,)]
+
+    def test_shed_counted_in_metrics(self, pubpen):
+        metrics = pubpen.enable_metrics()
+        pubpen.shedder.record_lag(1.0)
+        pubpen.publish('ticks', 1)
+        assert metrics.snapshot()['ticks']['shed'] == 1
+
+    def test_measures_loop_lag(self, event_loop):
+        pubpen = PubPen(event_loop)
+        shedder = pubpen.enable_shedding(LoadShedder(interval=0.01))
+
+        async def block():
+            await asyncio.sleep(0.005)
+            # Keep the loop from running the lag timer on time
+            end = event_loop.time() + 0.1
+            while event_loop.time() < end:
+                pass
+            await asyncio.sleep(0.02)
+
+        event_loop.run_until_complete(block())
+        assert shedder.max_lag >= 0.05
+        assert shedder.lag_histogram.count >= 2
+        pubpen.disable_shedding()
+        assert shedder.level == NORMAL
+        assert shedder._timer is None
+
+    def test_snapshot_and_reset(self):
+        shedder = LoadShedder()
+        shedder.mark('ticks', SHEDDABLE)
+        shedder.record_lag(1.0)
+        shedder.admit('ticks')
+        snapshot = shedder.snapshot()
+        assert snapshot['level'] == DROPPING
+        assert snapshot['lag_histogram']['count'] == 1
+        assert snapshot['events'] == {'ticks': {'shed': 1, 'sampled': 0}}
+
+        shedder.reset()
+        assert shedder.snapshot()['events'] == {}
+        assert shedder.level == DROPPING
@@ -0,0 +1,132 @@
+import pytest
+
+import pubmarine
+from pubmarine import PubPen
+
+from helpers import Recorder, drain
+
+
+class Base:
+    pass
+
+
+class Child(Base):
+    pass
+
+
+class TestSubscribeMany:
+    def test_shared_record(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe_many(['error', 'info', 'conn_lost'], recorder)
+        assert pubpen._subscriptions[sub_id] == ('error', 'info', 'conn_lost')
+        handlers = [pubpen._event_handlers[event][sub_id]
+                    for event in ('error', 'info', 'conn_lost')]
+        assert handlers[0] is handlers[1] is handlers[2]
+
+    def test_delivers_each_event(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe_many(['error', 'info'], recorder)
+        pubpen.publish('error', 1)
+        pubpen.publish('info', 2)
+        pubpen.publish('other', 3)
+        drain(pubpen)
+        assert recorder.calls == [(1,), (2,)]
+
+    def test_duplicates_ignored(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe_many(['error', 'error'], recorder)
+        assert pubpen._subscriptions[sub_id] == 'error'
+
+    def test_no_events(self, pubpen):
+        with pytest.raises(ValueError):
+            pubpen.subscribe_many([], Recorder())
+
+    def test_unregistered_event(self, event_loop):
+        pubpen = PubPen(event_loop, event_list=['error'])
+        with pytest.raises(pubmarine.EventNotFoundError):
+            pubpen.subscribe_many(['error', 'info'], Recorder())
+        assert not pubpen._subscriptions
+        assert not pubpen._event_handlers
+
+    def test_unsubscribe(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe_many(['error', 'info'], recorder)
+        pubpen.publish('error', 1)
+        pubpen.unsubscribe(sub_id)
+        pubpen.publish('info', 2)
+        drain(pubpen)
+        assert recorder.calls == []
+        assert not pubpen._subscriptions
+        assert not pubpen._event_handlers['error']
+        assert not pubpen._event_handlers['info']
+
+    def test_max_calls_shared(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe_many(['error', 'info'], recorder, max_calls=2)
+        pubpen.publish('error', 1)
+        pubpen.publish('info', 2)
+        pubpen.publish('error', 3)
+        drain(pubpen)
+        assert recorder.calls == [(1,), (2,)]
+        assert not pubpen._event_handlers['error']
+        assert not pubpen._event_handlers['info']
+
+    def test_retained(self, pubpen):
+        pubpen.retain('error')
+        pubpen.retain('info')
+        pubpen.publish('info', 1)
+        pubpen.publish('error', 2)
+        recorder = Recorder()
+        pubpen.subscribe_many(['error', 'info'], recorder, retained=True)
+        drain(pubpen)
+        assert recorder.calls == [(2,), (1,)]
+
+    def test_pause_keep_last(self, pubpen):
+        recorder = Recorder()
+        sub = pubpen.subscribe_many(['error', 'info'], recorder, handle=True)
+        sub.pause(keep_last=True)
+        assert not pubpen._event_handlers['error']
+        assert not pubpen._event_handlers['info']
+        pubpen.publish('info', 1)
+        pubpen.publish('error', 2)
+        pubpen.publish('info', 3)
+        sub.resume()
+        assert not pubpen._held
+        drain(pubpen)
+        assert recorder.calls == [(2,), (3,)]
+        pubpen.publish('error', 4)
+        drain(pubpen)
+        assert recorder.calls == [(2,), (3,), (4,)]
+
+    def test_dead_handler(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe_many(['error', 'info'], recorder)
+        del recorder
+        pubpen.publish('error')
+        assert not pubpen._subscriptions
+        assert not pubpen._event_handlers['info']
+
+    def test_overlapping_classes_dead_handler(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe_many([Base, Child], recorder)
+        del recorder
+        pubpen.publish(Child())
+        assert not pubpen._subscriptions
+        assert not pubpen._event_handlers[Base]
+        assert not pubpen._event_handlers[Child]
+
+    def test_overlapping_classes_delivered_once(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe_many([Base, Child], recorder)
+        child = Child()
+        pubpen.publish(child)
+        drain(pubpen)
+        assert recorder.calls == [(child,)]
+
+    def test_overlapping_classes_once(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe_many([Base, Child], recorder, once=True)
+        pubpen.publish(Child())
+        pubpen.publish(Child())
+        drain(pubpen)
+        assert len(recorder.calls) == 1
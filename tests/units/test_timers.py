@@ -0,0 +1,166 @@
+import asyncio
+
+import pytest
+
+from pubmarine import EventNotFoundError, PubPen
+from pubmarine.testing import VirtualTimeLoop
+from pubmarine.timers import TimerWheel
+
+from helpers import Recorder, advance
+
+
+@pytest.fixture
+def loop():
+    loop = VirtualTimeLoop()
+    yield loop
+    loop.close()
+
+
+def run_for(loop, seconds):
+    loop.run_until_complete(asyncio.sleep(seconds))
+
+
+class TestTimerWheel:
+    def test_fires_in_order_and_never_early(self, loop):
+        wheel = TimerWheel(loop)
+        recorder = Recorder(loop.time)
+        delays = [0.5, 0.001, 3, 0.02, 100, 2.56, 2.57, 700]
+        for delay in delays:
+            wheel.call_later(delay, recorder, delay)
+
+        run_for(loop, 1000)
+        assert recorder.values == sorted(delays)
+        for fired_at, delay in zip(recorder.times, recorder.values):
+            assert delay <= fired_at <= delay + wheel.tick + 1e-9
+        assert len(wheel) == 0
+
+    def test_cancel(self, loop):
+        wheel = TimerWheel(loop)
+        recorder = Recorder(loop.time)
+        timers = [wheel.call_later(delay, recorder, delay) for delay in (1, 2, 300)]
+        timers[0].cancel()
+        timers[2].cancel()
+        assert timers[0].cancelled()
+        assert len(wheel) == 1
+
+        run_for(loop, 400)
+        assert recorder.values == [2]
+        assert timers[1].cancelled()
+        # Cancelling a timer that already fired is harmless
+        timers[1].cancel()
+
+    def test_cancel_from_callback(self, loop):
+        wheel = TimerWheel(loop)
+        recorder = Recorder(loop.time)
+        second = None
+
+        def cancel_second():
+            second.cancel()
+        wheel.call_later(1, cancel_second)
+        second = wheel.call_later(1, recorder)
+        run_for(loop, 2)
+        assert recorder.calls == []
+
+    def test_schedule_from_callback(self, loop):
+        wheel = TimerWheel(loop)
+        recorder = Recorder(loop.time)
+        wheel.call_later(1, lambda: wheel.call_later(0, recorder, 'nested'))
+        run_for(loop, 2)
+        assert recorder.calls == [('nested',)]
+        assert recorder.times == [pytest.approx(1.01)]
+
+    def test_beyond_range(self, loop):
+        wheel = TimerWheel(loop, tick=1, slot_bits=2, levels=2)
+        recorder = Recorder(loop.time)
+        # The wheels only reach 16 ticks ahead
+        wheel.call_later(40, recorder, 40)
+        wheel.call_later(5, recorder, 5)
+        run_for(loop, 50)
+        assert recorder.values == [5, 40]
+        assert recorder.times == [5, 40]
+
+    def test_periodic_without_drift(self, loop):
+        wheel = TimerWheel(loop)
+        recorder = Recorder(loop.time)
+        timer = wheel.call_every(1, recorder)
+        run_for(loop, 5.5)
+        timer.cancel()
+        run_for(loop, 5)
+        assert recorder.times == [pytest.approx(t) for t in (1, 2, 3, 4, 5)]
+
+    def test_periodic_skips_missed(self, loop):
+        wheel = TimerWheel(loop)
+        recorder = Recorder(loop.time)
+        wheel.call_every(1, recorder)
+        # Block the loop past several periods
+        loop.call_later(0.5, loop.advance, 3)
+        run_for(loop, 6.5)
+        assert recorder.times == [pytest.approx(t) for t in (3.5, 4, 5, 6)]
+
+    def test_bad_period(self, loop):
+        with pytest.raises(ValueError):
+            TimerWheel(loop).call_every(0, print)
+
+    def test_exception_in_callback(self, loop):
+        errors = []
+        loop.set_exception_handler(lambda loop, context: errors.append(context))
+        wheel = TimerWheel(loop)
+        recorder = Recorder(loop.time)
+
+        def failing():
+            raise ValueError('boom')
+        wheel.call_later(1, failing)
+        wheel.call_later(1, recorder)
+        run_for(loop, 2)
+        assert len(recorder.calls) == 1
+        assert isinstance(errors[0]['exception'], ValueError)
+
+    def test_close(self, loop):
+        wheel = TimerWheel(loop)
+        recorder = Recorder(loop.time)
+        timer = wheel.call_later(1, recorder)
+        wheel.close()
+        run_for(loop, 2)
+        assert recorder.calls == []
+        assert timer.cancelled()
+
+
+class TestPublishLater:
+    def test_publish_later(self, pubpen):
+        recorder = Recorder(pubpen.loop.time)
+        pubpen.subscribe('test_event', recorder)
+        pubpen.publish_later(2, 'test_event', 1)
+        advance(pubpen, 3)
+        assert recorder.values == [1]
+        assert recorder.times == [pytest.approx(2)]
+
+    def test_publish_at_kwargs(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('test_event', recorder)
+        pubpen.publish_at(pubpen.loop.time() + 1, 'test_event', num=1)
+        advance(pubpen, 2)
+        assert recorder.kwargs == [{'num': 1}]
+
+    def test_publish_every(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('heartbeat', recorder)
+        timer = pubpen.publish_every(1, 'heartbeat')
+        advance(pubpen, 3.5)
+        timer.cancel()
+        advance(pubpen, 3)
+        assert len(recorder.calls) == 3
+
+    def test_cancel(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('session_expired', recorder)
+        timer = pubpen.publish_later(60, 'session_expired', 'abc')
+        timer.cancel()
+        advance(pubpen, 120)
+        assert recorder.calls == []
+
+    def test_event_list_fail(self, loop):
+        pubpen = PubPen(loop, event_list=['test_event'])
+        with pytest.raises(EventNotFoundError):
+            pubpen.publish_later(1, 'other_event')
+        with pytest.raises(EventNotFoundError):
+            pubpen.publish_every(1, 'other_event')
@@ -0,0 +1,138 @@
+import io
+import json
+
+import pytest
+
+from pubmarine import PubPen
+from pubmarine.tracing import JsonLinesSink, RingBufferSink, Tracer, current_span, spans
+
+from helpers import Recorder, drain
+
+
+@pytest.fixture
+def pubpen(pubpen):
+    pubpen.enable_tracing()
+    return pubpen
+
+
+class SpanRecorder(Recorder):
+    """Also remembers the span each call ran in and can publish another event from it"""
+    def __init__(self, pubpen=None, republish=None):
+        super().__init__()
+        self.pubpen = pubpen
+        self.republish = republish
+        self.spans = []
+
+    def __call__(self, *args, **kwargs):
+        self.spans.append(current_span())
+        super().__call__(*args, **kwargs)
+        if self.republish:
+            self.pubpen.publish(self.republish)
+
+
+class TestTracer:
+    def test_disabled_by_default(self, event_loop):
+        assert PubPen(event_loop).tracer is None
+
+    def test_publish_and_delivery_records(self, pubpen):
+        recorder = SpanRecorder()
+        sub_id = pubpen.subscribe('test_event', recorder)
+        pubpen.publish('test_event', 1)
+        drain(pubpen)
+
+        records = list(pubpen.tracer.sink.records)
+        assert [r['type'] for r in records] == ['publish', 'start', 'end']
+        publish, start, end = records
+        assert publish['parent_id'] is None
+        assert publish['trace_id'] == publish['span_id']
+        assert start['parent_id'] == publish['span_id']
+        assert start['span_id'] == end['span_id']
+        assert start['sub_id'] == sub_id
+        assert end['error'] is None
+        assert end['duration'] >= 0
+
+        # The callback ran inside the delivery's span
+        assert recorder.spans == [(publish['trace_id'], start['span_id'])]
+
+    def test_propagates_to_nested_publish(self, pubpen):
+        first = SpanRecorder(pubpen, republish='second_event')
+        second = SpanRecorder()
+        pubpen.subscribe('first_event', first)
+        pubpen.subscribe('second_event', second)
+
+        pubpen.publish('first_event')
+        drain(pubpen)
+
+        records = list(pubpen.tracer.sink.records)
+        trace_id = records[0]['trace_id']
+        assert len(spans(records, trace_id)) == 6
+
+        first_delivery = [r for r in records if r['type'] == 'start'
+                          and r['event'] == 'first_event'][0]
+        second_publish = [r for r in records if r['type'] == 'publish'
+                          and r['event'] == 'second_event'][0]
+        assert second_publish['parent_id'] == first_delivery['span_id']
+        assert second.spans[0][0] == trace_id
+
+    def test_separate_traces(self, pubpen):
+        pubpen.publish('test_event')
+        pubpen.publish('test_event')
+        records = list(pubpen.tracer.sink.records)
+        assert records[0]['trace_id'] != records[1]['trace_id']
+
+    def test_error_recorded(self, pubpen):
+        def failing():
+            raise ValueError('boom')
+        pubpen.subscribe('test_event', failing)
+        pubpen.publish('test_event')
+
+        # The loop logs the exception from the callback
+        pubpen.loop.set_exception_handler(lambda loop, context: None)
+        drain(pubpen)
+        end = list(pubpen.tracer.sink.records)[-1]
+        assert end['type'] == 'end'
+        assert 'boom' in end['error']
+
+    def test_cancelled_delivery_not_traced(self, pubpen):
+        recorder = SpanRecorder()
+        sub_id = pubpen.subscribe('test_event', recorder)
+        pubpen.publish('test_event', 1)
+        pubpen.unsubscribe(sub_id)
+        drain(pubpen)
+        assert [r['type'] for r in pubpen.tracer.sink.records] == ['publish']
+        assert recorder.spans == []
+
+    def test_no_span_outside_delivery(self, pubpen):
+        assert current_span() is None
+
+    def test_disable(self, pubpen):
+        tracer = pubpen.tracer
+        pubpen.disable_tracing()
+        pubpen.publish('test_event')
+        assert len(tracer.sink.records) == 0
+
+
+class TestSinks:
+    def test_ring_buffer_size(self):
+        sink = RingBufferSink(size=2)
+        for num in range(3):
+            sink.emit({'num': num})
+        assert list(sink.records) == [{'num': 1}, {'num': 2}]
+
+    def test_json_lines(self, event_loop):
+        output = io.StringIO()
+        pubpen = PubPen(event_loop)
+        pubpen.enable_tracing(Tracer(JsonLinesSink(output)))
+        pubpen.publish('test_event')
+
+        lines = output.getvalue().splitlines()
+        assert len(lines) == 1
+        assert json.loads(lines[0])['event'] == 'test_event'
+
+    def test_json_lines_path(self, tmp_path):
+        path = str(tmp_path / 'trace.jsonl')
+        sink = JsonLinesSink(path)
+        sink.emit({'type': 'publish'})
+        sink.close()
+        with open(path) as f:
+            assert json.loads(f.read()) == {'type': 'publish'}
@@ -0,0 +1,219 @@
+import asyncio
+
+import pytest
+
+import pubmarine
+from pubmarine import PubPen
+
+from helpers import Recorder, drain
+
+
+class Base:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Child(Base):
+    __slots__ = ()
+
+
+class Other:
+    pass
+
+
+class TestTypedEvents:
+    def test_exact_class(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe(Base, recorder)
+        event = Base(1)
+        pubpen.publish(event, 'extra', key='word')
+        drain(pubpen)
+        assert recorder.calls == [(event, 'extra')]
+        assert recorder.kwargs == [{'key': 'word'}]
+
+    def test_base_class_receives_subclass(self, pubpen):
+        base = Recorder()
+        child = Recorder()
+        pubpen.subscribe(Base, base)
+        pubpen.subscribe(Child, child)
+        child_event = Child(1)
+        base_event = Base(2)
+        pubpen.publish(child_event)
+        pubpen.publish(base_event)
+        drain(pubpen)
+        assert base.calls == [(child_event,), (base_event,)]
+        assert child.calls == [(child_event,)]
+
+    def test_unrelated_class(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe(Base, recorder)
+        pubpen.publish(Other())
+        drain(pubpen)
+        assert recorder.calls == []
+
+    def test_strings_and_classes_separate(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe('Base', recorder)
+        pubpen.publish(Base(1))
+        drain(pubpen)
+        assert recorder.calls == []
+
+    def test_dispatch_cached(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe(Base, recorder)
+        pubpen.publish(Child(1))
+        resolved = pubpen._type_dispatch[Child]
+        assert resolved[0] == '{}.Child'.format(__name__)
+        assert resolved[1] == (pubpen._event_handlers[Base],)
+        # Another subscriber to a class that already has one keeps the cache
+        other = Recorder()
+        pubpen.subscribe(Base, other)
+        assert pubpen._type_dispatch[Child] is resolved
+        pubpen.publish(Child(2))
+        drain(pubpen)
+        assert len(recorder.calls) == 2
+        assert len(other.calls) == 1
+
+    def test_cache_invalidated_by_new_class(self, pubpen):
+        pubpen.publish(Child(1))
+        assert pubpen._type_dispatch[Child][1] == ()
+        recorder = Recorder()
+        pubpen.subscribe(Base, recorder)
+        assert not pubpen._type_dispatch
+        pubpen.publish(Child(2))
+        drain(pubpen)
+        assert len(recorder.calls) == 1
+
+    def test_unsubscribe(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe(Base, recorder)
+        pubpen.publish(Child(1))
+        pubpen.unsubscribe(sub_id)
+        pubpen.publish(Child(2))
+        drain(pubpen)
+        assert recorder.calls == []
+        assert not pubpen._subscriptions
+
+    def test_once(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe(Base, recorder, once=True)
+        pubpen.publish(Child(1))
+        pubpen.publish(Child(2))
+        drain(pubpen)
+        assert len(recorder.calls) == 1
+        assert not pubpen._subscriptions
+
+    def test_dead_handler(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe(Base, recorder)
+        del recorder
+        pubpen.publish(Child(1))
+        assert not pubpen._event_handlers[Base]
+        assert not pubpen._subscriptions
+
+    def test_metrics_name(self, pubpen):
+        metrics = pubpen.enable_metrics()
+        recorder = Recorder()
+        pubpen.subscribe(Base, recorder)
+        pubpen.publish(Child(1))
+        drain(pubpen)
+        assert metrics.for_event('{}.Child'.format(__name__)).published == 1
+
+    def test_event_list(self, event_loop):
+        pubpen = PubPen(event_loop, event_list=['test_event', Base])
+        pubpen.publish(Child(1))
+        with pytest.raises(pubmarine.EventNotFoundError):
+            pubpen.publish(Other())
+        with pytest.raises(pubmarine.EventNotFoundError):
+            pubpen.subscribe(Other, Recorder())
+
+    def test_retain_by_class(self, pubpen):
+        pubpen.retain(Base)
+        event = Base(1)
+        pubpen.publish(event)
+        recorder = Recorder()
+        pubpen.subscribe(Base, recorder, retained=True)
+        drain(pubpen)
+        assert recorder.calls == [(event,)]
+
+    def test_retain_includes_subclasses(self, pubpen):
+        pubpen.retain(Base, history=2)
+        first = Child(1)
+        second = Base(2)
+        pubpen.publish(first)
+        pubpen.publish(second)
+        recorder = Recorder()
+        pubpen.subscribe(Base, recorder, retained=True)
+        drain(pubpen)
+        assert recorder.calls == [(first,), (second,)]
+
+    def test_keep_last_includes_subclasses(self, pubpen):
+        recorder = Recorder()
+        handle = pubpen.subscribe(Base, recorder, handle=True)
+        handle.pause(keep_last=True)
+        event = Child(1)
+        pubpen.publish(event)
+        handle.resume()
+        drain(pubpen)
+        assert recorder.calls == [(event,)]
+
+    def test_keep_last_class_and_base_once(self, pubpen):
+        recorder = Recorder()
+        sub_id = pubpen.subscribe_many([Base, Child], recorder)
+        pubpen.pause(sub_id, keep_last=True)
+        event = Child(1)
+        pubpen.publish(event)
+        pubpen.resume(sub_id)
+        drain(pubpen)
+        assert recorder.calls == [(event,)]
+
+    def test_wait_for_includes_subclasses(self, pubpen):
+        waiter = pubpen.loop.create_task(pubpen.wait_for(Base, timeout=1))
+        pubpen.loop.run_until_complete(asyncio.sleep(0))
+        event = Child(1)
+        pubpen.publish(event)
+        assert pubpen.loop.run_until_complete(waiter) is event
+
+
+class TestTypedFastPath:
+    def test_cached_per_class(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe(Base, recorder)
+        event = Child(1)
+        pubpen.publish(event)
+        pubpen.publish('test_event')
+        assert pubpen._plain == {Child: True, 'test_event': True}
+        drain(pubpen)
+        assert recorder.calls == [(event,)]
+
+    def test_subscribe_many_delivered_once(self, pubpen):
+        recorder = Recorder()
+        pubpen.subscribe_many([Base, Child], recorder)
+        pubpen.publish(Child(1))
+        assert pubpen._plain == {Child: True}
+        drain(pubpen)
+        assert len(recorder.calls) == 1
+
+    def test_base_class_feature_forgets_subclasses(self, pubpen):
+        pubpen.publish(Child(1))
+        pubpen.publish(Other())
+        pubpen.publish('test_event')
+        pubpen.retain(Base)
+        assert pubpen._plain == {Other: True, 'test_event': True}
+        pubpen.publish(Child(2))
+        assert pubpen._plain[Child] is False
+
+    def test_limited_subscription_to_base(self, pubpen):
+        pubpen.publish(Child(1))
+        pubpen.subscribe(Base, Recorder(), max_calls=2)
+        assert Child not in pubpen._plain
+
+    def test_event_list(self, event_loop):
+        pubpen = PubPen(event_loop, event_list=[Base])
+        with pytest.raises(pubmarine.EventNotFoundError):
+            pubpen.publish(Other())
+        with pytest.raises(pubmarine.EventNotFoundError):
+            pubpen.publish(Other())
+        assert Other not in pubpen._plain